@@ -0,0 +1 @@
+"""Helpers shared by the HyperTrace vizualiser (tkinter-viz.py)."""
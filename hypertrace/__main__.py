@@ -0,0 +1,25 @@
+"""python3 -m hypertrace: write reports of a HyperTrace without the vizualiser, see hypertrace.query."""
+import argparse
+
+from hypertrace import query
+from hypertrace.records import ACCESS_TYPES
+
+parser = argparse.ArgumentParser(
+    prog="python3 -m hypertrace",
+    description="Write memory and ROM heatmaps (PNG and CSV), the hottest PCs and per-frame stats of a HyperTrace.")
+parser.add_argument("trace", help="memory_access.log, or a store made by python3 -m hypertrace.trace_store")
+parser.add_argument("output", help="directory to write the reports to")
+parser.add_argument("--frames", type=query.parse_range, default=(None, None), help="FIRST:LAST frames, inclusive")
+parser.add_argument("--addresses", type=query.parse_range, default=(None, None),
+                    help="START:END memory addresses (END excluded), e.g. 0xFF0000:0x1000000")
+parser.add_argument("--pcs", type=query.parse_range, default=(None, None), help="START:END PCs (END excluded)")
+parser.add_argument("--type", choices=("R", "W"), help="only reads or only writes")
+parser.add_argument("--boxes", type=int, default=10000, help="boxes in each heatmap (default 10000)")
+parser.add_argument("--grid-size", type=int, default=100, help="boxes per heatmap row (default 100)")
+parser.add_argument("--top", type=int, default=100, help="PCs listed in hot_pcs.csv (default 100)")
+args = parser.parse_args()
+
+access_filter = query.AccessFilter(
+    *args.frames, *args.addresses, *args.pcs, ACCESS_TYPES[args.type.encode()] if args.type else None)
+for path in query.write_reports(args.trace, args.output, access_filter, args.boxes, args.grid_size, args.top):
+    print(f"Wrote {path}")
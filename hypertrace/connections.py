@@ -0,0 +1,99 @@
+"""Lines between the ROM grid and the memory grid, from code to the memory it accessed.
+
+Connections (ingest.CONNECTION_DTYPE) are first aggregated into weighted edges
+between box pairs, the weight being how many distinct (pc, address) pairs an
+edge stands for. When there are more edges than lines to draw, edges are
+bundled into edges between regions of region_size x region_size boxes, and
+only the heaviest are drawn, so the number of canvas items stays bounded
+however many connections an update brings.
+"""
+import math
+
+import numpy as np
+
+from hypertrace.heatmap import rgb_to_hex
+from hypertrace.ingest import box_indices
+from hypertrace.records import ACCESS_WRITE
+
+EDGE_DTYPE = np.dtype([("source", "<i8"), ("target", "<i8"), ("type", "u1"), ("weight", "<i8")])
+
+READ_COLOR = (0, 0, 255)  # Blue
+WRITE_COLOR = (0, 128, 0)  # Green
+
+
+def aggregate_edges(sources, targets, types, num_targets, weights=None):
+    """Sum equal (source, target, type) triples, each weighing 1 unless weights are given.
+
+    Targets must be below num_targets. Returns an EDGE_DTYPE array."""
+    keys = (np.asarray(sources, dtype=np.int64) * num_targets + targets) * 2 + types
+    keys, inverse = np.unique(keys, return_inverse=True)
+    edges = np.empty(len(keys), dtype=EDGE_DTYPE)
+    edges["source"], rest = np.divmod(keys, num_targets * 2)
+    edges["target"], edges["type"] = np.divmod(rest, 2)
+    edges["weight"] = np.bincount(inverse.ravel(), weights=weights, minlength=len(keys))
+    return edges
+
+
+class ConnectionLayer:
+    """Pooled, level-of-detail lines from ROM boxes to memory boxes.
+
+    At most max_lines lines are drawn. Line width and how strongly the colour
+    stands out from the background grow with the edge weight."""
+
+    def __init__(self, canvas, rom_geometry, mem_geometry, background=(190, 190, 190), max_lines=500, region_size=10,
+                 max_width=6):
+        self.canvas = canvas
+        self.rom_geometry = rom_geometry  # geometry.GridGeometry of each grid
+        self.mem_geometry = mem_geometry
+        self.background = np.array(background)
+        self.max_lines = max_lines
+        self.region_size = region_size
+        self.max_width = max_width
+        self._lines = []  # Pool of canvas line items, the first _shown of them visible
+        self._shown = 0
+
+    def draw(self, connections, rom_window, mem_window):
+        """Replace the lines with the given connections, binned by the given ingest.BoxWindows."""
+        sources = box_indices(connections["pc"], *rom_window)
+        targets = box_indices(connections["address"], *mem_window)
+        inside = (sources >= 0) & (targets >= 0)
+        edges = aggregate_edges(
+            sources[inside], targets[inside], connections["type"][inside], self.mem_geometry.num_boxes)
+
+        region_size = 1
+        if len(edges) > self.max_lines:
+            # Too many to draw them all, bundle them into edges between regions of the grids
+            region_size = self.region_size
+            edges = aggregate_edges(
+                self.rom_geometry.region_indices(edges["source"], region_size),
+                self.mem_geometry.region_indices(edges["target"], region_size),
+                edges["type"], len(self.mem_geometry.region_centers(region_size)), edges["weight"])
+        if len(edges) > self.max_lines:
+            edges = edges[np.argpartition(edges["weight"], -self.max_lines)[-self.max_lines:]]
+        self._render(
+            edges, self.rom_geometry.region_centers(region_size), self.mem_geometry.region_centers(region_size))
+
+    def clear(self):
+        for line in self._lines[:self._shown]:
+            self.canvas.itemconfig(line, state="hidden")
+        self._shown = 0
+
+    def _render(self, edges, source_centers, target_centers):
+        # Draw the heaviest edges last, on top
+        edges = edges[np.argsort(edges["weight"], kind="stable")]
+        coords = np.concatenate((source_centers[edges["source"]], target_centers[edges["target"]]), axis=1)
+        strength = np.log2(edges["weight"]) / max(math.log2(max(int(edges["weight"].max(initial=1)), 2)), 1)
+        widths = np.minimum(1 + np.log2(edges["weight"]), self.max_width)
+        base = np.where((edges["type"] == ACCESS_WRITE)[:, None], WRITE_COLOR, READ_COLOR)
+        mix = (0.4 + 0.6 * strength)[:, None]
+        colors = (base * mix + self.background * (1 - mix)).astype(int)
+
+        for i, (line_coords, width, color) in enumerate(zip(coords.tolist(), widths.tolist(), colors.tolist())):
+            if i == len(self._lines):
+                self._lines.append(self.canvas.create_line(*line_coords, tags="connection"))
+            else:
+                self.canvas.coords(self._lines[i], *line_coords)
+            self.canvas.itemconfig(self._lines[i], fill=rgb_to_hex(color), width=width, state="normal")
+        for line in self._lines[len(edges):self._shown]:
+            self.canvas.itemconfig(line, state="hidden")
+        self._shown = len(edges)
@@ -0,0 +1,161 @@
+"""Persistent index of where every frame lives in the memory access log.
+
+The index is a sidecar file next to the log (memory_access.log.idx). It holds
+the byte offset of every frame plus the cached FrameStore aggregates and any
+other arrays the ingest thread keeps (ROM box counts, address histogram). Reopening
+a trace therefore restores the whole Frame-By-Frame history without re-reading
+the log. The file is a set of raw arrays that are memory-mapped on load, so
+opening it costs the same whatever the size of the trace, and showing a frame
+only pages in that frame's slice of the FrameStore.
+"""
+import json
+import os
+import struct
+import time
+
+import numpy as np
+
+from hypertrace.frame_store import GrowableArray
+
+INDEX_MAGIC = b"HTIX"
+INDEX_VERSION = 3
+# magic, version, metadata offset, metadata length
+_PREAMBLE = struct.Struct("<4sHxxQQ")
+_ALIGNMENT = 64
+
+
+def save_arrays(path, metadata, arrays):
+    """Write named arrays plus a JSON metadata dict to path, replacing it atomically."""
+    layout = {}
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as index_file:
+        index_file.write(_PREAMBLE.pack(INDEX_MAGIC, INDEX_VERSION, 0, 0))
+        for name, array in arrays.items():
+            array = np.ascontiguousarray(array)
+            index_file.write(b"\0" * (-index_file.tell() % _ALIGNMENT))
+            layout[name] = {
+                "offset": index_file.tell(),
+                "dtype": np.lib.format.dtype_to_descr(array.dtype),
+                "shape": list(array.shape),
+            }
+            array.tofile(index_file)
+        metadata_bytes = json.dumps({"metadata": metadata, "arrays": layout}).encode()
+        metadata_offset = index_file.tell()
+        index_file.write(metadata_bytes)
+        index_file.seek(0)
+        index_file.write(_PREAMBLE.pack(INDEX_MAGIC, INDEX_VERSION, metadata_offset, len(metadata_bytes)))
+    os.replace(temp_path, path)
+
+
+def load_arrays(path):
+    """Read a file written by save_arrays. Returns (metadata, arrays), arrays are read-only memmaps."""
+    with open(path, "rb") as index_file:
+        magic, version, metadata_offset, metadata_length = _PREAMBLE.unpack(index_file.read(_PREAMBLE.size))
+        if magic != INDEX_MAGIC or version != INDEX_VERSION:
+            raise ValueError(f"{path} is not a version {INDEX_VERSION} HyperTrace index")
+        index_file.seek(metadata_offset)
+        header = json.loads(index_file.read(metadata_length))
+
+    arrays = {}
+    for name, entry in header["arrays"].items():
+        dtype = np.lib.format.descr_to_dtype(_descr_from_json(entry["dtype"]))
+        shape = tuple(entry["shape"])
+        if 0 in shape:
+            arrays[name] = np.empty(shape, dtype=dtype)
+        else:
+            arrays[name] = np.memmap(path, dtype=dtype, mode="r", offset=entry["offset"], shape=shape)
+    return header["metadata"], arrays
+
+
+def _descr_from_json(descr):
+    # JSON turns the (name, type) tuples of structured dtypes into lists
+    if isinstance(descr, list):
+        return [tuple(field) for field in descr]
+    return descr
+
+
+class FrameIndex:
+    """Byte offset of every frame in the log, saved together with the FrameStore."""
+
+    def __init__(self, log_path, frame_store, save_interval=30):
+        self.path = log_path + ".idx"
+        self.frame_store = frame_store
+        self.save_interval = save_interval  # Seconds between saves while frames keep coming in
+        self.last_save = time.monotonic()
+        self._frames = GrowableArray(np.int64)
+        self._generations = GrowableArray(np.int64)
+        self._offsets = GrowableArray(np.int64)
+
+    def __len__(self):
+        return len(self._frames)
+
+    def add(self, frame, generation, offset):
+        """Record where frame starts: offset bytes into the log file of the given generation."""
+        self._frames.append([frame])
+        self._generations.append([generation])
+        self._offsets.append([offset])
+
+    def save(self, reader, extra_arrays):
+        """Write the index, the FrameStore aggregates and a dict of extra arrays to the sidecar file."""
+        if reader.log_format is None:
+            return
+        # The file being replaced may still be memory-mapped from load(), which Windows does not allow
+        self.frame_store.detach()
+        for buffer in (self._frames, self._generations, self._offsets):
+            buffer.detach()
+
+        # The frame still being read isn't in the store yet, the ingest thread saves how far it got among the
+        # extra arrays. Reopening carries on from the reader's position whichever file that frame started in
+        arrays = {
+            "index_frames": self._frames.view(),
+            "index_generations": self._generations.view(),
+            "index_offsets": self._offsets.view(),
+        }
+        arrays.update(extra_arrays)
+        arrays.update(self.frame_store.to_arrays())
+        metadata = {
+            "log_format": reader.log_format,
+            "position": reader.position,
+            "generation": reader.generation,
+            "signature": reader.signature.hex(),
+            "num_boxes": self.frame_store.num_boxes,
+            "keyframe_interval": self.frame_store.keyframe_interval,
+            "num_rom_boxes": self.frame_store.num_rom_boxes,
+            "extra_arrays": list(extra_arrays),
+        }
+        try:
+            save_arrays(self.path, metadata, arrays)
+        except OSError as e:
+            print(f"Unable to save frame index {self.path}: {e}")
+        self.last_save = time.monotonic()
+
+    def load(self, reader):
+        """Restore the FrameStore and reader position from the sidecar file.
+
+        Returns the dict of extra arrays passed to save (read-only memmaps), or None when
+        there is no usable index."""
+        if not os.path.exists(self.path):
+            return None
+        try:
+            metadata, arrays = load_arrays(self.path)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Ignoring unreadable frame index {self.path}: {e}")
+            return None
+        if (metadata["num_boxes"] != self.frame_store.num_boxes
+                or metadata["keyframe_interval"] != self.frame_store.keyframe_interval
+                or metadata.get("num_rom_boxes", 0) != self.frame_store.num_rom_boxes):
+            print(f"Ignoring frame index {self.path}, it was built with different grid settings")
+            return None
+
+        # Carry on from where the index stopped, in the log or in .backup if it has rolled over since
+        if not reader.resume(metadata["log_format"], metadata["generation"], metadata["position"],
+                             bytes.fromhex(metadata["signature"])):
+            print(f"Ignoring frame index {self.path}, it belongs to a different log")
+            return None
+
+        self._frames = GrowableArray.from_array(arrays["index_frames"])
+        self._generations = GrowableArray.from_array(arrays["index_generations"])
+        self._offsets = GrowableArray.from_array(arrays["index_offsets"])
+        self.frame_store.restore(arrays)
+        print(f"Loaded frame index with {len(self.frame_store)} frames from {self.path}")
+        return {name: arrays[name] for name in metadata["extra_arrays"]}
@@ -0,0 +1,90 @@
+"""Background loading of frames for Frame-By-Frame mode, ahead of the slider.
+
+Dragging the frame slider asks for frames faster than they can be shown. The
+loader reads them (screenshot, instruction logs, memory counts) on a thread
+pool, also preloading the frames after the requested one in the direction the
+slider is moving. The UI only ever renders the most recently requested frame:
+requests that come in while a frame is still loading replace it instead of
+being dropped, and loads nobody wants any more are cancelled before they start.
+"""
+import collections
+from concurrent.futures import ThreadPoolExecutor
+
+# Everything show_frame needs for a frame. Fields are None when that part of the frame isn't available (yet),
+# errors holds messages about what failed to load. sharp_image is False for a quickly resized screenshot,
+# instruction_diff the instructions.InstructionDiff against the previous frame
+LoadedFrame = collections.namedtuple(
+    "LoadedFrame", "frame image sharp_image instructions previous_instructions instruction_diff cumulative per_frame "
+                   "rom_cumulative rom_per_frame connections errors")
+
+
+class FrameLoader:
+    """Runs load(frame) on a pool of max_workers threads for the wanted frame and the prefetch frames after it.
+
+    Results of the last keep frames requested or prefetched are kept, so
+    going back over them is instant. Only use from one thread (the Tk thread)."""
+
+    def __init__(self, load, max_workers=4, prefetch=8, keep=64):
+        self.load = load
+        self.prefetch = prefetch
+        self.keep = keep
+        self.wanted = None  # The frame the UI wants to show
+        self._delivered = None  # The wanted frame once ready() has returned it
+        self._direction = 1
+        self._executor = ThreadPoolExecutor(max_workers, thread_name_prefix="frame-loader")
+        self._futures = collections.OrderedDict()  # frame -> Future, least recently wanted first
+
+    def request(self, frame, first=None, last=None):
+        """Make frame the one to show next and start loading it and the frames after it.
+
+        first and last, when given, are the lowest and highest frame worth prefetching."""
+        if self.wanted is not None and frame != self.wanted:
+            self._direction = 1 if frame > self.wanted else -1
+        self.wanted = frame
+        self._delivered = None
+
+        window = [frame + self._direction * i for i in range(self.prefetch + 1)]
+        window = [f for f in window if (first is None or f >= first) and (last is None or f <= last)]
+        if frame not in window:
+            window.insert(0, frame)
+
+        # Queued loads outside the window are no use any more, unless they already started
+        for f, future in list(self._futures.items()):
+            if f not in window and future.cancel():
+                del self._futures[f]
+        # The pool runs loads in the order they are submitted, the wanted frame first
+        for f in window:
+            future = self._futures.get(f)
+            if future is None or future.cancelled():
+                self._futures[f] = self._executor.submit(self.load, f)
+            self._futures.move_to_end(f)
+        while len(self._futures) > self.keep:
+            self._futures.popitem(last=False)
+
+    def ready(self):
+        """The wanted frame's load result, once, as soon as it is loaded. None until then."""
+        future = self._futures.get(self.wanted)
+        if self.wanted is None or self.wanted == self._delivered or future is None or not future.done():
+            return None
+        self._delivered = self.wanted
+        return future.result()
+
+    def pending(self):
+        """Whether the wanted frame still has to be returned by ready()."""
+        return self.wanted is not None and self.wanted != self._delivered
+
+    def submit(self, function, *args):
+        """Run any other function on the pool, returns its Future."""
+        return self._executor.submit(function, *args)
+
+    def discard(self, frame):
+        """Forget a loaded frame, so it is loaded again next time (e.g. it was incomplete)."""
+        self._futures.pop(frame, None)
+
+    def clear(self):
+        for future in self._futures.values():
+            future.cancel()
+        self._futures.clear()
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
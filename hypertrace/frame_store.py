@@ -0,0 +1,212 @@
+"""Compact per-frame history of memory box counts for Frame-By-Frame mode."""
+import threading
+
+import numpy as np
+
+from hypertrace.ingest import CONNECTION_DTYPE
+
+
+class GrowableArray:
+    """Append-only NumPy buffer that doubles its capacity as it fills."""
+
+    def __init__(self, dtype, capacity=1024):
+        self._data = np.empty(capacity, dtype=dtype)
+        self._size = 0
+
+    @classmethod
+    def from_array(cls, array):
+        """Wrap an existing (possibly read-only, memory-mapped) array, copied on the first append."""
+        growable = cls(array.dtype, capacity=0)
+        growable._data = array
+        growable._size = len(array)
+        return growable
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def nbytes(self):
+        return self._data.nbytes
+
+    def append(self, values):
+        values = np.asarray(values, dtype=self._data.dtype).ravel()
+        if not len(values):
+            return
+        needed = self._size + len(values)
+        if needed > len(self._data):
+            capacity = max(needed, len(self._data) * 2)
+            data = np.empty(capacity, dtype=self._data.dtype)
+            data[:self._size] = self._data[:self._size]
+            self._data = data
+        self._data[self._size:needed] = values
+        self._size = needed
+
+    def view(self):
+        return self._data[:self._size]
+
+    def detach(self):
+        """Copy a wrapped memory-mapped array into memory so its file can be replaced."""
+        if isinstance(self._data, np.memmap):
+            self._data = np.array(self._data)
+
+
+class FrameStore:
+    """History of read/write counts per box, and accesses per ROM box, for every traced frame.
+
+    Each frame keeps only the boxes it touched, as (box, count) pairs in shared
+    array buffers, and every keyframe_interval frames a full copy of the
+    cumulative counts is kept as a keyframe. Rebuilding any frame therefore
+    replays at most keyframe_interval sparse deltas, whatever the trace length.
+    Reads are stored as box indices 0..num_boxes-1, writes as num_boxes and up,
+    and the num_rom_boxes ROM boxes after those.
+
+    Frames must be appended in increasing order. Safe to append from the ingest
+    thread while the Tk thread reads. to_arrays/restore turn the store into
+    plain arrays and back, for the frame index sidecar file.
+    """
+
+    def __init__(self, num_boxes, keyframe_interval=256, num_rom_boxes=0):
+        self.num_boxes = num_boxes
+        self.keyframe_interval = keyframe_interval
+        self.num_rom_boxes = num_rom_boxes
+        self._num_counts = 2 * num_boxes + num_rom_boxes
+        self._lock = threading.Lock()
+        self._frames = GrowableArray(np.int64)
+        self._delta_offsets = GrowableArray(np.int64)
+        self._delta_offsets.append([0])
+        self._delta_boxes = GrowableArray(np.min_scalar_type(self._num_counts - 1))
+        self._delta_counts = GrowableArray(np.uint32)
+        self._connection_offsets = GrowableArray(np.int64)
+        self._connection_offsets.append([0])
+        self._connections = GrowableArray(CONNECTION_DTYPE)
+        self._keyframes = []  # Cumulative counts after every keyframe_interval-th frame
+        self._totals = np.zeros(self._num_counts, dtype=np.int64)
+
+    def __len__(self):
+        return len(self._frames)
+
+    def __contains__(self, frame):
+        return self._position(frame) is not None
+
+    @property
+    def nbytes(self):
+        """Approximate memory used by the store."""
+        buffers = (self._frames, self._delta_offsets, self._delta_boxes, self._delta_counts,
+                   self._connection_offsets, self._connections)
+        return sum(buffer.nbytes for buffer in buffers) + sum(keyframe.nbytes for keyframe in self._keyframes)
+
+    def frames(self):
+        """All stored frame numbers, in order."""
+        with self._lock:
+            return self._frames.view().copy()
+
+    def append(self, frame, read_counts, write_counts, connections, rom_counts=None):
+        """Store the counts and new connections of one frame (counts for that frame only)."""
+        if rom_counts is None:
+            rom_counts = np.zeros(self.num_rom_boxes, dtype=np.int64)
+        delta = np.concatenate((read_counts, write_counts, rom_counts))
+        boxes = np.flatnonzero(delta)
+        with self._lock:
+            if len(self._frames) and frame <= self._frames.view()[-1]:
+                raise ValueError(f"Frame {frame} appended out of order")
+            self._frames.append([frame])
+            self._delta_boxes.append(boxes)
+            self._delta_counts.append(delta[boxes])
+            self._delta_offsets.append([len(self._delta_boxes)])
+            self._connections.append(connections)
+            self._connection_offsets.append([len(self._connections)])
+            self._totals += delta
+            if (len(self._frames) - 1) % self.keyframe_interval == 0:
+                self._keyframes.append(self._totals.copy())
+
+    def cumulative(self, frame):
+        """(read_counts, write_counts) from the start of the trace up to and including frame."""
+        totals = self._cumulative(frame)
+        return totals[:self.num_boxes], totals[self.num_boxes:2 * self.num_boxes]
+
+    def per_frame(self, frame):
+        """(read_counts, write_counts) of the accesses made during frame only."""
+        counts = self._per_frame(frame)
+        return counts[:self.num_boxes], counts[self.num_boxes:2 * self.num_boxes]
+
+    def rom_cumulative(self, frame):
+        """Accesses per ROM box from the start of the trace up to and including frame."""
+        return self._cumulative(frame)[2 * self.num_boxes:]
+
+    def rom_per_frame(self, frame):
+        """Accesses per ROM box made during frame only."""
+        return self._per_frame(frame)[2 * self.num_boxes:]
+
+    def connections(self, frame):
+        """Connections first seen in frame (not present in the frame before it)."""
+        with self._lock:
+            position = self._position(frame)
+            if position is None:
+                raise KeyError(frame)
+            start, end = self._connection_offsets.view()[[position, position + 1]]
+            return self._connections.view()[start:end].copy()
+
+    def to_arrays(self):
+        """The contents of the store as a dict of arrays, see restore."""
+        with self._lock:
+            return {
+                "frames": self._frames.view(),
+                "delta_offsets": self._delta_offsets.view(),
+                "delta_boxes": self._delta_boxes.view(),
+                "delta_counts": self._delta_counts.view(),
+                "connection_offsets": self._connection_offsets.view(),
+                "connections": self._connections.view(),
+                "keyframes": np.array(self._keyframes, dtype=np.int64).reshape(-1, self._num_counts),
+                "totals": self._totals.copy(),
+            }
+
+    def restore(self, arrays):
+        """Replace the contents of the store with arrays from to_arrays (read-only memmaps are fine)."""
+        with self._lock:
+            self._frames = GrowableArray.from_array(arrays["frames"])
+            self._delta_offsets = GrowableArray.from_array(arrays["delta_offsets"])
+            self._delta_boxes = GrowableArray.from_array(arrays["delta_boxes"])
+            self._delta_counts = GrowableArray.from_array(arrays["delta_counts"])
+            self._connection_offsets = GrowableArray.from_array(arrays["connection_offsets"])
+            self._connections = GrowableArray.from_array(arrays["connections"])
+            self._keyframes = list(arrays["keyframes"])
+            self._totals = np.array(arrays["totals"], dtype=np.int64)
+
+    def detach(self):
+        """Stop referencing a memory-mapped sidecar file, see GrowableArray.detach."""
+        with self._lock:
+            for buffer in (self._frames, self._delta_offsets, self._delta_boxes, self._delta_counts,
+                           self._connection_offsets, self._connections):
+                buffer.detach()
+            self._keyframes = [np.array(keyframe) for keyframe in self._keyframes]
+
+    def _cumulative(self, frame):
+        with self._lock:
+            position = self._position(frame)
+            if position is None:
+                raise KeyError(frame)
+            keyframe = position // self.keyframe_interval
+            keyframe_position = keyframe * self.keyframe_interval
+            start, end = self._delta_offsets.view()[[keyframe_position + 1, position + 1]]
+            return self._keyframes[keyframe] + self._replay(start, end)
+
+    def _per_frame(self, frame):
+        with self._lock:
+            position = self._position(frame)
+            if position is None:
+                raise KeyError(frame)
+            start, end = self._delta_offsets.view()[[position, position + 1]]
+            return self._replay(start, end)
+
+    def _position(self, frame):
+        frames = self._frames.view()
+        position = int(np.searchsorted(frames, frame))
+        if position < len(frames) and frames[position] == frame:
+            return position
+        return None
+
+    def _replay(self, start, end):
+        counts = np.bincount(
+            self._delta_boxes.view()[start:end], weights=self._delta_counts.view()[start:end],
+            minlength=self._num_counts)
+        return counts.astype(np.int64)
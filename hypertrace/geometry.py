@@ -0,0 +1,52 @@
+"""Pixel layout of the ROM and memory grids, shared by drawing and hit-testing."""
+import numpy as np
+
+
+class GridGeometry:
+    """Where every box of a grid is on the canvas, as lookup tables built once per layout.
+
+    The grid fills a width x height area at (x_offset, y_offset), inset by
+    padding, with grid_size boxes per row. (x, y) is the top left corner of the
+    first box, step_x and step_y the distance between boxes."""
+
+    def __init__(self, x_offset, y_offset, width, height, grid_size, num_boxes, padding=5):
+        self.grid_size = grid_size
+        self.num_boxes = num_boxes
+        self.rows = -(-num_boxes // grid_size)
+        self.x = x_offset + padding
+        self.y = y_offset + padding
+        self.step_x = (width - 2 * padding) // grid_size
+        self.step_y = (height - 2 * padding) // grid_size
+
+        row, col = np.divmod(np.arange(num_boxes), grid_size)
+        x0 = self.x + col * self.step_x
+        y0 = self.y + row * self.step_y
+        self.bounds = np.stack((x0, y0, x0 + self.step_x, y0 + self.step_y), axis=1)  # (x0, y0, x1, y1) per box
+        self.centers = np.stack((x0 + self.step_x // 2, y0 + self.step_y // 2), axis=1)
+        self._region_centers = {1: self.centers}
+
+    def box_at(self, x, y):
+        """Index of the box under pixel (x, y), or None."""
+        col = (x - self.x) // self.step_x
+        row = (y - self.y) // self.step_y
+        if not (0 <= col < self.grid_size and 0 <= row < self.rows):
+            return None
+        box = int(row * self.grid_size + col)
+        return box if box < self.num_boxes else None
+
+    def region_indices(self, boxes, region_size):
+        """Index of the square region of region_size x region_size boxes each box falls in."""
+        row, col = np.divmod(boxes, self.grid_size)
+        return (row // region_size) * -(-self.grid_size // region_size) + col // region_size
+
+    def region_centers(self, region_size):
+        """(num_regions, 2) pixel centres of the regions numbered by region_indices."""
+        if region_size not in self._region_centers:
+            regions_per_row = -(-self.grid_size // region_size)
+            num_regions = regions_per_row * -(-self.rows // region_size)
+            row, col = np.divmod(np.arange(num_regions), regions_per_row)
+            span_x = region_size * self.step_x
+            span_y = region_size * self.step_y
+            self._region_centers[region_size] = np.stack(
+                (self.x + col * span_x + span_x // 2, self.y + row * span_y + span_y // 2), axis=1)
+        return self._region_centers[region_size]
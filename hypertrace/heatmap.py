@@ -0,0 +1,271 @@
+"""Colour mapping and rendering of the ROM and memory grids.
+
+Colours are computed for all boxes at once as an (num_boxes, 3) uint8 RGB
+array. Two interchangeable renderers put them on the canvas:
+
+- GridImage draws the whole grid as one PhotoImage. A big change is blitted as
+  a single image, a small one repaints only the boxes that changed.
+- GridRectangles keeps the original one canvas rectangle per box.
+
+FlashLayer draws the yellow crosses that flag freshly accessed boxes on top of
+either renderer.
+"""
+import math
+
+import numpy as np
+from PIL import Image
+
+WHITE = (255, 255, 255)
+OUTLINE = (211, 211, 211)  # "lightgray", the box outline colour
+FLASH = (255, 255, 0)  # Yellow
+
+
+def hex_to_rgb(colors):
+    """Turn a list of "#rrggbb" strings into an (n, 3) uint8 array."""
+    return np.array([[int(color[i:i + 2], 16) for i in (1, 3, 5)] for color in colors], dtype=np.uint8)
+
+
+def rgb_to_hex(rgb):
+    return "#%02x%02x%02x" % tuple(rgb)
+
+
+def memory_gradients(max_steps=100):
+    """(read, write) color gradients as (max_steps, 3) RGB arrays.
+
+    Reads go from light to dark blue, writes from light to dark green."""
+    ratio = (np.arange(max_steps) / (max_steps - 1))[:, None]
+    read_gradient = np.array([173, 216, 230]) * (1 - ratio) + np.array([0, 0, 139]) * ratio
+    write_gradient = np.array([144, 238, 144]) * (1 - ratio) + np.array([0, 100, 0]) * ratio
+    return read_gradient.astype(np.uint8), write_gradient.astype(np.uint8)
+
+
+def grid_pixels(colors, grid_size, step_x, step_y):
+    """RGB pixels of a grid of boxes grid_size wide, each step_x by step_y including its 1 pixel outline."""
+    rows = -(-len(colors) // grid_size)
+    cells = np.full((rows * grid_size, 3), 255, dtype=np.uint8)
+    cells[:len(colors)] = colors
+    cells = cells.reshape(rows, grid_size, 3)
+    pixels = np.empty((rows * step_y + 1, grid_size * step_x + 1, 3), dtype=np.uint8)
+    pixels[:-1, :-1] = np.repeat(np.repeat(cells, step_y, axis=0), step_x, axis=1)
+    pixels[::step_y, :] = OUTLINE
+    pixels[:, ::step_x] = OUTLINE
+    return pixels
+
+
+def color_scale(max_accesses, steps_per_doubling=4):
+    """The count memory colors are scaled to: max_accesses rounded up to the next color bucket.
+
+    Buckets grow geometrically, steps_per_doubling of them for every doubling, so
+    the colors of all boxes only need recomputing when the busiest box moves into
+    the next bucket, not every time it gets one more access."""
+    if max_accesses <= 1:
+        return 1
+    exponent = math.ceil(math.log2(max_accesses) * steps_per_doubling) / steps_per_doubling
+    return math.ceil(2 ** exponent)
+
+
+def memory_colors(read_counts, write_counts, max_accesses, read_gradient, write_gradient):
+    """Colour of every memory box in the given counts, the same scheme update_memory_grid always used.
+
+    Reads only go light to dark blue, writes only light to dark green (both
+    through the precomputed gradients as RGB arrays), and boxes with both go
+    from yellow to red as they get busier."""
+    max_steps = len(read_gradient)
+    total_accesses = read_counts + write_counts
+    colors = np.full((len(read_counts), 3), 255, dtype=np.uint8)
+
+    reads_only = (read_counts > 0) & (write_counts == 0)
+    ratio_index = (read_counts[reads_only] / max_accesses * (max_steps - 1)).astype(np.int64)
+    colors[reads_only] = read_gradient[np.minimum(ratio_index, max_steps - 1)]
+
+    writes_only = (write_counts > 0) & (read_counts == 0)
+    ratio_index = (write_counts[writes_only] / max_accesses * (max_steps - 1)).astype(np.int64)
+    colors[writes_only] = write_gradient[np.minimum(ratio_index, max_steps - 1)]
+
+    # Hue from 0.15 (yellow) down to 0 (red) at full saturation and value
+    both = (read_counts > 0) & (write_counts > 0)
+    hue = (1 - np.minimum(total_accesses[both] / max_accesses, 1)) * 0.15
+    colors[both, 0] = 255
+    colors[both, 1] = (hue * 6 * 255).astype(np.uint8)
+    colors[both, 2] = 0
+    return colors
+
+
+def rom_colors(access_counts):
+    """Grayscale colour of every ROM box, logarithmically scaled to the busiest box."""
+    max_access = max(int(access_counts.max()), 1)  # Avoid division by zero
+    intensity = (np.log(access_counts + 1) / math.log(max_access + 1) * 255).astype(np.int64)
+    return np.repeat((255 - intensity).astype(np.uint8)[:, None], 3, axis=1)
+
+
+class GridImage:
+    """A grid of boxes drawn as a single PhotoImage on the canvas, laid out by a geometry.GridGeometry.
+
+    Boxes get a 1 pixel outline like the canvas rectangles."""
+
+    def __init__(self, canvas, geometry, full_redraw_fraction=0.125):
+        self.canvas = canvas
+        self.geometry = geometry
+        self.num_boxes = geometry.num_boxes
+        # Above this fraction of changed boxes one full blit beats repainting them one by one
+        self.full_redraw_fraction = full_redraw_fraction
+        self.colors = np.full((self.num_boxes, 3), 255, dtype=np.uint8)
+        self.photo = None
+        self.item = None
+
+    def draw(self):
+        """Put the image on the canvas (only once) and paint the current colours."""
+        if self.photo is None:
+            geometry = self.geometry
+            size = (geometry.grid_size * geometry.step_x + 1, geometry.rows * geometry.step_y + 1)
+            from PIL import ImageTk  # Needs tkinter, which headless reports (hypertrace.query) do without
+            self.photo = ImageTk.PhotoImage(Image.new("RGB", size, OUTLINE))
+            self.item = self.canvas.create_image(geometry.x, geometry.y, anchor="nw", image=self.photo)
+        self._blit()
+
+    def update(self, colors, boxes=None):
+        """Show new box colours, repainting only what changed. Returns the changed box indices.
+
+        colors holds the colour of every box, or of just the given box indices."""
+        changed = _changed_boxes(self.colors, colors, boxes)
+        if not len(changed):
+            return changed
+        if self.photo is None:
+            return changed
+
+        if len(changed) > self.full_redraw_fraction * self.num_boxes:
+            self._blit()
+        else:
+            photo_name = str(self.photo)
+            # Box bounds relative to the image, the inside of the box without its outline
+            inside = self.geometry.bounds[changed] - [self.geometry.x - 1, self.geometry.y - 1, self.geometry.x,
+                                                      self.geometry.y]
+            for (x0, y0, x1, y1), color in zip(inside.tolist(), self.colors[changed].tolist()):
+                self.canvas.tk.call(photo_name, "put", rgb_to_hex(color), "-to", x0, y0, x1, y1)
+        return changed
+
+    def _blit(self):
+        pixels = grid_pixels(self.colors, self.geometry.grid_size, self.geometry.step_x, self.geometry.step_y)
+        self.photo.paste(Image.fromarray(pixels))
+
+
+class GridRectangles:
+    """A grid of boxes laid out by a geometry.GridGeometry, drawn as one canvas rectangle each.
+
+    Rectangles are box_size pixels square and tagged f"{tag_prefix}{i}"."""
+
+    def __init__(self, canvas, geometry, box_size, tag_prefix):
+        self.canvas = canvas
+        self.geometry = geometry
+        self.num_boxes = geometry.num_boxes
+        self.box_size = box_size
+        self.tag_prefix = tag_prefix
+        self.colors = np.full((self.num_boxes, 3), 255, dtype=np.uint8)
+        self.items = None
+
+    def draw(self):
+        """Create the rectangles (only once) in their current colours."""
+        if self.items is not None:
+            return
+        self.items = []
+        corners = self.geometry.bounds[:, :2].tolist()
+        for i, ((x0, y0), color) in enumerate(zip(corners, self.colors.tolist())):
+            self.items.append(self.canvas.create_rectangle(
+                x0, y0, x0 + self.box_size, y0 + self.box_size,
+                outline="lightgray", fill=rgb_to_hex(color), tags=f"{self.tag_prefix}{i}"))
+
+    def update(self, colors, boxes=None):
+        """Recolor the rectangles whose colour changed. Returns the changed box indices.
+
+        colors holds the colour of every box, or of just the given box indices."""
+        changed = _changed_boxes(self.colors, colors, boxes)
+        if self.items is not None:
+            # Address items by id, a tag lookup has to search every item on the canvas
+            for i, color in zip(changed.tolist(), self.colors[changed].tolist()):
+                self.canvas.itemconfig(self.items[i], fill=rgb_to_hex(color))
+        return changed
+
+
+class FlashLayer:
+    """Yellow crosses over recently accessed boxes of a grid, fading into the box colour.
+
+    The crosses come from a fixed pool of max_flashes pairs of canvas lines that
+    are moved around and recoloured, and a single timer fades them all every
+    interval milliseconds, so flashing any number of boxes costs at most
+    max_flashes item updates per tick. When more boxes are flashing than there
+    are crosses, the brightest ones are shown."""
+
+    def __init__(self, canvas, grid, max_flashes=256, duration=300, interval=50):
+        self.canvas = canvas
+        self.grid = grid  # GridImage or GridRectangles, for the box positions and colours
+        self.interval = interval
+        self.fade_step = interval / duration
+        self.intensity = np.zeros(grid.num_boxes)  # 1 when a box has just flashed, fading to 0
+        self._timer = None
+        self._slot_boxes = np.full(max_flashes, -1, dtype=np.int64)  # Box each cross is showing, -1 when hidden
+        self._lines = [
+            (canvas.create_line(0, 0, 0, 0, fill=rgb_to_hex(FLASH), width=2, state="hidden", tags="flash"),
+             canvas.create_line(0, 0, 0, 0, fill=rgb_to_hex(FLASH), width=2, state="hidden", tags="flash"))
+            for _ in range(max_flashes)]
+
+    def flash(self, boxes):
+        """Light up the given box indices at full intensity."""
+        if not len(boxes):
+            return
+        self.intensity[boxes] = 1
+        if self._timer is None:
+            self._draw()
+            self._timer = self.canvas.after(self.interval, self._tick)
+
+    def clear(self):
+        self.intensity[:] = 0
+        self._draw()
+
+    def _tick(self):
+        self.intensity = np.maximum(self.intensity - self.fade_step, 0)
+        self._draw()
+        self._timer = self.canvas.after(self.interval, self._tick) if self._slot_boxes.max() >= 0 else None
+
+    def _draw(self):
+        # The brightest flashing boxes that fit in the pool
+        flashing = np.flatnonzero(self.intensity > 0)
+        if len(flashing) > len(self._slot_boxes):
+            brightest = np.argpartition(self.intensity[flashing], -len(self._slot_boxes))[-len(self._slot_boxes):]
+            flashing = flashing[brightest]
+
+        # Crosses keep showing their box while it is flashing, the rest are moved to the new boxes or hidden
+        kept = np.isin(self._slot_boxes, flashing)
+        new_boxes = np.setdiff1d(flashing, self._slot_boxes[kept])
+        free_slots = np.flatnonzero(~kept)
+        previous = self._slot_boxes.copy()
+        self._slot_boxes[free_slots] = -1
+        self._slot_boxes[free_slots[:len(new_boxes)]] = new_boxes
+
+        for slot in np.flatnonzero((self._slot_boxes >= 0) | (previous >= 0)).tolist():
+            box = int(self._slot_boxes[slot])
+            line1, line2 = self._lines[slot]
+            if box < 0:
+                self.canvas.itemconfig(line1, state="hidden")
+                self.canvas.itemconfig(line2, state="hidden")
+                continue
+            if box != previous[slot]:
+                x0, y0, x1, y1 = self.grid.geometry.bounds[box].tolist()
+                self.canvas.coords(line1, x0, y0, x1, y1)
+                self.canvas.coords(line2, x0, y1, x1, y0)
+            # Fade from yellow into the colour of the box underneath
+            intensity = self.intensity[box]
+            color = rgb_to_hex((np.array(FLASH) * intensity + self.grid.colors[box] * (1 - intensity)).astype(int))
+            self.canvas.itemconfig(line1, fill=color, state="normal")
+            self.canvas.itemconfig(line2, fill=color, state="normal")
+
+
+def _changed_boxes(current, colors, boxes):
+    """Store new colours in current, return the indices of the boxes whose colour changed."""
+    if boxes is None:
+        changed = np.flatnonzero((colors != current).any(axis=1))
+        current[changed] = colors[changed]
+    else:
+        differs = (colors != current[boxes]).any(axis=1)
+        changed = boxes[differs]
+        current[changed] = colors[differs]
+    return changed
@@ -0,0 +1,197 @@
+"""Read and write counts of every single address, re-binnable to any zoom level.
+
+Counts are kept per byte in pages of 2**page_bits addresses, allocated when an
+address in them is first accessed, so only the parts of the address space the
+game actually touches take memory. Counts are uint32, a page whose reads or
+writes add up to more than that holds moves its counts to uint64 (see
+_promote), so only the hottest pages take the wider counts.
+
+On top of the counts sit summed levels, like the levels of a mipmap: totals per
+page (with running totals over the pages) and, within every page, totals per
+block of 2**block_bits addresses (with running totals over the blocks, updated
+when the page changes). The number of accesses below an address is then a page
+lookup, a block lookup and at most one block of counts. Summing a box of any
+size and alignment costs the same, so re-binning a window of num_boxes boxes is
+O(num_boxes) whether a box covers the whole address space or a single byte.
+"""
+import threading
+
+import numpy as np
+
+# Largest count of a page with uint32 counts, see AccessHistogram._promote
+NARROW_MAX = np.iinfo(np.uint32).max
+
+
+class AccessHistogram:
+    """Per-address read and write counts over an address space of size bytes.
+
+    Safe to add to from the ingest thread while the Tk thread re-bins."""
+
+    def __init__(self, size, page_bits=12, block_bits=4):
+        self.size = size
+        self.page_bits = page_bits
+        self.page_size = 1 << page_bits
+        self.block_bits = block_bits
+        self.block_size = 1 << block_bits
+        self.num_pages = -(-size // self.page_size)
+        self._lock = threading.Lock()
+        self._slots = np.full(self.num_pages + 1, -1, dtype=np.int64)  # Page number -> row in _counts
+        self._pages = []  # Page number of every row
+        self._counts = np.zeros((0, 2, self.page_size), dtype=np.uint32)
+        self._wide_slots = np.full(self.num_pages + 1, -1, dtype=np.int64)  # Page number -> row in _wide_counts
+        self._wide_pages = []  # Page number of every row of _wide_counts
+        self._wide_counts = np.zeros((0, 2, self.page_size), dtype=np.uint64)
+        self._block_starts = np.zeros((0, 2, self.page_size >> block_bits), dtype=np.int64)
+        self._stale = np.zeros(0, dtype=bool)  # Rows whose _block_starts need recomputing
+        self._page_totals = np.zeros((self.num_pages, 2), dtype=np.int64)
+
+    def __len__(self):
+        """Number of pages holding counts."""
+        return len(self._pages)
+
+    @property
+    def nbytes(self):
+        """Approximate memory used by the counts and summed levels."""
+        return self._counts.nbytes + self._wide_counts.nbytes + self._block_starts.nbytes + self._page_totals.nbytes
+
+    def add(self, address_counts):
+        """Add an ingest.ADDRESS_COUNT_DTYPE array of accesses. Addresses outside the space are ignored."""
+        self._apply(address_counts, np.add)
+
+    def remove(self, address_counts):
+        """Take accesses added before back out again."""
+        self._apply(address_counts, np.subtract)
+
+    def rebin(self, window):
+        """(read_counts, write_counts) for the boxes of an ingest.BoxWindow."""
+        edges = window.start + np.arange(window.num_boxes + 1, dtype=np.int64) * window.box_size
+        below = self._accesses_below(np.clip(edges, 0, self.size))
+        counts = np.diff(below, axis=0)
+        return counts[:, 0], counts[:, 1]
+
+    def to_arrays(self):
+        """The counts as a dict of arrays, see restore.
+
+        The counts are views rather than copies, so only use them before the next add, from the thread adding."""
+        with self._lock:
+            return {
+                "pages": np.array(self._pages, dtype=np.int64),
+                "counts": self._counts[:len(self._pages)],
+                "wide_pages": np.array(self._wide_pages, dtype=np.int64),
+                "wide_counts": self._wide_counts[:len(self._wide_pages)],
+            }
+
+    def restore(self, arrays):
+        """Replace the counts with arrays from to_arrays (read-only memmaps are fine)."""
+        pages = np.asarray(arrays["pages"], dtype=np.int64)
+        wide_pages = np.asarray(arrays["wide_pages"], dtype=np.int64)
+        with self._lock:
+            self._slots[:] = -1
+            self._slots[pages] = np.arange(len(pages))
+            self._pages = pages.tolist()
+            self._counts = np.array(arrays["counts"], dtype=np.uint32).reshape(-1, 2, self.page_size)
+            self._wide_slots[:] = -1
+            self._wide_slots[wide_pages] = np.arange(len(wide_pages))
+            self._wide_pages = wide_pages.tolist()
+            self._wide_counts = np.array(arrays["wide_counts"], dtype=np.uint64).reshape(-1, 2, self.page_size)
+            self._block_starts = np.zeros((len(pages), 2, self.page_size >> self.block_bits), dtype=np.int64)
+            self._stale = np.ones(len(pages), dtype=bool)
+            self._page_totals[:] = 0
+            self._page_totals[pages] = self._counts.sum(axis=2)
+            self._page_totals[wide_pages] += self._wide_counts.sum(axis=2).astype(np.int64)
+
+    def _apply(self, address_counts, ufunc):
+        addresses = address_counts["address"].astype(np.int64)
+        inside = addresses < self.size
+        addresses = addresses[inside]
+        pages = addresses >> self.page_bits
+        offsets = addresses & (self.page_size - 1)
+        with self._lock:
+            for page in np.unique(pages[self._slots[pages] < 0]).tolist():
+                self._new_slot(page)
+            slots = self._slots[pages]
+            types = address_counts["type"][inside]
+            counts = address_counts["count"][inside]
+            ufunc.at(self._page_totals, (pages, types), counts.astype(np.int64))
+            # No count of a page can pass what uint32 holds before the page's total does
+            overflowing = (self._page_totals[pages] > NARROW_MAX).any(axis=1) & (self._wide_slots[pages] < 0)
+            for page in np.unique(pages[overflowing]).tolist():
+                self._promote(page)
+            wide_slots = self._wide_slots[pages]
+            wide = wide_slots >= 0
+            narrow = ~wide
+            ufunc.at(self._counts, (slots[narrow], types[narrow], offsets[narrow]), counts[narrow])
+            ufunc.at(self._wide_counts, (wide_slots[wide], types[wide], offsets[wide]), counts[wide])
+            self._stale[slots] = True
+
+    def _new_slot(self, page):
+        slot = len(self._pages)
+        if slot == len(self._counts):
+            # Double the capacity, like frame_store.GrowableArray
+            capacity = max(16, 2 * slot)
+            self._counts = _grown(self._counts, capacity)
+            self._block_starts = _grown(self._block_starts, capacity)
+            self._stale = _grown(self._stale, capacity)
+        self._pages.append(page)
+        self._slots[page] = slot
+
+    def _promote(self, page):
+        """Move the counts of a page to a row of uint64 counts, its uint32 row stays behind all zeros."""
+        wide_slot = len(self._wide_pages)
+        if wide_slot == len(self._wide_counts):
+            self._wide_counts = _grown(self._wide_counts, max(4, 2 * wide_slot))
+        slot = self._slots[page]
+        self._wide_counts[wide_slot] = self._counts[slot]
+        self._counts[slot] = 0
+        self._wide_pages.append(page)
+        self._wide_slots[page] = wide_slot
+
+    def _accesses_below(self, positions):
+        """(len(positions), 2) reads and writes at the addresses below each position."""
+        pages = positions >> self.page_bits
+        offsets = positions & (self.page_size - 1)
+        with self._lock:
+            self._update_block_starts()
+            page_starts = np.zeros((self.num_pages + 1, 2), dtype=np.int64)
+            np.cumsum(self._page_totals, axis=0, out=page_starts[1:])
+            below = page_starts[pages]
+
+            # Within a page: the blocks before the offset, then the addresses before it in its own block
+            slots = self._slots[pages]
+            inside = slots >= 0
+            slots = slots[inside]
+            blocks = offsets[inside] >> self.block_bits
+            below[inside] += self._block_starts[slots, :, blocks]
+            in_block = np.arange(self.block_size)
+            columns = (blocks << self.block_bits)[:, None] + in_block
+            block_counts = self._counts[slots[:, None], :, columns].astype(np.int64)
+            wide_slots = self._wide_slots[pages[inside]]
+            wide = wide_slots >= 0
+            if wide.any():
+                block_counts[wide] += self._wide_counts[wide_slots[wide][:, None], :, columns[wide]].astype(np.int64)
+            before = in_block < (offsets[inside] & (self.block_size - 1))[:, None]
+            below[inside] += (block_counts * before[:, :, None]).sum(axis=1)
+        return below
+
+    def _update_block_starts(self):
+        stale = np.flatnonzero(self._stale)
+        if not len(stale):
+            return
+        block_totals = self._block_totals(self._counts[stale])
+        wide_slots = self._wide_slots[np.array(self._pages, dtype=np.int64)[stale]]
+        wide = wide_slots >= 0
+        if wide.any():
+            block_totals[wide] += self._block_totals(self._wide_counts[wide_slots[wide]])
+        self._block_starts[stale, :, 0] = 0
+        self._block_starts[stale, :, 1:] = np.cumsum(block_totals[:, :, :-1], axis=2)
+        self._stale[stale] = False
+
+    def _block_totals(self, counts):
+        return counts.reshape(len(counts), 2, -1, self.block_size).sum(axis=3, dtype=np.int64)
+
+
+def _grown(array, capacity):
+    """array with room for capacity rows, the new ones zero."""
+    grown = np.zeros((capacity,) + array.shape[1:], dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
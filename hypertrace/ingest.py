@@ -0,0 +1,407 @@
+"""Vectorised aggregation of decoded memory access records.
+
+Everything here works on whole arrays of records (see records.RECORD_DTYPE)
+at once, so catching up on a large trace costs a handful of NumPy calls per
+chunk instead of a Python loop per access. Records decoded from a summary log
+stand for several accesses each (records.record_counts), which the counts
+take into account.
+"""
+import queue
+import threading
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from hypertrace.records import ACCESS_READ, ACCESS_WRITE, record_counts
+
+# One code -> memory connection, as drawn between the ROM and memory grids
+CONNECTION_DTYPE = np.dtype([("pc", "<u4"), ("type", "u1"), ("address", "<u4")])
+
+# Number of accesses of one type to one address
+ADDRESS_COUNT_DTYPE = np.dtype([("address", "<u4"), ("type", "u1"), ("count", "<u4")])
+
+# num_boxes boxes of box_size addresses each, starting at start
+BoxWindow = namedtuple("BoxWindow", "start box_size num_boxes")
+
+# Everything the ingest thread counted since its previous update. boxes holds the indices of the
+# boxes with any reads or writes, address_counts the accesses per address (ADDRESS_COUNT_DTYPE),
+# whatever window the box counts are binned for.
+IngestUpdate = namedtuple(
+    "IngestUpdate",
+    "first_frame last_frame window read_counts write_counts boxes address_counts pc_counts connections")
+
+
+def split_frames(frames):
+    """Yield (frame, start, end) for every run of equal frame numbers."""
+    if len(frames) == 0:
+        return
+    bounds = [0, *(np.flatnonzero(np.diff(frames)) + 1).tolist(), len(frames)]
+    values = frames[bounds[:-1]].tolist()
+    yield from zip(values, bounds[:-1], bounds[1:])
+
+
+def box_indices(values, start, box_size, num_boxes):
+    """Map addresses to box indices, -1 for anything outside the window."""
+    indices = (np.asarray(values, dtype=np.int64) - start) // box_size
+    indices[(indices < 0) | (indices >= num_boxes)] = -1
+    return indices
+
+
+def _weighted_bincount(indices, weights, num_boxes):
+    if weights is None:
+        return np.bincount(indices, minlength=num_boxes)
+    return np.bincount(indices, weights=weights, minlength=num_boxes).astype(np.int64)
+
+
+def count_boxes(values, start, box_size, num_boxes, weights=None):
+    """Histogram of addresses over num_boxes boxes of box_size starting at start, each counted weights times."""
+    indices = box_indices(values, start, box_size, num_boxes)
+    valid = indices >= 0
+    return _weighted_bincount(indices[valid], None if weights is None else weights[valid], num_boxes)
+
+
+def count_accesses(recs, start, box_size, num_boxes):
+    """Count reads and writes per box. Returns (read_counts, write_counts).
+
+    recs may also be an ADDRESS_COUNT_DTYPE array, whose counts are weights like those of a summary."""
+    indices = box_indices(recs["address"], start, box_size, num_boxes)
+    valid = indices >= 0
+    is_write = recs["type"] == ACCESS_WRITE
+    counts = record_counts(recs)
+    reads = valid & ~is_write
+    writes = valid & is_write
+    read_counts = _weighted_bincount(indices[reads], None if counts is None else counts[reads], num_boxes)
+    write_counts = _weighted_bincount(indices[writes], None if counts is None else counts[writes], num_boxes)
+    return read_counts, write_counts
+
+
+def rebin_boxes(counts, window, to_window):
+    """Counts binned for the boxes of window, binned for those of to_window instead.
+
+    A box of to_window gets the counts of the boxes of window starting in it.
+    Boxes smaller than those of window can't be told apart, each gets the count
+    of the box of window it lies in."""
+    edges = to_window.start + np.arange(to_window.num_boxes + 1, dtype=np.int64) * to_window.box_size
+    if to_window.box_size < window.box_size:
+        indices = box_indices(edges[:-1], *window)
+        return np.where(indices >= 0, counts[indices], 0)
+    positions = np.clip(-(-(edges - window.start) // window.box_size), 0, window.num_boxes)
+    starts = np.zeros(window.num_boxes + 1, dtype=np.int64)
+    np.cumsum(counts, out=starts[1:])
+    return np.diff(starts[positions])
+
+
+def address_counts(recs):
+    """Number of accesses per (address, type) in recs, as an ADDRESS_COUNT_DTYPE array."""
+    keys = (recs["type"].astype(np.uint64) << np.uint64(32)) | recs["address"].astype(np.uint64)
+    counts = record_counts(recs)
+    if counts is None:
+        keys, counts = np.unique(keys, return_counts=True)
+    else:
+        keys, inverse = np.unique(keys, return_inverse=True)
+        counts = np.bincount(inverse.ravel(), weights=counts, minlength=len(keys))
+    return _address_counts_from_keys(keys, counts)
+
+
+def merge_address_counts(*address_count_arrays):
+    """Sum several ADDRESS_COUNT_DTYPE arrays into one with every address and type once."""
+    merged = np.concatenate(address_count_arrays)
+    keys = (merged["type"].astype(np.uint64) << np.uint64(32)) | merged["address"].astype(np.uint64)
+    keys, inverse = np.unique(keys, return_inverse=True)
+    counts = np.bincount(inverse.ravel(), weights=merged["count"], minlength=len(keys))
+    return _address_counts_from_keys(keys, counts)
+
+
+def _address_counts_from_keys(keys, counts):
+    result = np.empty(len(keys), dtype=ADDRESS_COUNT_DTYPE)
+    result["address"] = keys & np.uint64(0xFFFFFFFF)
+    result["type"] = keys >> np.uint64(32)
+    result["count"] = counts
+    return result
+
+
+def _connection_keys(pc, address):
+    return (pc.astype(np.uint64) << np.uint64(32)) | address.astype(np.uint64)
+
+
+def _connections_from_keys(keys, access):
+    connections = np.empty(len(keys), dtype=CONNECTION_DTYPE)
+    connections["pc"] = keys >> np.uint64(32)
+    connections["type"] = access
+    connections["address"] = keys & np.uint64(0xFFFFFFFF)
+    return connections
+
+
+def unique_connections(recs):
+    """Unique (pc, type, address) triples in recs, as a CONNECTION_DTYPE array."""
+    parts = []
+    for access in (ACCESS_READ, ACCESS_WRITE):
+        selected = recs["type"] == access
+        keys = np.unique(_connection_keys(recs["pc"][selected], recs["address"][selected]))
+        parts.append(_connections_from_keys(keys, access))
+    return np.concatenate(parts)
+
+
+def merge_connections(*connection_arrays):
+    """Union of several CONNECTION_DTYPE arrays."""
+    return unique_connections(np.concatenate(connection_arrays))
+
+
+def new_connections(current, previous):
+    """Connections in current that are not in previous."""
+    parts = []
+    for access in (ACCESS_READ, ACCESS_WRITE):
+        curr = current[current["type"] == access]
+        prev = previous[previous["type"] == access]
+        keys = np.setdiff1d(
+            _connection_keys(curr["pc"], curr["address"]),
+            _connection_keys(prev["pc"], prev["address"]),
+        )
+        parts.append(_connections_from_keys(keys, access))
+    return np.concatenate(parts)
+
+
+def merge_updates(older, newer):
+    """Combine two consecutive updates into one coarser update."""
+    if older.window == newer.window:
+        read_counts = older.read_counts + newer.read_counts
+        write_counts = older.write_counts + newer.write_counts
+        boxes = np.union1d(older.boxes, newer.boxes)
+    else:
+        # Counts binned for a different memory window can't be added, bin the older accesses again for the newer one
+        read_counts, write_counts = count_accesses(older.address_counts, *newer.window)
+        read_counts += newer.read_counts
+        write_counts += newer.write_counts
+        boxes = np.flatnonzero(read_counts | write_counts)
+    return IngestUpdate(
+        older.first_frame, newer.last_frame, newer.window, read_counts, write_counts, boxes,
+        merge_address_counts(older.address_counts, newer.address_counts),
+        older.pc_counts + newer.pc_counts, merge_connections(older.connections, newer.connections))
+
+
+class IngestWorker(threading.Thread):
+    """Background thread that tails the log and aggregates it into per-frame updates.
+
+    Accesses are counted into the memory window being viewed, which set_window
+    changes, and per address into an optional AccessHistogram from which the
+    viewer can re-bin any other window. The per-frame history is always binned
+    for the window the worker starts with (store_window), so its frames can be
+    summed whatever the zooming, and rebin_boxes turns them into the window shown. The histogram is added to as updates
+    are queued, under the same lock poll takes, so during a poll it holds
+    exactly the updates the Tk thread has received; poll_rebinned re-bins it
+    then. The thread fills the
+    per-frame history (a FrameStore, and optionally the FrameIndex that persists
+    it, saved every save_interval seconds and when the thread stops) and hands
+    the Tk thread finished IngestUpdates through a bounded queue. When the UI
+    falls behind and the queue is full, further updates are merged into one
+    pending update, so a burst of trace data turns into fewer, coarser repaints
+    instead of an ever growing backlog.
+    """
+
+    def __init__(self, reader, window, rom_window, frame_store, frame_index=None, max_updates=4, poll_interval=0.1,
+                 histogram=None):
+        super().__init__(name="hypertrace-ingest", daemon=True)
+        self.reader = reader
+        self.rom_window = rom_window
+        self.frame_store = frame_store
+        self.frame_index = frame_index
+        self.poll_interval = poll_interval
+        self.histogram = histogram
+        self.updates = queue.Queue(maxsize=max_updates)
+        self.current_frame = None
+
+        self.store_window = window
+        self._window = window
+        self._window_lock = threading.Lock()
+        self._running = threading.Event()
+        self._running.set()
+        self._stopped = threading.Event()
+        self._pending = None  # Update waiting for room in the queue
+        self._publish_lock = threading.Lock()
+        self._delta = None  # Counts of the frame being read, not yet published
+
+        # Counts of the frame being read, binned for store_window and stored in frame_store when it ends
+        self._read_counts = np.zeros(window.num_boxes, dtype=np.int64)
+        self._write_counts = np.zeros(window.num_boxes, dtype=np.int64)
+        self._pc_counts = np.zeros(rom_window.num_boxes, dtype=np.int64)
+        # ROM box counts of every stored frame, saved in the frame index
+        self.pc_totals = np.zeros(rom_window.num_boxes, dtype=np.int64)
+        self._unsaved_frames = False
+        self._this_frame_connections = np.empty(0, dtype=CONNECTION_DTYPE)
+        self._prev_frame_connections = np.empty(0, dtype=CONNECTION_DTYPE)
+
+    def set_window(self, window):
+        """Count accesses read from now on into a different memory window."""
+        with self._window_lock:
+            self._window = window
+
+    def pause(self):
+        self._running.clear()
+
+    def resume(self):
+        self._running.set()
+
+    def stop(self):
+        self._stopped.set()
+        self._running.set()
+
+    def poll(self):
+        """Return all finished updates merged into one, or None. Called from the Tk thread."""
+        with self._publish_lock:
+            return self._drain()
+
+    def poll_rebinned(self, window):
+        """Like poll, returns (update, counts). counts is None, or when the update was binned for another
+        window than window, (read_counts, write_counts) of window re-binned from the histogram instead.
+
+        Draining and re-binning happen under the lock updates are published with, so the re-binned counts hold
+        exactly the updates returned so far and an update is never counted both ways."""
+        with self._publish_lock:
+            update = self._drain()
+            if update is None or update.window == window:
+                return update, None
+            return update, self.histogram.rebin(window)
+
+    def _drain(self):
+        update = None
+        while True:
+            try:
+                newer = self.updates.get_nowait()
+            except queue.Empty:
+                return update
+            update = newer if update is None else merge_updates(update, newer)
+
+    def run(self):
+        while not self._stopped.is_set():
+            self._running.wait()
+            if self._stopped.is_set():
+                break
+            try:
+                chunk = self.reader.read()
+            except (OSError, ValueError) as e:
+                print(f"Error reading memory access log: {e}")
+                chunk = None
+            if chunk is not None and len(chunk[0]):
+                self._ingest(*chunk)
+                if not self.reader.backlog:
+                    print("Visualization is up to date with the end of the file.")
+            self._publish(None)  # Retry a pending update now the UI may have caught up
+            if self._unsaved_frames and time.monotonic() - self.frame_index.last_save > self.frame_index.save_interval:
+                self.save_index()
+            if not self.reader.backlog:
+                self._stopped.wait(self.poll_interval)
+        if self._unsaved_frames:
+            self.save_index()
+
+    def save_index(self):
+        """Persist the frame history to the frame index sidecar file."""
+        arrays = {"rom_counts": self.pc_totals}
+        if self.current_frame is not None:
+            # The frame still being read, as far as it got, so reopening carries on from where reading stopped
+            # wherever the frame started
+            arrays.update({
+                "frame_number": np.array([self.current_frame], dtype=np.int64),
+                "frame_read_counts": self._read_counts,
+                "frame_write_counts": self._write_counts,
+                "frame_pc_counts": self._pc_counts,
+                "frame_connections": self._this_frame_connections,
+                "previous_frame_connections": self._prev_frame_connections,
+            })
+        if self.histogram is not None:
+            # The histogram as it is, only this thread adds to it. Reopening adds the pending update it doesn't
+            # hold yet
+            arrays.update({f"histogram_{name}": array for name, array in self.histogram.to_arrays().items()})
+            arrays["histogram_pending"] = (
+                np.empty(0, dtype=ADDRESS_COUNT_DTYPE) if self._pending is None else self._pending.address_counts)
+        self.frame_index.save(self.reader, arrays)
+        self._unsaved_frames = False
+
+    def restore_index(self):
+        """Load the frame index sidecar file, returns the ROM box counts of everything read so far or None."""
+        arrays = self.frame_index.load(self.reader)
+        if arrays is None:
+            return None
+        self.pc_totals += arrays["rom_counts"]
+        if "frame_number" in arrays:
+            self.current_frame = int(arrays["frame_number"][0])
+            self._read_counts += arrays["frame_read_counts"]
+            self._write_counts += arrays["frame_write_counts"]
+            self._pc_counts += arrays["frame_pc_counts"]
+            self._this_frame_connections = np.array(arrays["frame_connections"])
+            self._prev_frame_connections = np.array(arrays["previous_frame_connections"])
+        if self.histogram is not None and "histogram_pages" in arrays:
+            self.histogram.restore({name: arrays[f"histogram_{name}"]
+                                    for name in ("pages", "counts", "wide_pages", "wide_counts")})
+            self.histogram.add(arrays["histogram_pending"])
+        return self.pc_totals + self._pc_counts
+
+    def _ingest(self, new_records, offsets):
+        with self._window_lock:
+            window = self._window
+
+        for frame, start, end in split_frames(new_records["frame"]):
+            frame_records = new_records[start:end]
+            if frame != self.current_frame:
+                if self.current_frame is not None:
+                    self._finish_frame()
+                self.current_frame = frame
+                if self.frame_index is not None:
+                    self.frame_index.add(frame, self.reader.generation, offsets[start])
+
+            # Count the memory accesses of this frame into their boxes in one go
+            read_counts, write_counts = count_accesses(frame_records, *window)
+            pc_counts = count_boxes(frame_records["pc"], *self.rom_window, weights=record_counts(frame_records))
+            accesses = address_counts(frame_records)
+            connections = unique_connections(frame_records)
+
+            if window == self.store_window:
+                store_read_counts, store_write_counts = read_counts, write_counts
+            else:
+                store_read_counts, store_write_counts = count_accesses(accesses, *self.store_window)
+
+            self._read_counts += store_read_counts
+            self._write_counts += store_write_counts
+            self._pc_counts += pc_counts
+            self._this_frame_connections = merge_connections(self._this_frame_connections, connections)
+            boxes = np.flatnonzero(read_counts | write_counts)
+            update = IngestUpdate(
+                frame, frame, window, read_counts, write_counts, boxes, accesses, pc_counts, connections)
+            self._delta = update if self._delta is None else merge_updates(self._delta, update)
+
+        # Publish the frame still being read as well, so the live view doesn't lag a frame behind
+        self._publish(self._delta)
+        self._delta = None
+
+    def _finish_frame(self):
+        # Store the current frame data before switching to the new frame
+        try:
+            self.frame_store.append(
+                self.current_frame, self._read_counts, self._write_counts,
+                new_connections(self._this_frame_connections, self._prev_frame_connections), self._pc_counts)
+        except ValueError as e:
+            print(f"Not storing frame {self.current_frame}: {e}")
+        self.pc_totals += self._pc_counts
+        self._unsaved_frames = self.frame_index is not None
+        self._read_counts[:] = 0
+        self._write_counts[:] = 0
+        self._pc_counts[:] = 0
+        self._prev_frame_connections = self._this_frame_connections
+        self._this_frame_connections = np.empty(0, dtype=CONNECTION_DTYPE)
+        self._publish(self._delta)
+        self._delta = None
+
+    def _publish(self, update):
+        if self._pending is not None:
+            update = self._pending if update is None else merge_updates(self._pending, update)
+        if update is None:
+            return
+        with self._publish_lock:
+            try:
+                self.updates.put_nowait(update)
+                self._pending = None
+            except queue.Full:
+                self._pending = update
+                return
+            if self.histogram is not None:
+                self.histogram.add(update.address_counts)
@@ -0,0 +1,147 @@
+"""The streaming instruction trace (instructions/trace-NNNNN.log), read a frame at a time.
+
+With instruction_trace = "stream", mem-file-sync.lua traces instructions into
+one continuous stream instead of restarting the trace into a new file every
+frame. Every line starts with frame=N and the stream is split into numbered
+segments as it grows, starting again from segment 1 every session.
+
+Frame numbers only go up through the stream, so the lines of a frame are found
+by bisecting on the frame number of the line at a byte offset: a few small
+reads per frame instead of scanning or indexing gigabytes of trace. Spans of
+frames that are over are remembered, which makes up the frame offset index.
+"""
+import os
+import threading
+
+FRAME_PREFIX = b"frame="
+PROBE_SIZE = 4096  # Bytes read at a time looking for the next line
+
+
+def segment_path(directory, segment):
+    return os.path.join(directory, f"trace-{segment:05d}.log")
+
+
+class InstructionTrace:
+    """The segments of the instruction trace in a directory.
+
+    A frame is read from the segment it starts in, and from the next ones as
+    long as it carries on into them. Safe to use from several threads."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._first_frames = []  # First frame of every segment found so far
+        self._spans = {}  # frame -> span of frames that are over
+
+    def exists(self):
+        """Whether the directory holds a streaming trace rather than a log per frame."""
+        return os.path.exists(segment_path(self.directory, 1))
+
+    def span(self, frame):
+        """The byte ranges holding the lines of frame, one after the other, as a tuple of (path, start, end).
+
+        One range, or more when the trace rotated to the next segment in the middle
+        of the frame. Raises FileNotFoundError if the frame wasn't traced."""
+        with self._lock:
+            span = self._spans.get(frame)
+            if span is not None:
+                return span
+            segments = self._segments()
+
+        # The frame starts in the last segment that starts before it, or else in the first one starting with it
+        segment = max((i for i in range(len(segments)) if segments[i] < frame), default=0)
+        parts = []
+        over = False
+        for segment in range(segment, len(segments)):
+            if segments[segment] > frame:
+                over = True  # The next segment starts with a later frame
+                break
+            path = segment_path(self.directory, segment + 1)
+            with open(path, "rb") as trace_file:
+                size = _complete_size(trace_file)
+                start = _first_line_from(trace_file, size, frame)
+                end = _first_line_from(trace_file, size, frame + 1, start)
+            if start < end:
+                parts.append((path, start, end))
+            if end < size:
+                over = True  # A later frame follows in this segment
+                break
+        if not parts:
+            raise FileNotFoundError(f"Frame {frame} is not in the instruction trace in {self.directory}")
+
+        span = tuple(parts)
+        if over:
+            with self._lock:
+                self._spans[frame] = span  # A later frame follows, so this one won't grow any more
+        return span
+
+    def _segments(self):
+        """First frame of every segment, finding the segments added since the last call."""
+        while True:
+            path = segment_path(self.directory, len(self._first_frames) + 1)
+            try:
+                with open(path, "rb") as trace_file:
+                    first_frame = _frame_at(trace_file, 0, _complete_size(trace_file))[0]
+            except FileNotFoundError:
+                break
+            if first_frame is None:
+                break  # Just started, nothing traced into it yet
+            self._first_frames.append(first_frame)
+        # A new session starts again from segment 1, the segments found before may be gone
+        if self._first_frames and not os.path.exists(segment_path(self.directory, 1)):
+            self._first_frames = []
+            self._spans = {}
+        return list(self._first_frames)
+
+
+def _complete_size(trace_file):
+    """Size of a segment up to the end of its last complete line."""
+    size = trace_file.seek(0, os.SEEK_END)
+    position = size
+    while position > 0:
+        read_start = max(position - PROBE_SIZE, 0)
+        trace_file.seek(read_start)
+        newline = trace_file.read(position - read_start).rfind(b"\n")
+        if newline >= 0:
+            return read_start + newline + 1
+        position = read_start
+    return 0
+
+
+def _frame_at(trace_file, position, size):
+    """(frame, offset) of the first frame line starting at or after position, or (None, size) if there is none."""
+    if position > 0:
+        # Skip the rest of the line position is in, unless it is at the start of one
+        trace_file.seek(position - 1)
+        while position < size:
+            block = trace_file.read(min(PROBE_SIZE, size - position + 1))
+            newline = block.find(b"\n")
+            if newline >= 0:
+                position += newline
+                break
+            position += len(block)
+    while position < size:
+        trace_file.seek(position)
+        line = trace_file.readline(PROBE_SIZE)
+        if line.startswith(FRAME_PREFIX):
+            digits = line[len(FRAME_PREFIX):].split(maxsplit=1)[0]
+            if digits.isdigit():
+                return int(digits), position
+        position += len(line)
+        if not line.endswith(b"\n"):
+            trace_file.readline()  # A line longer than PROBE_SIZE, skip the rest of it
+            position = trace_file.tell()
+    return None, size
+
+
+def _first_line_from(trace_file, size, frame, low=0):
+    """Offset of the first line at or after low of a frame at or after frame, size if there is none."""
+    high = size
+    while low < high:
+        middle = (low + high) // 2
+        found, offset = _frame_at(trace_file, middle, size)
+        if found is None or found >= frame:
+            high = middle
+        else:
+            low = offset + 1
+    return _frame_at(trace_file, low, size)[1]
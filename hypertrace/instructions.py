@@ -0,0 +1,266 @@
+"""Per-frame instruction logs (instructions/{frame}.log), parsed once and cached.
+
+Scrubbing the frame slider shows the same frames over and over, and each needs
+its own log and the previous frame's for the diff. InstructionCache reads and
+parses every log once and keeps the results of the most recently used frames
+within a memory budget.
+
+Instructions (the text after "--", PC and disassembly) are interned in an
+InstructionTable shared by all frames, so a parsed frame is a few integer
+arrays and diff_frames compares frames with array operations instead of
+hashing strings. The text itself isn't kept, only where each line starts, for
+line_index.LineIndex to read the lines shown from the file.
+
+Frames of a streaming instruction trace (see instruction_trace) are read from
+their span of the trace instead of a file of their own, which may run over
+into the next segment.
+"""
+import collections
+import os
+import threading
+
+import numpy as np
+
+from hypertrace.line_index import line_starts
+
+# A parsed log: its registers, and for every instruction line its line number, instruction id (see
+# InstructionTable) and PC (-1 if it has none). Then the PC values of all lines, the byte offset of every line
+# (see line_index.line_starts), the size of the file parsed and the approximate size of all this in memory. Last the
+# (path, start, end) byte ranges the lines are in, one after the other, set by InstructionCache
+ParsedFrame = collections.namedtuple(
+    "ParsedFrame",
+    "registers line_numbers instruction_ids instruction_pcs pc_values line_starts file_size nbytes parts",
+    defaults=(None,))
+
+# What a frame executed that the frame before it didn't: the line numbers and instruction ids of the instructions
+# not executed in the previous frame, the PCs and basic blocks (by the PC they start at) new in this frame, and
+# how many instructions the frame executed in total and how many distinct ones
+InstructionDiff = collections.namedtuple(
+    "InstructionDiff", "line_numbers instruction_ids new_pcs new_blocks total distinct")
+
+# Longest 68000 instruction in bytes, a PC further ahead than this can't be the next instruction
+MAX_INSTRUCTION_SIZE = 10
+
+
+class InstructionTable:
+    """Instruction strings interned as integer ids, shared by all frames so ids compare across frames."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ids = {}
+        self._strings = []
+
+    def __len__(self):
+        return len(self._strings)
+
+    def intern(self, instructions):
+        """Ids of a list of instruction strings as an int32 array, adding the ones not seen yet."""
+        with self._lock:
+            ids = self._ids
+            strings = self._strings
+            result = np.empty(len(instructions), dtype=np.int32)
+            for i, instruction in enumerate(instructions):
+                instruction_id = ids.get(instruction)
+                if instruction_id is None:
+                    instruction_id = ids[instruction] = len(strings)
+                    strings.append(instruction)
+                result[i] = instruction_id
+        return result
+
+    def strings(self, instruction_ids):
+        strings = self._strings
+        return [strings[i] for i in np.asarray(instruction_ids).tolist()]
+
+
+def extract_registers(instruction_lines):
+    """Extract register values from the instruction lines."""
+    registers = {}
+    for line in instruction_lines:
+        if "--" in line:
+            parts = line.split("--")[0].split()  # Take the part before the "--"
+            for part in parts:
+                if "=" in part:
+                    reg, value = part.split("=")
+                    if reg.startswith("D") or reg.startswith("A") or reg == "PC":
+                        registers[reg] = value.strip()
+    return registers
+
+
+def preprocess_instructions(instruction_lines):
+    """Preprocess instruction lines: remove 'frame=####' and extract instructions after '--'.
+
+    Returns the line numbers, the instructions and the PC of each (-1 if the line has none)."""
+    line_numbers = []
+    instructions = []
+    pcs = []
+    for line_number, line in enumerate(instruction_lines, start=1):
+        if "--" in line:
+            # Split on '--' and take the part after it, the PC is in the registers before it
+            registers, instruction = line.split("--", 1)
+            pc = -1
+            for part in registers.split():
+                if part.startswith("PC="):
+                    pc = int(part[3:], 16)
+            line_numbers.append(line_number)
+            instructions.append(instruction.strip())
+            pcs.append(pc)
+    return line_numbers, instructions, pcs
+
+
+def extract_pc_values(instruction_lines):
+    """PC values of the instruction lines as an int64 array."""
+    pc_values = []
+    for line in instruction_lines:
+        if "PC=" in line:
+            parts = line.split()
+            for part in parts:
+                if part.startswith("PC="):
+                    pc_values.append(int(part.split("=")[1], 16))  # Convert hexadecimal to integer
+    return np.array(pc_values, dtype=np.int64)
+
+
+def parse_frame(data, table):
+    """Parse the bytes of an instruction log into a ParsedFrame, interning its instructions in table."""
+    # Lines split the same way as line_starts does, so line numbers match the LineIndex of the file
+    lines = data.decode(errors="replace").split("\n")
+    line_numbers, instructions, pcs = preprocess_instructions(lines)
+    parsed = ParsedFrame(
+        extract_registers(lines), np.array(line_numbers, dtype=np.int32), table.intern(instructions),
+        np.array(pcs, dtype=np.int64), extract_pc_values(lines), line_starts(data), len(data), 0)
+    nbytes = sum(array.nbytes for array in parsed[1:6])
+    return parsed._replace(nbytes=nbytes)
+
+
+def read_parts(parts):
+    """The bytes of (path, start, end) byte ranges of files, one after the other."""
+    data = []
+    for path, start, end in parts:
+        with open(path, "rb") as instructions_file:
+            instructions_file.seek(start)
+            data.append(instructions_file.read(end - start))
+    return b"".join(data)
+
+
+def find_pc(parsed, pc):
+    """Line number of the first instruction at pc in a ParsedFrame, or None if the frame never ran it."""
+    found = np.flatnonzero(parsed.instruction_pcs == pc)
+    return int(parsed.line_numbers[found[0]]) if len(found) else None
+
+
+def block_starts(pcs):
+    """PCs at which the basic blocks executed in pcs (in execution order) start.
+
+    A block starts wherever the next PC isn't just ahead of the one before,
+    i.e. after a taken branch, jump, call or return. A branch over less than
+    MAX_INSTRUCTION_SIZE bytes looks like falling through and doesn't start one."""
+    pcs = pcs[pcs >= 0]
+    starts = np.ones(len(pcs), dtype=bool)
+    steps = np.diff(pcs)
+    starts[1:] = (steps <= 0) | (steps > MAX_INSTRUCTION_SIZE)
+    return np.unique(pcs[starts])
+
+
+def diff_frames(previous, current):
+    """InstructionDiff of the ParsedFrame current against previous (None when there is none)."""
+    if previous is None:
+        previous_ids = np.empty(0, dtype=np.int32)
+        previous_pcs = np.empty(0, dtype=np.int64)
+    else:
+        previous_ids = previous.instruction_ids
+        previous_pcs = previous.instruction_pcs
+
+    # Ids are small integers, so membership is a lookup in a table of the ids the previous frame ran
+    size = max(int(previous_ids.max(initial=-1)), int(current.instruction_ids.max(initial=-1))) + 1
+    seen = np.zeros(size, dtype=bool)
+    seen[previous_ids] = True
+    new = ~seen[current.instruction_ids]
+
+    current_pcs = current.instruction_pcs
+    return InstructionDiff(
+        current.line_numbers[new], current.instruction_ids[new],
+        np.setdiff1d(current_pcs[current_pcs >= 0], previous_pcs),
+        np.setdiff1d(block_starts(current_pcs), block_starts(previous_pcs)),
+        len(current.instruction_ids), len(np.unique(current.instruction_ids)))
+
+
+class InstructionCache:
+    """Parsed instruction logs of a directory, the least recently used evicted beyond max_bytes.
+
+    Instructions of all frames are interned in the same table.
+
+    With an instruction_trace.InstructionTrace, frames are read from the
+    streaming trace when there is one, from their own logs otherwise.
+
+    A log that changed on disk since it was parsed (the frame being traced
+    right now) is parsed again. Safe to use from several threads, a thread
+    asking for a log another one is parsing waits for that instead of parsing
+    it twice."""
+
+    def __init__(self, directory, max_bytes=256 * 1024 * 1024, trace=None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.trace = trace
+        self.table = InstructionTable()
+        self.nbytes = 0
+        self._lock = threading.Lock()
+        self._frames = collections.OrderedDict()  # frame -> (location, ParsedFrame), oldest use first
+        self._loading = {}  # frame -> Event set when the thread parsing it is done
+
+    def __len__(self):
+        return len(self._frames)
+
+    def __contains__(self, frame):
+        return frame in self._frames
+
+    def path(self, frame):
+        return os.path.join(self.directory, f"{frame}.log")
+
+    def location(self, frame):
+        """(parts, mtime) of the lines of a frame: the (path, start, end) byte ranges they are in and the log's
+        mtime. mtime is None for a span of the streaming trace, which never changes once the frame is over.
+        Raises FileNotFoundError."""
+        if self.trace is not None and self.trace.exists():
+            return self.trace.span(frame), None
+        stat = os.stat(self.path(frame))
+        return ((self.path(frame), 0, stat.st_size),), stat.st_mtime_ns
+
+    def get(self, frame):
+        """The ParsedFrame of a frame, read and parsed on first use. Raises FileNotFoundError."""
+        while True:
+            location = self.location(frame)
+            with self._lock:
+                entry = self._frames.get(frame)
+                if entry is not None and entry[0] == location:
+                    self._frames.move_to_end(frame)
+                    return entry[1]
+                loading = self._loading.get(frame)
+                if loading is None:
+                    loading = self._loading[frame] = threading.Event()
+                    break
+            loading.wait()
+
+        try:
+            parts, _ = location
+            parsed = parse_frame(read_parts(parts), self.table)._replace(parts=parts)
+            with self._lock:
+                self._discard(frame)
+                self._frames[frame] = (location, parsed)
+                self.nbytes += parsed.nbytes
+                # Evict the least recently used, but always keep the frame just parsed
+                while self.nbytes > self.max_bytes and len(self._frames) > 1:
+                    self._discard(next(iter(self._frames)))
+        finally:
+            with self._lock:
+                del self._loading[frame]
+            loading.set()
+        return parsed
+
+    def clear(self):
+        with self._lock:
+            self._frames.clear()
+            self.nbytes = 0
+
+    def _discard(self, frame):
+        entry = self._frames.pop(frame, None)
+        if entry is not None:
+            self.nbytes -= entry[1].nbytes
@@ -0,0 +1,79 @@
+"""Random access to the lines of a large text file through a memory map.
+
+A frame's instruction log can be tens of MB. Instead of reading it into a Text
+widget, LineIndex keeps only the byte offset of every line and reads the lines
+asked for straight from the memory-mapped file, so showing a page of a log
+costs the same whatever its size.
+"""
+import bisect
+import mmap
+import os
+
+import numpy as np
+
+
+def line_starts(data):
+    """Byte offset at which every line of data (bytes or a buffer) starts, in the smallest integer type that fits."""
+    newlines = np.flatnonzero(np.frombuffer(data, dtype=np.uint8) == ord("\n"))
+    starts = np.empty(len(newlines) + 1, dtype=np.min_scalar_type(len(data)))
+    starts[0] = 0
+    starts[1:] = newlines + 1
+    # No line after a final newline, and none at all in an empty file
+    if starts[-1] == len(data):
+        starts = starts[:-1]
+    return starts
+
+
+class LineIndex:
+    """The lines of a text file, only the ones asked for ever read into memory.
+
+    starts (from line_starts) and size can be given when the file was read
+    before, to skip scanning it. Lines past size, written since, are left out.
+    Instead of a path, the lines can be given as the (path, start, end) byte
+    ranges they are in, one after the other: a frame's span of a streaming
+    instruction trace (see instruction_trace)."""
+
+    def __init__(self, path, starts=None, size=None):
+        parts = [(path, 0, None)] if isinstance(path, str) else path
+        self.path = parts[0][0]
+        self._maps = []  # (memory map, offset of the part's lines in it, their size)
+        self._part_starts = []  # Offset in the lines at which every part starts
+        total = 0
+        for part_path, start, end in parts:
+            with open(part_path, "rb") as text_file:
+                file_size = os.fstat(text_file.fileno()).st_size
+                mapped = mmap.mmap(text_file.fileno(), 0, access=mmap.ACCESS_READ) if file_size else b""
+            part_size = max((file_size if end is None else min(end, file_size)) - start, 0)
+            self._maps.append((mapped, start, part_size))
+            self._part_starts.append(total)
+            total += part_size
+        self.size = total if size is None else min(size, total)
+        if starts is None:
+            data = b"".join(mapped[start:start + part_size] for mapped, start, part_size in self._maps)
+            starts = line_starts(data[:self.size])
+        self.starts = starts[starts < self.size] if len(starts) else starts
+
+    def __len__(self):
+        return len(self.starts)
+
+    def lines(self, start, stop):
+        """Lines start..stop-1 (0 based) as strings without their line endings."""
+        stop = min(stop, len(self.starts))
+        if start >= stop:
+            return []
+        offsets = self.starts[start:stop + 1].tolist()
+        if len(offsets) == stop - start:
+            offsets.append(self.size)  # The last line runs to the end of the file
+        lines = []
+        for begin, end in zip(offsets[:-1], offsets[1:]):
+            # Parts end with whole lines, so a line is all in the part it starts in
+            part = bisect.bisect_right(self._part_starts, begin) - 1
+            mapped, offset, _ = self._maps[part]
+            offset -= self._part_starts[part]
+            lines.append(mapped[offset + begin:offset + end].rstrip(b"\r\n").decode(errors="replace"))
+        return lines
+
+    def close(self):
+        for mapped, _, _ in self._maps:
+            if isinstance(mapped, mmap.mmap):
+                mapped.close()
@@ -0,0 +1,166 @@
+"""Incremental reading of the memory access log written by mem-file-sync.lua.
+
+mem-file-sync.lua rolls the log over by renaming memory_access.log to
+memory_access.log.backup and starting a new file. LogStream reads the backup and
+the log as one continuous stream. It recognises the file it was reading by its
+first bytes, so when that file turns up as .backup it finishes the tail there
+before moving on to the new log, and no record is lost or counted twice.
+
+Every file in the stream gets a generation number, incremented at each rollover,
+so (generation, offset) addresses a record for as long as it is on disk.
+"""
+import mmap
+import os
+
+from hypertrace import records
+
+SIGNATURE_SIZE = 256
+
+
+def read_head(path, size=SIGNATURE_SIZE):
+    """The first size bytes of a file, or None if it can't be read."""
+    try:
+        with open(path, "rb") as log_file:
+            return log_file.read(size)
+    except OSError:
+        return None
+
+
+def read_session(path, max_read_bytes=16 * 1024 * 1024):
+    """Yield the records of a finished trace as arrays, memory_access.log.backup (if it is still there) first."""
+    for session_path in (path + ".backup", path):
+        if not os.path.exists(session_path):
+            continue
+        reader = LogStream(session_path, max_read_bytes)
+        while True:
+            chunk = reader.read()
+            if chunk is not None and len(chunk[0]):
+                yield chunk[0]
+            elif not reader.backlog:
+                break
+
+
+class LogStream:
+    """Reads the complete records appended to memory_access.log, following rollovers.
+
+    Files are memory-mapped only while a chunk is being decoded. The records are
+    copied out and the mapping closed before read returns, so the emulator is free
+    to rename the files.
+    """
+
+    def __init__(self, path, max_read_bytes=16 * 1024 * 1024):
+        self.path = path
+        self.backup_path = path + ".backup"
+        self.max_read_bytes = max_read_bytes  # Read in chunks so one call never takes too long
+        self.position = 0
+        self.generation = 0  # Incremented every time the log rolls over to a new file
+        self.log_format = None  # Detected from the first bytes of the log, CSV or binary
+        self.backlog = False  # True while there is more unread data than one chunk
+        self.signature = b""  # First bytes of the file being read, to recognise it after a rename
+        self._current_path = path
+
+    def resume(self, log_format, generation, position, signature):
+        """Continue from a previously saved position.
+
+        Returns False if neither the log nor its backup is the file the position belongs to."""
+        for path in (self.path, self.backup_path):
+            if self._is_current_file(path, signature, position):
+                self.log_format = log_format
+                self.generation = generation
+                self.position = position
+                self.signature = signature
+                self._current_path = path
+                if path == self.backup_path:
+                    print("Log rolled over since the last session, finishing the previous file from .backup")
+                return True
+        return False
+
+    def read(self):
+        """Return (records, offsets) appended since the last call, or None if there is nothing new.
+
+        offsets holds the byte offset of every record in the file of the current generation."""
+        path = self._locate()
+        if path is None:
+            return None
+
+        with open(path, "rb") as log_file:
+            size = os.fstat(log_file.fileno()).st_size
+            if self.log_format is None:
+                # Binary and summary logs start with a header, anything else is the original CSV format
+                head = log_file.read(records.HEADER.size)
+                self.log_format = records.detect_format(head)
+                if self.log_format is None:
+                    return None  # File has only just been created
+                if records.has_header(self.log_format):
+                    if len(head) < records.HEADER.size:
+                        self.log_format = None
+                        return None
+                    records.parse_header(head, self.log_format)
+                    self.position = records.HEADER.size
+                print(f"Reading {self.log_format} memory access log")
+
+            if size <= self.position:
+                self.backlog = False
+                if path == self.backup_path:
+                    # Finished the renamed file, carry on with the new log
+                    self._next_file()
+                    return self.read()
+                return None
+
+            mapped = mmap.mmap(log_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        # Closed before returning, a file that is still mapped can't be renamed on Windows
+        with mapped:
+            if len(self.signature) < SIGNATURE_SIZE:
+                self.signature = mapped[:SIGNATURE_SIZE]
+            end = min(size, self.position + self.max_read_bytes)
+            self.backlog = end < size
+            with memoryview(mapped) as view, view[self.position:end] as data:
+                new_records, offsets, consumed = records.decode(data, self.log_format)
+                if new_records.base is not None:
+                    new_records = new_records.copy()  # Binary records are views of the mapping
+        offsets += self.position
+        self.position += consumed  # Update the position for the next read
+
+        if path == self.backup_path and not self.backlog:
+            # Whatever is left after the last whole record will never be completed
+            self.backlog = True
+            self.position = size
+        return new_records, offsets
+
+    def _is_current_file(self, path, signature, position):
+        """Whether path is the file we were reading: it starts with the same bytes and is long enough."""
+        head = read_head(path, len(signature)) if signature else read_head(path, 1)
+        if head is None or (signature and head != signature):
+            return False
+        return os.path.getsize(path) >= position
+
+    def _locate(self):
+        """Path of the file holding the next records, following a rollover."""
+        if self._current_path == self.backup_path:
+            if os.path.exists(self.backup_path):
+                return self.backup_path
+            print("The previous log was removed before it could be read to the end, some accesses were missed.")
+            self._next_file()
+
+        if self._is_current_file(self.path, self.signature, self.position):
+            return self.path
+        if not os.path.exists(self.path) and not os.path.exists(self.backup_path):
+            return None
+        if self.signature and self._is_current_file(self.backup_path, self.signature, self.position):
+            print("Log rollover detected, finishing the previous file from .backup")
+            self._current_path = self.backup_path
+            return self.backup_path
+        if not os.path.exists(self.path):
+            return None  # The emulator is in the middle of renaming, the new log isn't there yet
+
+        print("Log rollover detected, but the previous file is gone, some accesses were missed.")
+        self._next_file()
+        return self.path
+
+    def _next_file(self):
+        self.generation += 1
+        self.position = 0
+        self.log_format = None
+        self.signature = b""
+        self._current_path = self.path
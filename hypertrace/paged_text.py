@@ -0,0 +1,62 @@
+"""A Text widget that pages through any number of lines without holding them all."""
+
+
+class PagedText:
+    """Shows a long list of lines in a Text widget a page at a time.
+
+    Only the lines in view are inserted into the widget, fetched with
+    get_lines(start, stop) whenever the view moves, so showing millions of
+    lines costs the same as showing a page of them. The optional vertical
+    scrollbar and the mouse wheel scroll over the whole list."""
+
+    def __init__(self, text, scrollbar=None, page_size=None):
+        self.text = text
+        self.scrollbar = scrollbar
+        self.page_size = page_size or int(text.cget("height"))
+        self.first = 0  # Index of the top line in view
+        self.num_lines = 0
+        self.get_lines = lambda start, stop: []
+        if scrollbar is not None:
+            scrollbar.config(command=self.yview)
+        text.bind("<MouseWheel>", self._on_wheel)
+        text.bind("<Button-4>", self._on_wheel)
+        text.bind("<Button-5>", self._on_wheel)
+
+    def show(self, num_lines, get_lines, first=0):
+        """Page through num_lines lines, get_lines(start, stop) returning the strings of lines start..stop-1."""
+        self.num_lines = num_lines
+        self.get_lines = get_lines
+        self.first = None
+        self.scroll_to(first)
+
+    def show_lines(self, lines):
+        """Page through a list of strings."""
+        self.show(len(lines), lambda start, stop: lines[start:stop])
+
+    def scroll_to(self, line):
+        """Put line at the top of the view (as far as the end of the list allows)."""
+        first = max(0, min(line, self.num_lines - self.page_size))
+        if first != self.first:
+            self.first = first
+            self._render()
+
+    def yview(self, *args):
+        """Scrollbar command: ("moveto", fraction) or ("scroll", amount, "units" or "pages")."""
+        if args[0] == "moveto":
+            self.scroll_to(int(float(args[1]) * self.num_lines))
+        elif args[0] == "scroll":
+            amount = int(args[1]) * (self.page_size if args[2] == "pages" else 1)
+            self.scroll_to(self.first + amount)
+
+    def _on_wheel(self, event):
+        up = event.num == 4 or getattr(event, "delta", 0) > 0
+        self.scroll_to(self.first + (-3 if up else 3))
+        return "break"  # Don't let the Text widget scroll its own contents
+
+    def _render(self):
+        lines = self.get_lines(self.first, min(self.first + self.page_size, self.num_lines))
+        self.text.delete("1.0", "end")
+        self.text.insert("end", "\n".join(lines))
+        if self.scrollbar is not None:
+            total = max(self.num_lines, 1)
+            self.scrollbar.set(self.first / total, min((self.first + self.page_size) / total, 1))
@@ -0,0 +1,234 @@
+"""Headless queries and reports over a HyperTrace, the counting the vizualiser does without a display.
+
+A trace is a memory_access.log (read after its .backup) or a store made by
+trace_store. query() streams its records a chunk at a time through an
+AccessFilter, and the aggregators group what gets through by memory box, by PC
+or by frame. Only the counts are kept, so memory use doesn't grow with the size
+of the trace. write_reports() runs them all in one pass and writes heatmaps,
+hot PC tables and per-frame stats, which is what python3 -m hypertrace does.
+"""
+import csv
+import os
+from collections import namedtuple
+
+import numpy as np
+from PIL import Image
+
+from hypertrace import heatmap
+from hypertrace.ingest import BoxWindow, box_indices, count_accesses, split_frames
+from hypertrace.log_stream import read_session
+from hypertrace.records import ACCESS_WRITE, record_counts
+from hypertrace.trace_store import STORE_FILE, TraceStore
+
+# The address spaces the vizualiser shows
+MEMORY_SIZE = 16 * 1024 * 1024
+ROM_SIZE = 1 * 1024 * 1024
+
+# Which accesses to keep, None leaves that field unfiltered. Frame ranges include last_frame, address and
+# PC ranges exclude their end, access_type is records.ACCESS_READ or ACCESS_WRITE
+AccessFilter = namedtuple(
+    "AccessFilter", "first_frame last_frame address_start address_end pc_start pc_end access_type",
+    defaults=(None,) * 7)
+
+
+def read_trace(path, first_frame=None, last_frame=None):
+    """Yield the records of a trace a chunk at a time, starting at first_frame and stopping after last_frame.
+
+    path is a trace store directory, of which only the chunks of those frames are
+    read, or a memory_access.log."""
+    if os.path.isfile(os.path.join(path, STORE_FILE)):
+        store = TraceStore(path)
+        yield from store.iter_records(*store.frame_range(first_frame, last_frame))
+        return
+    for recs in read_session(path):
+        if last_frame is not None and recs["frame"][0] > last_frame:
+            break  # Frames only go up, the rest of the log is later still
+        yield recs
+
+
+def filter_mask(recs, access_filter):
+    """Boolean mask of the records that pass an AccessFilter."""
+    f = access_filter
+    keep = np.ones(len(recs), dtype=bool)
+    if f.first_frame is not None:
+        keep &= recs["frame"] >= f.first_frame
+    if f.last_frame is not None:
+        keep &= recs["frame"] <= f.last_frame
+    if f.address_start is not None:
+        keep &= recs["address"] >= f.address_start
+    if f.address_end is not None:
+        keep &= recs["address"] < f.address_end
+    if f.pc_start is not None:
+        keep &= recs["pc"] >= f.pc_start
+    if f.pc_end is not None:
+        keep &= recs["pc"] < f.pc_end
+    if f.access_type is not None:
+        keep &= recs["type"] == f.access_type
+    return keep
+
+
+def query(path, access_filter=AccessFilter()):
+    """Yield the records of a trace that pass access_filter, a chunk at a time."""
+    for recs in read_trace(path, access_filter.first_frame, access_filter.last_frame):
+        recs = recs[filter_mask(recs, access_filter)]
+        if len(recs):
+            yield recs
+
+
+class BoxCounts:
+    """Reads and writes per box of an ingest.BoxWindow."""
+
+    header = ("box", "address", "reads", "writes")
+
+    def __init__(self, window):
+        self.window = window
+        self.read_counts = np.zeros(window.num_boxes, dtype=np.int64)
+        self.write_counts = np.zeros(window.num_boxes, dtype=np.int64)
+
+    def add(self, recs):
+        read_counts, write_counts = count_accesses(recs, *self.window)
+        self.read_counts += read_counts
+        self.write_counts += write_counts
+
+    def rows(self):
+        """(box, first address, reads, writes) of every box with any accesses."""
+        boxes = np.flatnonzero(self.read_counts + self.write_counts)
+        addresses = self.window.start + boxes * self.window.box_size
+        return zip(boxes.tolist(), map(hex, addresses.tolist()), self.read_counts[boxes].tolist(),
+                   self.write_counts[boxes].tolist())
+
+    def colors(self):
+        """Box colors, as the vizualiser's memory grid shows them."""
+        max_accesses = int((self.read_counts + self.write_counts).max())
+        read_gradient, write_gradient = heatmap.memory_gradients()
+        return heatmap.memory_colors(self.read_counts, self.write_counts, heatmap.color_scale(max_accesses),
+                                     read_gradient, write_gradient)
+
+
+class PcCounts:
+    """Reads and writes made by every PC."""
+
+    header = ("pc", "reads", "writes", "accesses")
+
+    def __init__(self):
+        self.pcs = np.zeros(0, dtype=np.uint32)
+        self.read_counts = np.zeros(0, dtype=np.int64)
+        self.write_counts = np.zeros(0, dtype=np.int64)
+
+    def add(self, recs):
+        # Merge the counts so far with the new records
+        counts = record_counts(recs)
+        counts = np.ones(len(recs), dtype=np.int64) if counts is None else counts
+        is_write = recs["type"] == ACCESS_WRITE
+        read_weights = np.concatenate([self.read_counts, np.where(is_write, 0, counts)])
+        write_weights = np.concatenate([self.write_counts, np.where(is_write, counts, 0)])
+        self.pcs, inverse = np.unique(np.concatenate([self.pcs, recs["pc"]]), return_inverse=True)
+        inverse = inverse.ravel()
+        self.read_counts = np.bincount(inverse, weights=read_weights, minlength=len(self.pcs)).astype(np.int64)
+        self.write_counts = np.bincount(inverse, weights=write_weights, minlength=len(self.pcs)).astype(np.int64)
+
+    def rows(self, top=None):
+        """(pc, reads, writes, accesses) of the PCs with the most accesses first, the top ones only if given."""
+        accesses = self.read_counts + self.write_counts
+        order = np.argsort(-accesses, kind="stable")[:top]
+        return zip(map(hex, self.pcs[order].tolist()), self.read_counts[order].tolist(),
+                   self.write_counts[order].tolist(), accesses[order].tolist())
+
+    def box_counts(self, window):
+        """Accesses per box of an ingest.BoxWindow over the PCs, the vizualiser's ROM grid."""
+        boxes = box_indices(self.pcs, *window)
+        valid = boxes >= 0
+        accesses = self.read_counts + self.write_counts
+        return np.bincount(boxes[valid], weights=accesses[valid], minlength=window.num_boxes).astype(np.int64)
+
+
+class FrameStats:
+    """Reads, writes and the number of distinct PCs and addresses of every frame."""
+
+    header = ("frame", "reads", "writes", "pcs", "addresses")
+
+    def __init__(self):
+        self._rows = []
+        self._frame = None  # The frame being counted, it may carry on in the next chunk
+        self._reads = self._writes = 0
+        self._pcs = self._addresses = np.zeros(0, dtype=np.uint32)
+
+    def add(self, recs):
+        for frame, start, end in split_frames(recs["frame"]):
+            if frame != self._frame:
+                self._finish_frame()
+                self._frame = frame
+            frame_recs = recs[start:end]
+            counts = record_counts(frame_recs)
+            is_write = frame_recs["type"] == ACCESS_WRITE
+            if counts is None:
+                writes, accesses = int(np.count_nonzero(is_write)), len(frame_recs)
+            else:
+                writes, accesses = int(counts[is_write].sum()), int(counts.sum())
+            self._writes += writes
+            self._reads += accesses - writes
+            self._pcs = np.union1d(self._pcs, frame_recs["pc"])
+            self._addresses = np.union1d(self._addresses, frame_recs["address"])
+
+    def rows(self):
+        self._finish_frame()
+        return self._rows
+
+    def _finish_frame(self):
+        if self._frame is not None:
+            self._rows.append((self._frame, self._reads, self._writes, len(self._pcs), len(self._addresses)))
+        self._frame = None
+        self._reads = self._writes = 0
+        self._pcs = self._addresses = np.zeros(0, dtype=np.uint32)
+
+
+def write_csv(path, header, rows):
+    with open(path, "w", newline="") as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(header)
+        writer.writerows(rows)
+
+
+def save_heatmap(path, colors, grid_size=100, box_pixels=5):
+    """Save box colors as a PNG grid like the vizualiser's, grid_size boxes wide of box_pixels each."""
+    Image.fromarray(heatmap.grid_pixels(colors, grid_size, box_pixels, box_pixels)).save(path)
+
+
+def write_reports(path, output_dir, access_filter=AccessFilter(), num_boxes=10000, grid_size=100, top=100):
+    """Write the memory and ROM heatmaps (PNG and CSV), the top PCs and the per-frame stats of a trace.
+
+    The memory heatmap covers the filter's address range, the ROM one its PC range,
+    each split into num_boxes boxes like the vizualiser's grids. Returns the paths written."""
+    memory_start = access_filter.address_start or 0
+    memory_end = access_filter.address_end or MEMORY_SIZE
+    rom_start = access_filter.pc_start or 0
+    rom_end = access_filter.pc_end or ROM_SIZE
+    memory = BoxCounts(BoxWindow(memory_start, max((memory_end - memory_start) // num_boxes, 1), num_boxes))
+    pcs = PcCounts()
+    frames = FrameStats()
+    for recs in query(path, access_filter):
+        memory.add(recs)
+        pcs.add(recs)
+        frames.add(recs)
+
+    os.makedirs(output_dir, exist_ok=True)
+    paths = [os.path.join(output_dir, name) for name in (
+        "memory_heatmap.csv", "memory_heatmap.png", "rom_heatmap.csv", "rom_heatmap.png", "hot_pcs.csv", "frames.csv")]
+    write_csv(paths[0], memory.header, memory.rows())
+    save_heatmap(paths[1], memory.colors(), grid_size)
+    rom_window = BoxWindow(rom_start, max((rom_end - rom_start) // num_boxes, 1), num_boxes)
+    rom_counts = pcs.box_counts(rom_window)
+    rom_boxes = np.flatnonzero(rom_counts)
+    write_csv(paths[2], ("box", "address", "accesses"),
+              zip(rom_boxes.tolist(), map(hex, (rom_start + rom_boxes * rom_window.box_size).tolist()),
+                  rom_counts[rom_boxes].tolist()))
+    save_heatmap(paths[3], heatmap.rom_colors(rom_counts), grid_size)
+    write_csv(paths[4], pcs.header, pcs.rows(top))
+    write_csv(paths[5], frames.header, frames.rows())
+    return paths
+
+
+def parse_range(text):
+    """ "START:END" (decimal or 0x hex, either side may be empty) to a (start, end) tuple of ints or None."""
+    start, _, end = text.partition(":")
+    return (int(start, 0) if start else None), (int(end, 0) if end else None)
@@ -0,0 +1,245 @@
+"""Memory access record formats written by mem-file-sync.lua.
+
+Four layouts exist:
+
+- CSV (the original format), one "frame,R|W,address,value,size,pc,mask" line per
+  access with everything except frame and size in hex.
+- Binary, a 16 byte file header followed by fixed size little endian records.
+- Summary, the same kind of header followed by one block per frame counting the
+  frame's accesses per (PC, address, type) instead of listing them.
+- Packed, the same kind of header followed by one block per frame holding the
+  frame's distinct records once each and, per access, the index of its record.
+
+CSV, binary and packed logs decode into the same NumPy structured array
+(RECORD_DTYPE), so the viewer has a single code path once the bytes are parsed.
+Summaries decode into COUNTED_RECORD_DTYPE, the same fields plus the number of
+accesses each record stands for (see record_counts).
+"""
+import struct
+
+import numpy as np
+
+FORMAT_CSV = "csv"
+FORMAT_BINARY = "binary"
+FORMAT_SUMMARY = "summary"
+FORMAT_PACKED = "packed"
+
+# Binary file header: magic, version, record size, flags, 4 reserved bytes
+BINARY_MAGIC = b"HTRC"
+BINARY_VERSION = 1
+HEADER = struct.Struct("<4sHHI4x")
+# Summary files have the same header with their own magic
+SUMMARY_MAGIC = b"HTSM"
+SUMMARY_VERSION = 1
+PACKED_MAGIC = b"HTPK"
+PACKED_VERSION = 1
+
+ACCESS_READ = 0
+ACCESS_WRITE = 1
+ACCESS_TYPES = {b"R": ACCESS_READ, b"W": ACCESS_WRITE}
+ACCESS_CHARS = "RW"
+
+# Must match string.pack("<I4BBI2I4I4I4I4", ...) in mem-file-sync.lua
+RECORD_DTYPE = np.dtype([
+    ("frame", "<u4"),
+    ("type", "u1"),
+    ("size", "u1"),
+    ("reserved", "<u2"),
+    ("address", "<u4"),
+    ("value", "<u4"),
+    ("pc", "<u4"),
+    ("mask", "<u4"),
+])
+
+# A summary block starts with the frame number and the number of entries that follow
+SUMMARY_BLOCK = struct.Struct("<II")
+# Must match string.pack("<I4I4BBI2I4", ...) in mem-file-sync.lua
+SUMMARY_ENTRY_DTYPE = np.dtype([
+    ("pc", "<u4"),
+    ("address", "<u4"),
+    ("type", "u1"),
+    ("reserved1", "u1"),
+    ("reserved", "<u2"),
+    ("count", "<u4"),
+])
+
+# A packed block starts with the frame number, the number of accesses and the number of distinct records in it.
+# The distinct records follow, then the index of every access's record: u2, or u4 when there are more than 0xFFFF
+PACKED_BLOCK = struct.Struct("<III")
+# Must match string.pack("<BBI2I4I4I4I4", ...) in mem-file-sync.lua, a RECORD_DTYPE record without the frame
+PACKED_RECORD_DTYPE = np.dtype([(name, RECORD_DTYPE.fields[name][0]) for name in RECORD_DTYPE.names[1:]])
+
+# Records decoded from a summary, each standing for count accesses. value, size and mask are 0
+COUNTED_RECORD_DTYPE = np.dtype(RECORD_DTYPE.descr + [("count", "<u4")])
+
+# File header magic and record size of each binary format
+_HEADERS = {
+    FORMAT_BINARY: (BINARY_MAGIC, BINARY_VERSION, RECORD_DTYPE.itemsize),
+    FORMAT_SUMMARY: (SUMMARY_MAGIC, SUMMARY_VERSION, SUMMARY_ENTRY_DTYPE.itemsize),
+    FORMAT_PACKED: (PACKED_MAGIC, PACKED_VERSION, PACKED_RECORD_DTYPE.itemsize),
+}
+
+
+def record_counts(records):
+    """Number of accesses every record stands for: None when that is one each, as in CSV and binary logs."""
+    return records["count"] if "count" in records.dtype.names else None
+
+
+def detect_format(head):
+    """Guess the log format from the first bytes of the file.
+
+    Returns None while the file is too short to tell (the emulator has only just
+    created it)."""
+    head = bytes(head[:len(BINARY_MAGIC)])
+    for log_format, (magic, _, _) in _HEADERS.items():
+        if head == magic:
+            return log_format
+    if any(magic.startswith(head) for magic, _, _ in _HEADERS.values()):
+        return None
+    return FORMAT_CSV
+
+
+def has_header(log_format):
+    """Whether files of this format start with a HEADER."""
+    return log_format in _HEADERS
+
+
+def pack_header(flags=0, log_format=FORMAT_BINARY):
+    """Build the header that starts every binary, summary or packed log file."""
+    magic, version, record_size = _HEADERS[log_format]
+    return HEADER.pack(magic, version, record_size, flags)
+
+
+def parse_header(data, log_format=FORMAT_BINARY):
+    """Validate a binary, summary or packed log header and return (version, record_size, flags)."""
+    if len(data) < HEADER.size:
+        raise ValueError("Binary log header is truncated")
+    expected_magic, expected_version, expected_size = _HEADERS[log_format]
+    magic, version, record_size, flags = HEADER.unpack_from(data)
+    if magic != expected_magic:
+        raise ValueError(f"Not a HyperTrace {log_format} log (magic {magic!r})")
+    if version != expected_version:
+        raise ValueError(f"Unsupported HyperTrace {log_format} log version {version}")
+    if record_size != expected_size:
+        raise ValueError(f"Unexpected record size {record_size}, expected {expected_size}")
+    return version, record_size, flags
+
+
+def decode_binary(data):
+    """Decode all whole records in data. Returns (records, offsets, bytes consumed).
+
+    offsets holds the byte offset of every record within data. The records are a
+    read-only view onto data, nothing is copied."""
+    count = len(data) // RECORD_DTYPE.itemsize
+    records = np.frombuffer(data, dtype=RECORD_DTYPE, count=count)
+    offsets = np.arange(count, dtype=np.int64) * RECORD_DTYPE.itemsize
+    return records, offsets, count * RECORD_DTYPE.itemsize
+
+
+def decode_csv(data):
+    """Decode all complete CSV lines in data. Returns (records, offsets, bytes consumed).
+
+    offsets holds the byte offset of every decoded line within data. A trailing
+    partial line (still being written by the emulator) is not consumed."""
+    data = bytes(data)
+    end = data.rfind(b"\n") + 1
+    rows = []
+    offsets = []
+    offset = 0
+    for line in data[:end].splitlines(keepends=True):
+        line_offset = offset
+        offset += len(line)
+        parts = line.strip().split(b",")
+        # Only parse lines with exactly 7 parts
+        if len(parts) != 7:
+            continue
+        try:
+            rows.append((
+                int(parts[0]),
+                ACCESS_TYPES[parts[1]],
+                int(parts[4]),
+                0,
+                int(parts[2], 16) & 0xFFFFFFFF,
+                int(parts[3], 16) & 0xFFFFFFFF,
+                int(parts[5], 16) & 0xFFFFFFFF,
+                int(parts[6], 16) & 0xFFFFFFFF,
+            ))
+            offsets.append(line_offset)
+        except (ValueError, KeyError) as e:
+            print(f"Error processing line '{line}': {e}")
+    return np.array(rows, dtype=RECORD_DTYPE), np.array(offsets, dtype=np.int64), end
+
+
+def decode_summary(data):
+    """Decode all whole frame blocks in data. Returns (records, offsets, bytes consumed).
+
+    Records are COUNTED_RECORD_DTYPE. All records of a block get the offset of the
+    block, the place to start reading that frame again."""
+    blocks = []
+    position = 0
+    while position + SUMMARY_BLOCK.size <= len(data):
+        frame, count = SUMMARY_BLOCK.unpack_from(data, position)
+        end = position + SUMMARY_BLOCK.size + count * SUMMARY_ENTRY_DTYPE.itemsize
+        if end > len(data):
+            break  # The emulator is still writing this block
+        entries = np.frombuffer(data, dtype=SUMMARY_ENTRY_DTYPE, count=count, offset=position + SUMMARY_BLOCK.size)
+        blocks.append((frame, position, entries))
+        position = end
+
+    records = np.zeros(sum(len(entries) for _, _, entries in blocks), dtype=COUNTED_RECORD_DTYPE)
+    offsets = np.empty(len(records), dtype=np.int64)
+    start = 0
+    for frame, block_offset, entries in blocks:
+        end = start + len(entries)
+        records["frame"][start:end] = frame
+        for field in ("type", "address", "pc", "count"):
+            records[field][start:end] = entries[field]
+        offsets[start:end] = block_offset
+        start = end
+    return records, offsets, position
+
+
+def decode_packed(data):
+    """Decode all whole frame blocks in data. Returns (records, offsets, bytes consumed).
+
+    Every access is its block's record looked up by index, a single gather per
+    block. All records of a block get the offset of the block, like summaries."""
+    blocks = []
+    position = 0
+    while position + PACKED_BLOCK.size <= len(data):
+        frame, count, num_distinct = PACKED_BLOCK.unpack_from(data, position)
+        index_dtype = np.dtype("<u2") if num_distinct <= 0xFFFF else np.dtype("<u4")
+        indices_offset = position + PACKED_BLOCK.size + num_distinct * PACKED_RECORD_DTYPE.itemsize
+        end = indices_offset + count * index_dtype.itemsize
+        if end > len(data):
+            break  # The emulator is still writing this block
+        distinct = np.frombuffer(data, dtype=PACKED_RECORD_DTYPE, count=num_distinct,
+                                 offset=position + PACKED_BLOCK.size)
+        indices = np.frombuffer(data, dtype=index_dtype, count=count, offset=indices_offset)
+        blocks.append((frame, position, distinct, indices))
+        position = end
+
+    records = np.empty(sum(len(indices) for _, _, _, indices in blocks), dtype=RECORD_DTYPE)
+    offsets = np.empty(len(records), dtype=np.int64)
+    start = 0
+    for frame, block_offset, distinct, indices in blocks:
+        frame_records = np.empty(len(distinct), dtype=RECORD_DTYPE)
+        frame_records["frame"] = frame
+        for field in PACKED_RECORD_DTYPE.names:
+            frame_records[field] = distinct[field]
+        end = start + len(indices)
+        np.take(frame_records, indices, out=records[start:end])
+        offsets[start:end] = block_offset
+        start = end
+    return records, offsets, position
+
+
+def decode(data, log_format):
+    """Decode data in the given format. Returns (records, offsets, bytes consumed)."""
+    if log_format == FORMAT_BINARY:
+        return decode_binary(data)
+    if log_format == FORMAT_SUMMARY:
+        return decode_summary(data)
+    if log_format == FORMAT_PACKED:
+        return decode_packed(data)
+    return decode_csv(data)
@@ -0,0 +1,167 @@
+"""Frame screenshots (snap/frames/{frame:05d}.png), decoded and resized once.
+
+Frame-By-Frame mode shows every screenshot at the same size. ScreenshotCache
+resizes each PNG once and keeps the results of the most recently used frames
+within a memory budget. While scrubbing, a quick bilinear resize is good
+enough; once the slider settles the frame is resized again with LANCZOS, and
+that sharp version replaces the quick one.
+
+Sharp screenshots can also be kept in a ThumbnailAtlas, a file next to the
+PNGs that packs them as raw pixels, so the next session gets them with a
+memory-mapped read instead of decoding and resizing again.
+"""
+import collections
+import os
+import struct
+import threading
+
+import numpy as np
+from PIL import Image
+
+ATLAS_MAGIC = b"HTTA"
+ATLAS_VERSION = 1
+# magic, version, tile width, tile height
+_ATLAS_HEADER = struct.Struct("<4sHxxII")
+
+QUICK_FILTER = Image.Resampling.BILINEAR
+SHARP_FILTER = Image.Resampling.LANCZOS
+
+
+class ThumbnailAtlas:
+    """Screenshots of one size packed into a single file, read back by memory-mapping it.
+
+    Tiles are appended as (frame, PNG modification time, raw RGB pixels). A tile
+    is only used while the PNG it was made from is unchanged, and a later tile
+    for the same frame replaces an earlier one."""
+
+    def __init__(self, path, size):
+        self.path = path
+        self.size = size
+        width, height = size
+        self.dtype = np.dtype([("frame", "<i8"), ("mtime", "<i8"), ("pixels", "u1", (height, width, 3))])
+        self._lock = threading.Lock()
+        self._positions = {}  # frame -> index of its latest tile
+        self._tiles = None  # Memory map of the tiles, re-opened when tiles were added past its end
+        self._count = 0
+        self._open()
+
+    def __len__(self):
+        return len(self._positions)
+
+    def get(self, frame, mtime):
+        """The tile of a frame as a PIL image, or None if there is none for this version of its PNG."""
+        with self._lock:
+            position = self._positions.get(frame)
+            if position is None:
+                return None
+            if self._tiles is None or position >= len(self._tiles):
+                self._tiles = np.memmap(self.path, dtype=self.dtype, mode="r", offset=_ATLAS_HEADER.size,
+                                        shape=(self._count,))
+            tile = self._tiles[position]
+            if tile["mtime"] != mtime:
+                return None
+            return Image.fromarray(np.array(tile["pixels"]))
+
+    def add(self, frame, mtime, image):
+        tile = np.zeros(1, dtype=self.dtype)
+        tile["frame"] = frame
+        tile["mtime"] = mtime
+        tile["pixels"] = np.asarray(image.convert("RGB"))
+        with self._lock:
+            try:
+                with open(self.path, "ab") as atlas_file:
+                    atlas_file.write(tile.tobytes())
+            except OSError as e:
+                print(f"Unable to add frame {frame} to thumbnail atlas {self.path}: {e}")
+                return
+            self._positions[frame] = self._count
+            self._count += 1
+
+    def _open(self):
+        header = _ATLAS_HEADER.pack(ATLAS_MAGIC, ATLAS_VERSION, *self.size)
+        try:
+            with open(self.path, "rb") as atlas_file:
+                existing = atlas_file.read(_ATLAS_HEADER.size)
+            file_size = os.path.getsize(self.path)
+        except FileNotFoundError:
+            existing, file_size = b"", 0
+
+        if existing != header:
+            # New, or made for another version or screenshot size: start over
+            with open(self.path, "wb") as atlas_file:
+                atlas_file.write(header)
+            return
+
+        # Drop a tile cut short by the viewer closing while it was written, so appends stay aligned
+        self._count = (file_size - _ATLAS_HEADER.size) // self.dtype.itemsize
+        if file_size != _ATLAS_HEADER.size + self._count * self.dtype.itemsize:
+            with open(self.path, "r+b") as atlas_file:
+                atlas_file.truncate(_ATLAS_HEADER.size + self._count * self.dtype.itemsize)
+        if self._count:
+            self._tiles = np.memmap(self.path, dtype=self.dtype, mode="r", offset=_ATLAS_HEADER.size,
+                                    shape=(self._count,))
+            # Only pages in the frame numbers, not the pixels
+            self._positions = {frame: position for position, frame in enumerate(self._tiles["frame"].tolist())}
+
+
+class ScreenshotCache:
+    """Screenshots of a directory resized to size, the least recently used evicted beyond max_bytes.
+
+    Safe to use from several threads."""
+
+    def __init__(self, directory, size, max_bytes=128 * 1024 * 1024, atlas_path=None):
+        self.directory = directory
+        self.size = size
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.atlas = ThumbnailAtlas(atlas_path, size) if atlas_path else None
+        self._lock = threading.Lock()
+        self._images = collections.OrderedDict()  # frame -> (PNG mtime, image, sharp), oldest use first
+
+    def __len__(self):
+        return len(self._images)
+
+    def path(self, frame):
+        return os.path.join(self.directory, f"{frame:05d}.png")
+
+    def get(self, frame, sharp=False):
+        """(image, sharp) of a frame. Raises FileNotFoundError.
+
+        Unless sharp is asked for, a quick resize is made when there is no sharp
+        one cached yet."""
+        mtime = os.stat(self.path(frame)).st_mtime_ns
+        with self._lock:
+            entry = self._images.get(frame)
+            if entry is not None and entry[0] == mtime and (entry[2] or not sharp):
+                self._images.move_to_end(frame)
+                return entry[1], entry[2]
+
+        image = self.atlas.get(frame, mtime) if self.atlas is not None else None
+        if image is not None:
+            sharp = True
+        else:
+            with Image.open(self.path(frame)) as png:
+                image = png.convert("RGB").resize(self.size, SHARP_FILTER if sharp else QUICK_FILTER)
+            if sharp and self.atlas is not None:
+                self.atlas.add(frame, mtime, image)
+
+        with self._lock:
+            entry = self._images.get(frame)
+            # Keep a sharp image another thread made in the meantime
+            if entry is None or entry[0] != mtime or sharp or not entry[2]:
+                self._discard(frame)
+                self._images[frame] = (mtime, image, sharp)
+                self.nbytes += _image_bytes(image)
+            while self.nbytes > self.max_bytes and len(self._images) > 1:
+                self._discard(next(iter(self._images)))
+        return image, sharp
+
+    def _discard(self, frame):
+        entry = self._images.pop(frame, None)
+        if entry is not None:
+            self.nbytes -= _image_bytes(entry[1])
+
+
+def _image_bytes(image):
+    width, height = image.size
+    return width * height * len(image.getbands())
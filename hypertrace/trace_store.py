@@ -0,0 +1,254 @@
+"""A finished HyperTrace session compiled into one columnar store.
+
+A live trace is spread over memory_access.log (and its .backup) plus the
+instruction logs (instructions/trace-NNNNN.log segments, or one
+instructions/{frame}.log per frame), joined only by the PCs they share.
+compile_store turns a finished session into a directory of:
+
+- chunk-NNNNN.arrays: the memory accesses, chunk_records at a time, as one
+  array per column (frame, type, size, address, value, pc, mask);
+- store.arrays: the frames, the index of the first access of each frame, and
+  a dictionary from PC to instruction text built from the instruction logs.
+
+Both are written with frame_index.save_arrays, so opening a store only
+memory-maps it, and a query reads just the chunks of the frames it covers.
+"""
+import itertools
+import os
+
+import numpy as np
+
+from hypertrace import records
+from hypertrace.frame_index import load_arrays, save_arrays
+from hypertrace.ingest import split_frames
+from hypertrace.instructions import preprocess_instructions
+from hypertrace.log_stream import read_session
+
+STORE_VERSION = 1
+COLUMNS = ("frame", "type", "size", "address", "value", "pc", "mask")
+STORE_FILE = "store.arrays"
+
+
+def chunk_path(path, chunk):
+    return os.path.join(path, f"chunk-{chunk:05d}.arrays")
+
+
+def compile_store(log_path, instructions_dir, path, chunk_records=1 << 20):
+    """Compile memory_access.log (after its .backup) and the instruction logs in instructions_dir into a store at path.
+
+    Returns the number of memory accesses stored."""
+    os.makedirs(path, exist_ok=True)
+    pending = []  # Records read but not yet written to a chunk
+    pending_records = 0
+    num_records = 0
+    num_chunks = 0
+    frames = []
+    frame_starts = []
+
+    for new_records in read_session(log_path):
+        if records.record_counts(new_records) is not None:
+            raise ValueError(f"{log_path} is a summary log, it has no individual accesses to store")
+        for frame, start, _ in split_frames(new_records["frame"]):
+            if frames and frame == frames[-1]:
+                continue  # The frame carries on from the previous read
+            if frames and frame < frames[-1]:
+                raise ValueError(f"Frame {frame} comes after frame {frames[-1]} in {log_path}")
+            frames.append(frame)
+            frame_starts.append(num_records + pending_records + start)
+        pending.append(new_records)
+        pending_records += len(new_records)
+
+        while pending_records >= chunk_records:
+            num_records += _save_chunk(path, num_chunks, num_records, pending, chunk_records)
+            num_chunks += 1
+            pending_records -= chunk_records
+    if pending_records:
+        num_records += _save_chunk(path, num_chunks, num_records, pending, chunk_records)
+        num_chunks += 1
+
+    pc_keys, text_offsets, text_data = _instruction_dictionary(instructions_dir)
+    metadata = {
+        "store_version": STORE_VERSION,
+        "num_records": num_records,
+        "chunk_records": chunk_records,
+        "num_chunks": num_chunks,
+        "log_path": os.path.abspath(log_path),
+    }
+    save_arrays(os.path.join(path, STORE_FILE), metadata, {
+        "frames": np.array(frames, dtype=np.uint32),
+        "frame_offsets": np.array(frame_starts + [num_records], dtype=np.int64),
+        "pc_keys": pc_keys,
+        "text_offsets": text_offsets,
+        "text_data": text_data,
+    })
+    return num_records
+
+
+def _save_chunk(path, chunk, first_record, pending, chunk_records):
+    """Write the first chunk_records pending records as chunk number chunk, leaving the rest in pending."""
+    buffered = np.concatenate(pending)
+    count = min(chunk_records, len(buffered))
+    save_arrays(chunk_path(path, chunk), {"first_record": first_record},
+                {column: buffered[column][:count] for column in COLUMNS})
+    pending[:] = [buffered[count:]]
+    return count
+
+
+def _instruction_dictionary(instructions_dir, batch_lines=1 << 16):
+    """(sorted PCs, offsets into the text, UTF-8 text) of the first instruction text logged for every PC.
+
+    The logs are read batch_lines lines at a time, so only the dictionary itself
+    stays in memory however large the trace segments are."""
+    texts = {}
+    names = os.listdir(instructions_dir) if os.path.isdir(instructions_dir) else []
+    for name in sorted(names, key=lambda name: (len(name), name)):
+        if not name.endswith(".log"):
+            continue
+        with open(os.path.join(instructions_dir, name), encoding="utf-8", errors="replace") as instructions_file:
+            while True:
+                lines = list(itertools.islice(instructions_file, batch_lines))
+                if not lines:
+                    break
+                _, instructions, pcs = preprocess_instructions(lines)
+                for pc, instruction in zip(pcs, instructions):
+                    if pc >= 0 and pc not in texts:
+                        texts[pc] = instruction
+
+    pc_keys = np.array(sorted(texts), dtype=np.uint32)
+    encoded = [texts[pc].encode() for pc in pc_keys.tolist()]
+    text_offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(text) for text in encoded], out=text_offsets[1:])
+    return pc_keys, text_offsets, np.frombuffer(b"".join(encoded), dtype=np.uint8)
+
+
+class TraceStore:
+    """A store written by compile_store, memory-mapped."""
+
+    def __init__(self, path):
+        self.path = path
+        metadata, arrays = load_arrays(os.path.join(path, STORE_FILE))
+        if metadata.get("store_version") != STORE_VERSION:
+            raise ValueError(f"{path} is not a version {STORE_VERSION} HyperTrace store")
+        self.num_records = metadata["num_records"]
+        self.chunk_records = metadata["chunk_records"]
+        self.num_chunks = metadata["num_chunks"]
+        self.frames = arrays["frames"]
+        self.frame_offsets = arrays["frame_offsets"]
+        self._pc_keys = arrays["pc_keys"]
+        self._text_offsets = arrays["text_offsets"]
+        self._text_data = arrays["text_data"]
+        self._chunks = {}
+
+    def __len__(self):
+        return self.num_records
+
+    def chunk(self, chunk):
+        """The columns of a chunk as a dict of memory-mapped arrays."""
+        if chunk not in self._chunks:
+            self._chunks[chunk] = load_arrays(chunk_path(self.path, chunk))[1]
+        return self._chunks[chunk]
+
+    def frame_range(self, first_frame=None, last_frame=None):
+        """(start, stop) indices of the accesses made in frames first_frame..last_frame (inclusive)."""
+        start = 0 if first_frame is None else int(np.searchsorted(self.frames, first_frame))
+        stop = len(self.frames) if last_frame is None else int(np.searchsorted(self.frames, last_frame, "right"))
+        return int(self.frame_offsets[start]), int(self.frame_offsets[stop])
+
+    def columns(self, start, stop, columns=COLUMNS):
+        """Yield (first index, dict of column arrays) for the chunks covering accesses start..stop-1."""
+        for chunk in range(start // self.chunk_records, -(-stop // self.chunk_records)):
+            first = chunk * self.chunk_records
+            begin = max(start - first, 0)
+            end = min(stop - first, self.chunk_records)
+            data = self.chunk(chunk)
+            yield first + begin, {column: data[column][begin:end] for column in columns}
+
+    def iter_records(self, start, stop):
+        """Yield accesses start..stop-1 a chunk at a time, as records.RECORD_DTYPE arrays."""
+        for _, data in self.columns(start, stop):
+            chunk = np.zeros(len(data["frame"]), dtype=records.RECORD_DTYPE)
+            for column, values in data.items():
+                chunk[column] = values
+            yield chunk
+
+    def records(self, start, stop):
+        """Accesses start..stop-1 as a records.RECORD_DTYPE array."""
+        chunks = list(self.iter_records(start, stop))
+        return np.concatenate(chunks) if chunks else np.zeros(0, dtype=records.RECORD_DTYPE)
+
+    def select(self, first_frame=None, last_frame=None, pc=None, access_type=None, address_start=None,
+               address_end=None):
+        """Accesses in frames first_frame..last_frame, from pc, of access_type (records.ACCESS_READ or
+        ACCESS_WRITE) and at addresses address_start..address_end-1, each filter optional.
+
+        Returns a records.RECORD_DTYPE array, e.g. all writes from PC X in frames A to B:
+        store.select(A, B, pc=X, access_type=records.ACCESS_WRITE)."""
+        start, stop = self.frame_range(first_frame, last_frame)
+        selected = []
+        for first, data in self.columns(start, stop):
+            keep = np.ones(len(data["frame"]), dtype=bool)
+            if pc is not None:
+                keep &= data["pc"] == pc
+            if access_type is not None:
+                keep &= data["type"] == access_type
+            if address_start is not None:
+                keep &= data["address"] >= address_start
+            if address_end is not None:
+                keep &= data["address"] < address_end
+            matches = np.zeros(np.count_nonzero(keep), dtype=records.RECORD_DTYPE)
+            for column, values in data.items():
+                matches[column] = values[keep]
+            selected.append(matches)
+        return np.concatenate(selected) if selected else np.zeros(0, dtype=records.RECORD_DTYPE)
+
+    def instruction(self, pc):
+        """Instruction text logged at pc, or None."""
+        position = int(np.searchsorted(self._pc_keys, pc))
+        if position == len(self._pc_keys) or self._pc_keys[position] != pc:
+            return None
+        return bytes(self._text_data[self._text_offsets[position]:self._text_offsets[position + 1]]).decode()
+
+    def instructions_in(self, start, end):
+        """(PC, instruction text) of the instructions logged at PCs start..end-1."""
+        first, last = np.searchsorted(self._pc_keys, [start, end])
+        return [(pc, self.instruction(pc)) for pc in self._pc_keys[first:last].tolist()]
+
+
+class StoreReader:
+    """Reads a TraceStore in place of a LogStream, for the ingest thread.
+
+    Offsets are access indices rather than byte offsets, there are no
+    rollovers and no frame index: the store is the index."""
+
+    log_format = "store"
+    generation = 0
+    signature = b""
+
+    def __init__(self, store, max_records=1 << 20):
+        self.store = store
+        self.max_records = max_records
+        self.position = 0
+        self.backlog = True
+
+    def read(self):
+        """Return (records, offsets) of the next accesses, or None at the end of the store."""
+        if self.position >= len(self.store):
+            self.backlog = False
+            return None
+        stop = min(self.position + self.max_records, len(self.store))
+        chunk = self.store.records(self.position, stop), np.arange(self.position, stop, dtype=np.int64)
+        self.position = stop
+        self.backlog = stop < len(self.store)
+        return chunk
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Compile a finished HyperTrace session into a columnar store.")
+    parser.add_argument("log", help="memory_access.log")
+    parser.add_argument("instructions", help="the instructions directory")
+    parser.add_argument("store", help="directory to write the store to")
+    args = parser.parse_args()
+    count = compile_store(args.log, args.instructions, args.store)
+    print(f"Stored {count} memory accesses in {args.store}")
@@ -3,9 +3,58 @@ local max_log_size = 500 * 1024 * 1024  -- 50 MB
 local frame_counter = 0
 local delay_frames = 60  -- 65 seconds at 60 FPS
 local logger_enabled = false
+-- "csv" (text lines), "binary" (packed records), "packed" (binary compressed a frame at a time) or "summary"
+-- (per frame access counts), see hypertrace/records.py
+local log_format = "csv"
+
+-- What gets traced. A tap profile lists the address ranges to tap and what to tap in them ("rw", "r" or "w").
+-- Optionally pc_range only logs accesses made from code in that range, sample_every logs 1 in N accesses and
+-- frame_budget logs at most N accesses per frame. Only the taps a profile needs are installed, so tracing
+-- work RAM or the I/O registers alone runs much closer to full speed than tapping the whole bus.
+-- Ranges are for CPS1 games like sf2; change them to suit your game.
+local tap_profiles = {
+    all = { ranges = { { 0x000000, 0xFFFFFF } }, access = "rw" },
+    work_ram = { ranges = { { 0xFF0000, 0xFFFFFF } }, access = "rw" },
+    work_ram_writes = { ranges = { { 0xFF0000, 0xFFFFFF } }, access = "w" },
+    io = { ranges = { { 0x800000, 0x800FFF } }, access = "rw" },
+    sampled = { ranges = { { 0x000000, 0xFFFFFF } }, access = "rw", sample_every = 16 },
+}
+local tap_profile = "all"  -- Switch from the MAME Lua console with hypertrace_tap_profile("work_ram")
+
+-- How instructions are traced. "stream" keeps one debugger trace running, every line starting with the frame=N it
+-- ran in, split into instructions/trace-NNNNN.log segments of instruction_segment_frames frames each. "frames"
+-- restarts the trace into a new instructions/{frame}.log every frame, which stalls the game at every frame.
+local instruction_trace = "stream"
+-- A second of play, a few hundred MB with all registers logged since a 68000 game traces several MB per frame
+local instruction_segment_frames = 60
+-- Registers logged with every instruction besides the PC, fewer make a much smaller trace
+local instruction_registers = {
+    "d0", "d1", "d2", "d3", "d4", "d5", "d6", "d7", "a0", "a1", "a2", "a3", "a4", "a5", "a6" }
+
+local log_size = 0  -- Bytes written to the current log file, counted rather than asked of the file
+
+-- Open a fresh log file, binary and summary logs start with a small versioned header. CSV logs are opened in
+-- binary mode too, text mode would write "\r\n" for every "\n" on Windows and log_size would be short of the file
+local function open_log_file()
+    local file = io.open(log_file_path, "wb")
+    local header = ""
+    if log_format == "binary" then
+        -- magic, version, record size, flags, 4 reserved bytes
+        header = string.pack("<c4I2I2I4I4", "HTRC", 1, 24, 0, 0)
+    elseif log_format == "summary" then
+        header = string.pack("<c4I2I2I4I4", "HTSM", 1, 16, 0, 0)
+    elseif log_format == "packed" then
+        header = string.pack("<c4I2I2I4I4", "HTPK", 1, 20, 0, 0)
+    end
+    if file ~= nil then
+        file:write(header)
+        log_size = #header
+    end
+    return file
+end
 
 -- Attempt to open the log file for writing
-local log_file = io.open(log_file_path, "w")
+local log_file = open_log_file()
 if log_file == nil then
     error(string.format("Failed to open log file at path: %s. Please check the path and permissions.", log_file_path))
 end
@@ -49,34 +98,75 @@ if screen == nil then
     error("No screen device found")
 end
 
--- Function to write to the log and handle log rollover
+-- Log entries are collected in write_buffer and only written out and flushed when it is full or the frame is done
 local write_buffer = {}
+local buffer_count = 0  -- Entries in write_buffer
 local buffer_size = 5000  -- Buffer size for batching log writes
-
-local function write_to_log(data)
+-- Opt-in double buffering: a full buffer is set aside and written when the frame is done, and the log is only
+-- rotated then, so the tap callbacks don't wait on the disk unless both buffers fill up within one frame
+local double_buffer = false
+local full_buffer = nil  -- The buffer set aside
+
+-- Rename the log to .backup and start a new one
+local function rotate_log()
+    log_file:close()
+    local backup_file_path = log_file_path .. ".backup"
+    os.remove(backup_file_path)  -- Remove the old backup file if it exists
+    if os.rename(log_file_path, backup_file_path) then  -- Rename current log file to backup
+        log_file = open_log_file()  -- Create a new log file
+    else
+        -- The viewer may be reading the file right now (Windows won't rename it then),
+        -- keep appending and try again on a later write rather than truncating it
+        log_file = io.open(log_file_path, "ab")
+        if log_file ~= nil then
+            log_size = log_file:seek("end")
+        end
+    end
     if log_file == nil then
-        error("Log file is not open. Unable to write data.")
+        error(string.format("Failed to open new log file at path: %s.", log_file_path))
+    end
+end
+
+-- Write out the buffered entries, the buffer set aside first
+local function write_buffers()
+    if full_buffer ~= nil then
+        local data = table.concat(full_buffer)
+        log_file:write(data)
+        log_size = log_size + #data
+        full_buffer = nil
     end
-    table.insert(write_buffer, data)
-    if #write_buffer >= buffer_size then
-        log_file:write(table.concat(write_buffer))
-        write_buffer = {}  -- Clear buffer after writing
+    if buffer_count > 0 then
+        local data = table.concat(write_buffer)
+        log_file:write(data)
+        log_size = log_size + #data
+        write_buffer = {}
+        buffer_count = 0
     end
-    --if frame_counter % 6000 == 0 then
+end
+
+-- Write out and flush the buffered entries, rotating the log if it grew past max_log_size
+local function flush_log()
+    write_buffers()
     log_file:flush()
-    --end
-
-    -- Check if the log file exceeds the maximum size and rotate if necessary
-    local file_size = log_file:seek("end")
-    if file_size > max_log_size then
-        log_file:close()
-        local backup_file_path = log_file_path .. ".backup"
-        os.remove(backup_file_path)  -- Remove the old backup file if it exists
-        os.rename(log_file_path, backup_file_path)  -- Rename current log file to backup
-        log_file = io.open(log_file_path, "w")  -- Create a new log file
-        if log_file == nil then
-            error(string.format("Failed to open new log file at path: %s.", log_file_path))
-        end
+    if log_size > max_log_size then
+        rotate_log()
+    end
+end
+
+local function write_to_log(data)
+    buffer_count = buffer_count + 1
+    write_buffer[buffer_count] = data
+    if buffer_count < buffer_size then
+        return
+    end
+    if not double_buffer then
+        flush_log()
+    elseif full_buffer == nil then
+        full_buffer = write_buffer
+        write_buffer = {}
+        buffer_count = 0
+    else
+        write_buffers()  -- Both buffers are full, but leave flushing and rotating to the end of the frame
     end
 end
 
@@ -93,20 +183,154 @@ local function determine_size(mem_mask)
     return size
 end
 
+-- Size of every mem_mask seen so far, so each mask's bytes are only counted once
+local mask_sizes = setmetatable({}, { __index = function(sizes, mem_mask)
+    local size = determine_size(mem_mask)
+    sizes[mem_mask] = size
+    return size
+end })
+
+-- Build one log entry in the configured format
+local function format_log_entry(access_type, frame, address, value, size, pc, mem_mask)
+    if log_format == "binary" then
+        -- frame, R/W flag (0/1), size, reserved, address, value, pc, mask (24 bytes)
+        return string.pack(
+            "<I4BBI2I4I4I4I4",
+            frame, access_type == "W" and 1 or 0, size, 0,
+            address & 0xFFFFFFFF, value & 0xFFFFFFFF, pc & 0xFFFFFFFF, mem_mask & 0xFFFFFFFF
+        )
+    end
+    return string.format("%d,%s,%X,%X,%d,%X,%X\n", frame, access_type, address, value, size, pc, mem_mask)
+end
+
+-- Summary mode counts the accesses of a frame per (PC, address, type) instead of logging each one, and writes
+-- them out as one block when the frame is over: the frame number and number of entries, then per entry the
+-- PC, address, R/W flag (0/1), 3 reserved bytes and the count (16 bytes)
+local summary_counts = {}  -- (PC << 33) | (address << 1) | R/W flag -> number of accesses
+local summary_frame = nil  -- The frame being counted
+
+local function write_summary()
+    if summary_frame == nil then
+        return
+    end
+    local entries = {}
+    for key, count in pairs(summary_counts) do
+        entries[#entries + 1] = string.pack("<I4I4BBI2I4", key >> 33, (key >> 1) & 0xFFFFFFFF, key & 1, 0, 0, count)
+    end
+    write_to_log(string.pack("<I4I4", summary_frame, #entries) .. table.concat(entries))
+    summary_counts = {}
+    summary_frame = nil
+end
+
+local function count_access(write_flag, frame, address, pc)
+    if frame ~= summary_frame then
+        write_summary()
+        summary_frame = frame
+    end
+    local key = ((pc & 0x3FFFFFFF) << 33) | ((address & 0xFFFFFFFF) << 1) | write_flag
+    summary_counts[key] = (summary_counts[key] or 0) + 1
+end
+
+-- Packed mode logs every access like binary, compressed a frame at a time. Games make the same accesses over and
+-- over, so each frame's block holds its distinct records (binary records without the frame, 20 bytes) once each,
+-- then per access the index of its record: 2 bytes, or 4 when the frame has more than 0xFFFF distinct records.
+-- The block starts with the frame number, the number of accesses and the number of distinct records
+local packed_indices = {}  -- Packed record -> its index in the frame's block, counting from 0
+local packed_records = {}  -- The frame's distinct packed records, in order
+local packed_accesses = {}  -- Index of the record of every access of the frame
+local packed_frame = nil  -- The frame being packed
+local pack_batch = 4096  -- Indices packed per string.pack call
+local batch_formats = { [2] = "<" .. string.rep("I2", pack_batch), [4] = "<" .. string.rep("I4", pack_batch) }
+
+local function write_packed()
+    if packed_frame == nil then
+        return
+    end
+    local index_size = #packed_records > 0xFFFF and 4 or 2
+    local parts = {
+        string.pack("<I4I4I4", packed_frame, #packed_accesses, #packed_records), table.concat(packed_records) }
+    for first = 1, #packed_accesses, pack_batch do
+        local last = math.min(first + pack_batch - 1, #packed_accesses)
+        local format = batch_formats[index_size]
+        if last - first + 1 < pack_batch then
+            format = "<" .. string.rep("I" .. index_size, last - first + 1)
+        end
+        parts[#parts + 1] = string.pack(format, table.unpack(packed_accesses, first, last))
+    end
+    write_to_log(table.concat(parts))
+    packed_indices = {}
+    packed_records = {}
+    packed_accesses = {}
+    packed_frame = nil
+end
+
+local function pack_access(write_flag, frame, address, value, size, pc, mem_mask)
+    if frame ~= packed_frame then
+        write_packed()
+        packed_frame = frame
+    end
+    local record = string.pack("<BBI2I4I4I4I4", write_flag, size, 0,
+        address & 0xFFFFFFFF, value & 0xFFFFFFFF, pc & 0xFFFFFFFF, mem_mask & 0xFFFFFFFF)
+    local index = packed_indices[record]
+    if index == nil then
+        index = #packed_records
+        packed_records[index + 1] = record
+        packed_indices[record] = index
+    end
+    packed_accesses[#packed_accesses + 1] = index
+end
+
+-- PC filter and sampling of the active tap profile
+local active_profile = nil  -- The profile the installed taps are for, nil when none are installed
+local sample_counter = 0
+local frame_logged = 0  -- Accesses logged this frame, for frame_budget
+
+local function should_log(pc)
+    local profile = active_profile
+    if profile == nil then
+        return false
+    end
+    local pc_range = profile.pc_range
+    if pc_range ~= nil and (pc < pc_range[1] or pc > pc_range[2]) then
+        return false
+    end
+    if profile.sample_every ~= nil then
+        sample_counter = sample_counter + 1
+        if sample_counter < profile.sample_every then
+            return false
+        end
+        sample_counter = 0
+    end
+    if profile.frame_budget ~= nil then
+        if frame_logged >= profile.frame_budget then
+            return false
+        end
+        frame_logged = frame_logged + 1
+    end
+    return true
+end
+
 -- Callback function for memory write
 local function on_memory_write(address, value, mem_mask)
 
     if logger_enabled then 
         local current_frame1 = screen:frame_number()
         local pc = main_cpu.state["CURPC"].value
-        local size = determine_size(mem_mask)
+        if not should_log(pc) then
+            return
+        end
+        if log_format == "summary" then
+            count_access(1, current_frame1, address, pc)
+            return
+        end
+        local size = mask_sizes[mem_mask]
+        if log_format == "packed" then
+            pack_access(1, current_frame1, address, value, size, pc, mem_mask)
+            return
+        end
         --local instruction = cpu.disassemble(pc)
         local old_value = 0 --mem_space:read_u8(offset)  -- Assuming an 8-bit read before writing
-        local log_entry = string.format(
-            "%d,W,%X,%X,%d,%X,%X",
-            current_frame1, address, value, size, pc, mem_mask
-        )
-        write_to_log(log_entry .. "\n")
+        write_to_log(format_log_entry("W", current_frame1, address, value, size, pc, mem_mask))
     end
 end
 
@@ -114,9 +338,20 @@ end
 local function on_memory_read(address, value, mem_mask)
     
     if logger_enabled then 
-        local size = determine_size(mem_mask)
-        local current_frame1 = screen:frame_number()
         local pc = main_cpu.state["CURPC"].value
+        if not should_log(pc) then
+            return
+        end
+        local current_frame1 = screen:frame_number()
+        if log_format == "summary" then
+            count_access(0, current_frame1, address, pc)
+            return
+        end
+        local size = mask_sizes[mem_mask]
+        if log_format == "packed" then
+            pack_access(0, current_frame1, address, value, size, pc, mem_mask)
+            return
+        end
 
         --local instruction = main_cpu.disassemble(pc)
         --rint("4")
@@ -127,25 +362,98 @@ local function on_memory_read(address, value, mem_mask)
 
         --print("5")
 
-        local log_entry = string.format(
-            "%d,R,%X,%X,%d,%X,%X",
-            current_frame1, address, value, size, pc, mem_mask
-        )
+        write_to_log(format_log_entry("R", current_frame1, address, value, size, pc, mem_mask))
+    end
+end
+
+local instruction_segment = 0  -- The segment of the streaming trace being written, counting from 1
+local segment_frames = 0  -- Frames traced into the segment, counted rather than asking the file its size
+
+local function segment_path(segment)
+    return string.format("./instructions/trace-%05d.log", segment)
+end
+
+-- The streaming trace starts again from segment 1 every session, like the memory access log
+if instruction_trace == "stream" then
+    local segment = 1
+    while os.remove(segment_path(segment)) do
+        segment = segment + 1
+    end
+end
+
+-- Start tracing instructions, into the next segment of the stream or into the log of this frame
+local function start_instruction_trace()
+    local path, format, args
+    if instruction_trace == "stream" then
+        -- frame is the debugger's frame number, so every line says which frame it ran in
+        instruction_segment = instruction_segment + 1
+        segment_frames = 0
+        path, format, args = segment_path(instruction_segment), { "frame=%d" }, { "frame" }
+    else
+        path = "./instructions/" .. tostring(frame_counter) .. ".log"
+        format, args = { "frame=" .. tostring(frame_counter) }, {}
+    end
+    for _, register in ipairs(instruction_registers) do
+        table.insert(format, register:upper() .. "=%x")
+        table.insert(args, register)
+    end
+    table.insert(format, "PC=%x -- ")
+    table.insert(args, "pc")
+    manager.machine.debugger:command(string.format('trace %s,,noloop,{ tracelog "%s",%s }', path,
+        table.concat(format, " "), table.concat(args, ",")))
+end
 
-        write_to_log(log_entry .. "\n")
+-- Count the frame just traced, and whether the segment being traced into now holds instruction_segment_frames
+local function instruction_segment_full()
+    if instruction_trace ~= "stream" then
+        return false
     end
+    segment_frames = segment_frames + 1
+    return segment_frames >= instruction_segment_frames
 end
 
--- Function to set memory taps
+-- Handles of the installed taps, removed again before installing others
+local tap_handles = {}
+
+-- Install the taps of the tap profile while logging, and none otherwise.
+-- Nothing is done unless that changed since the last call.
 local function set_memory_taps()
+    local profile = logger_enabled and tap_profiles[tap_profile] or nil
+    if profile == active_profile then
+        return
+    end
 
-    if logger_enabled then 
-        print("Setting memory read and write taps...")
-        passthrough_read = mem_space:install_read_tap(0x000000, 0xFFFFFF, "reads", on_memory_read)
-        passthrough_write = mem_space:install_write_tap(0x000000, 0xFFFFFF, "writes", on_memory_write)
+    for _, handle in ipairs(tap_handles) do
+        handle:remove()
+    end
+    tap_handles = {}
+    active_profile = profile
+    sample_counter = 0
+    if profile == nil then
+        print("Memory taps removed")
+        return
+    end
+
+    print(string.format("Setting memory taps for the %s profile...", tap_profile))
+    for i, range in ipairs(profile.ranges) do
+        if profile.access:find("r") then
+            table.insert(tap_handles, mem_space:install_read_tap(range[1], range[2], "reads" .. i, on_memory_read))
+        end
+        if profile.access:find("w") then
+            table.insert(tap_handles, mem_space:install_write_tap(range[1], range[2], "writes" .. i, on_memory_write))
+        end
     end
 end
 
+-- Change the tap profile, from the MAME Lua console. The taps change at the end of the frame
+function hypertrace_tap_profile(name)
+    if tap_profiles[name] == nil then
+        print(string.format("No tap profile called %s", name))
+        return
+    end
+    tap_profile = name
+end
+
 set_memory_taps()
 
 -- Register a frame done callback to manage log buffer flushes and reinstall taps if necessary
@@ -168,12 +476,7 @@ emu.register_frame_done(function()
         manager.machine.debugger:command('trace off')
 
         if logger_enabled then
-            -- Manually construct the trace command string
-            local frame_str = "frame=" .. tostring(frame_counter)  -- Convert the frame number to a string
-            local trace_command = 'trace ./instructions/'.. tostring(frame_counter) ..'.log,,noloop,{ tracelog "' .. frame_str .. ' D0=%x D1=%x D2=%x D3=%x D4=%x D5=%x D6=%x D7=%x A0=%x A1=%x A2=%x A3=%x A4=%x A5=%x A6=%x PC=%x -- ",d0,d1,d2,d3,d4,d5,d6,d7,a0,a1,a2,a3,a4,a5,a6,pc }'
-
-            -- Execute the trace command
-            manager.machine.debugger:command(trace_command)
+            start_instruction_trace()
         end
         -- Set debounce flag to true to avoid repeated toggling
         logger_toggle_debounced = true
@@ -187,28 +490,24 @@ emu.register_frame_done(function()
         return
     end
 
-    -- Update trace command each frame if logging is enabled
-    if logger_enabled then
-        -- Stop the previous trace (if it's running)
+    -- Restart the trace into the next frame's log, or the next segment once the current one is full
+    if logger_enabled and (instruction_trace == "frames" or instruction_segment_full()) then
         manager.machine.debugger:command('trace off')
+        start_instruction_trace()
+    end
 
-        -- Construct the new trace command with the current frame number
-        local frame_str = "frame=" .. tostring(frame_counter)
-        local trace_command = 'trace ./instructions/'.. tostring(frame_counter) ..'.log,,noloop,{ tracelog "' .. frame_str .. ' D0=%x D1=%x D2=%x D3=%x D4=%x D5=%x D6=%x D7=%x A0=%x A1=%x A2=%x A3=%x A4=%x A5=%x A6=%x PC=%x -- ",d0,d1,d2,d3,d4,d5,d6,d7,a0,a1,a2,a3,a4,a5,a6,pc }'
-
-        -- Start the trace again with the updated frame number
-        manager.machine.debugger:command(trace_command)
+    -- Write out the counts or the packed block of the frame that just finished
+    if log_format == "summary" then
+        write_summary()
+    elseif log_format == "packed" then
+        write_packed()
     end
 
     -- Flush the buffer to the log file every frame
-    if #write_buffer > 0 then
-        log_file:write(table.concat(write_buffer))
-        write_buffer = {}
-    end
+    flush_log()
 
-    -- Reinstall memory taps every 60 frames
-    if frame_counter % 60 == 0 then
-        set_memory_taps()
-    end
+    -- Install, change or remove the taps if logging was toggled or the tap profile changed
+    frame_logged = 0
+    set_memory_taps()
 end)
 
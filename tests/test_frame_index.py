@@ -0,0 +1,81 @@
+import os
+
+import numpy as np
+
+from hypertrace import records
+from hypertrace.frame_index import FrameIndex
+from hypertrace.frame_store import FrameStore
+from hypertrace.histogram import AccessHistogram
+from hypertrace.ingest import BoxWindow, IngestWorker, count_accesses, count_boxes
+from hypertrace.log_stream import LogStream
+
+MEMORY_SIZE = 1 << 16
+WINDOW = BoxWindow(0, MEMORY_SIZE // 64, 64)
+ROM_WINDOW = BoxWindow(0, 256, 16)
+
+
+def make_records(frames, per_frame=50):
+    rng = np.random.default_rng(frames[0])
+    recs = np.zeros(len(frames) * per_frame, dtype=records.RECORD_DTYPE)
+    recs["frame"] = np.repeat(frames, per_frame)
+    recs["type"] = rng.integers(0, 2, len(recs))
+    recs["address"] = rng.integers(0, MEMORY_SIZE, len(recs))
+    recs["pc"] = rng.integers(0, 4096, len(recs))
+    return recs
+
+
+def make_worker(log_path=None):
+    frame_store = FrameStore(WINDOW.num_boxes, num_rom_boxes=ROM_WINDOW.num_boxes)
+    reader = frame_index = None
+    if log_path is not None:
+        reader = LogStream(log_path)
+        frame_index = FrameIndex(log_path, frame_store)
+    return IngestWorker(reader, WINDOW, ROM_WINDOW, frame_store, frame_index, histogram=AccessHistogram(MEMORY_SIZE))
+
+
+def read_log(worker):
+    while True:
+        chunk = worker.reader.read()
+        if chunk is not None and len(chunk[0]):
+            worker._ingest(*chunk)
+            worker.poll()  # The viewer takes every update, so the histogram holds them all
+        elif not worker.reader.backlog:
+            return
+
+
+def test_reopen_after_a_rollover_in_the_middle_of_a_frame(tmp_path):
+    log_path = str(tmp_path / "memory_access.log")
+    recs = make_records([1, 2, 3, 4, 5])
+
+    # Frame 3 starts in the log, which rolls over to .backup before the rest of it is written
+    with open(log_path, "wb") as log_file:
+        log_file.write(records.pack_header() + recs[:120].tobytes())
+    worker = make_worker(log_path)
+    read_log(worker)
+    os.rename(log_path, log_path + ".backup")
+    with open(log_path, "wb") as log_file:
+        log_file.write(records.pack_header() + recs[120:150].tobytes())
+    read_log(worker)
+    assert worker.current_frame == 3 and worker.reader.generation == 1
+    worker.save_index()
+
+    reopened = make_worker(log_path)
+    rom_counts = reopened.restore_index()
+    with open(log_path, "ab") as log_file:
+        log_file.write(recs[150:].tobytes())
+    read_log(reopened)
+
+    np.testing.assert_array_equal(rom_counts, count_boxes(recs[:150]["pc"], *ROM_WINDOW))
+
+    # The same history as reading the whole trace in one go, frame 3 included
+    expected = make_worker()
+    expected._ingest(recs, np.zeros(len(recs), dtype=np.int64))
+    assert reopened.frame_store.frames().tolist() == [1, 2, 3, 4]
+    for frame in (3, 4):
+        for got, want in zip(reopened.frame_store.cumulative(frame), expected.frame_store.cumulative(frame)):
+            np.testing.assert_array_equal(got, want)
+        for name in ("rom_per_frame", "connections"):
+            np.testing.assert_array_equal(getattr(reopened.frame_store, name)(frame),
+                                          getattr(expected.frame_store, name)(frame))
+    for got, want in zip(reopened.histogram.rebin(WINDOW), count_accesses(recs, *WINDOW)):
+        np.testing.assert_array_equal(got, want)
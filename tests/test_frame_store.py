@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+
+from hypertrace.frame_store import FrameStore
+from hypertrace.ingest import CONNECTION_DTYPE
+
+
+def test_frames_across_keyframes_match_a_naive_sum():
+    num_boxes, num_rom_boxes = 50, 20
+    store = FrameStore(num_boxes, keyframe_interval=4, num_rom_boxes=num_rom_boxes)
+    rng = np.random.default_rng(0)
+    frames = [3, 4, 5, 7, 8, 9, 10, 12, 13, 20, 21]  # Gaps where nothing was traced
+    deltas = []
+    for frame in frames:
+        # Sparse, like a game's frame: most boxes untouched
+        counts = rng.integers(0, 1000, (3, num_boxes)) * (rng.random((3, num_boxes)) < 0.1)
+        reads, writes, rom = counts[0, :num_boxes], counts[1, :num_boxes], counts[2, :num_rom_boxes]
+        connections = np.zeros(frame % 3, dtype=CONNECTION_DTYPE)
+        connections["pc"] = frame
+        store.append(frame, reads, writes, connections, rom)
+        deltas.append((reads, writes, rom))
+
+    restored = FrameStore(num_boxes, keyframe_interval=4, num_rom_boxes=num_rom_boxes)
+    restored.restore(store.to_arrays())
+    for frame_store in (store, restored):
+        assert frame_store.frames().tolist() == frames
+        for position, frame in enumerate(frames):
+            expected = [sum(delta[i] for delta in deltas[:position + 1]) for i in range(3)]
+            np.testing.assert_array_equal(frame_store.cumulative(frame)[0], expected[0])
+            np.testing.assert_array_equal(frame_store.cumulative(frame)[1], expected[1])
+            np.testing.assert_array_equal(frame_store.rom_cumulative(frame), expected[2])
+            np.testing.assert_array_equal(frame_store.per_frame(frame)[0], deltas[position][0])
+            np.testing.assert_array_equal(frame_store.per_frame(frame)[1], deltas[position][1])
+            np.testing.assert_array_equal(frame_store.rom_per_frame(frame), deltas[position][2])
+            assert frame_store.connections(frame)["pc"].tolist() == [frame] * (frame % 3)
+
+    assert 6 not in store
+    with pytest.raises(KeyError):
+        store.cumulative(6)
+    with pytest.raises(ValueError):
+        store.append(21, *deltas[0][:2], np.zeros(0, dtype=CONNECTION_DTYPE), deltas[0][2])
@@ -0,0 +1,44 @@
+import numpy as np
+
+from hypertrace.histogram import AccessHistogram
+from hypertrace.ingest import ADDRESS_COUNT_DTYPE, BoxWindow
+
+
+def accesses(addresses, count, access_type=0):
+    address_counts = np.zeros(len(addresses), dtype=ADDRESS_COUNT_DTYPE)
+    address_counts["address"] = addresses
+    address_counts["type"] = access_type
+    address_counts["count"] = count
+    return address_counts
+
+
+def test_hot_address_counts_past_uint32():
+    histogram = AccessHistogram(1 << 16)
+    histogram.add(accesses([0x1234], 3_000_000_000))
+    histogram.add(accesses([0x1234], 3_000_000_000))
+
+    read_counts, write_counts = histogram.rebin(BoxWindow(0x1230, 1, 8))
+    assert read_counts[4] == 6_000_000_000
+    assert read_counts.sum() == 6_000_000_000 and write_counts.sum() == 0
+
+    restored = AccessHistogram(1 << 16)
+    restored.restore(histogram.to_arrays())
+    assert restored.rebin(BoxWindow(0, 1 << 16, 1))[0][0] == 6_000_000_000
+
+
+def test_only_pages_past_uint32_take_wide_counts():
+    histogram = AccessHistogram(1 << 16)
+    histogram.add(accesses(np.arange(0, 1 << 16, 64), 5))
+    # Together these pass what uint32 holds, one at a time they don't
+    histogram.add(accesses([0x2000, 0x2001, 0x2000], 2_000_000_000, 1))
+
+    arrays = histogram.to_arrays()
+    assert arrays["counts"].dtype == np.uint32
+    assert arrays["wide_pages"].tolist() == [2]
+    read_counts, write_counts = histogram.rebin(BoxWindow(0x2000, 1, 4))
+    assert write_counts.tolist() == [4_000_000_000, 2_000_000_000, 0, 0]
+    assert read_counts.tolist() == [5, 0, 0, 0]
+    assert histogram.rebin(BoxWindow(0, 1 << 12, 16))[0].tolist() == [64 * 5] * 16
+
+    histogram.remove(accesses([0x2000], 4_000_000_000, 1))
+    assert histogram.rebin(BoxWindow(0x2000, 1, 2))[1].tolist() == [0, 2_000_000_000]
@@ -0,0 +1,110 @@
+import threading
+
+import numpy as np
+
+from hypertrace.frame_store import FrameStore
+from hypertrace.histogram import AccessHistogram
+from hypertrace.ingest import BoxWindow, IngestWorker, count_accesses, rebin_boxes
+from hypertrace.records import RECORD_DTYPE
+
+MEMORY_SIZE = 1 << 16
+ROM_WINDOW = BoxWindow(0, 256, 16)
+
+
+def make_records(frame, seed):
+    rng = np.random.default_rng(seed)
+    recs = np.zeros(200, dtype=RECORD_DTYPE)
+    recs["frame"] = frame
+    recs["type"] = rng.integers(0, 2, len(recs))
+    recs["address"] = rng.integers(0, MEMORY_SIZE, len(recs))
+    recs["pc"] = rng.integers(0, 4096, len(recs))
+    return recs
+
+
+def test_update_published_between_poll_and_rebin_is_counted_once():
+    old_window = BoxWindow(0, MEMORY_SIZE // 64, 64)
+    zoomed_window = BoxWindow(0x4000, 64, 64)
+    histogram = AccessHistogram(MEMORY_SIZE)
+    worker = IngestWorker(None, old_window, ROM_WINDOW, FrameStore(64, num_rom_boxes=16), histogram=histogram)
+
+    # An update binned for the window the viewer has since zoomed away from
+    worker._ingest(make_records(1, 0), np.zeros(200, dtype=np.int64))
+    worker.set_window(zoomed_window)
+
+    # The worker publishes the next update, binned for the new window, while the viewer re-bins
+    publisher = None
+    rebin = histogram.rebin
+
+    def rebin_while_publishing(window):
+        nonlocal publisher
+        if publisher is None:
+            publisher = threading.Thread(
+                target=worker._ingest, args=(make_records(2, 1), np.zeros(200, dtype=np.int64)))
+            publisher.start()
+            publisher.join(timeout=0.5)
+        return rebin(window)
+
+    histogram.rebin = rebin_while_publishing
+    update, counts = worker.poll_rebinned(zoomed_window)
+    assert update.window == old_window and counts is not None
+    read_counts, write_counts = counts
+    publisher.join()
+
+    update, counts = worker.poll_rebinned(zoomed_window)
+    assert update.window == zoomed_window and counts is None
+    read_counts = read_counts + update.read_counts
+    write_counts = write_counts + update.write_counts
+
+    expected_reads, expected_writes = rebin(zoomed_window)
+    np.testing.assert_array_equal(read_counts, expected_reads)
+    np.testing.assert_array_equal(write_counts, expected_writes)
+
+
+def test_updates_merged_across_a_zoom_keep_every_access():
+    full_window = BoxWindow(0, MEMORY_SIZE // 64, 64)
+    zoomed_window = BoxWindow(0x4000, 64, 64)
+    worker = IngestWorker(None, full_window, ROM_WINDOW, FrameStore(64, num_rom_boxes=16))
+
+    # Zoomed in and back out again before the viewer polls
+    recs = np.concatenate([make_records(1, 0), make_records(2, 1), make_records(3, 2)])
+    for frame_recs, window in zip(np.split(recs, 3), (full_window, zoomed_window, full_window)):
+        worker.set_window(window)
+        worker._ingest(frame_recs, np.zeros(len(frame_recs), dtype=np.int64))
+
+    update = worker.poll()
+    assert update.window == full_window and (update.first_frame, update.last_frame) == (1, 3)
+    expected_reads, expected_writes = count_accesses(recs, *full_window)
+    np.testing.assert_array_equal(update.read_counts, expected_reads)
+    np.testing.assert_array_equal(update.write_counts, expected_writes)
+    np.testing.assert_array_equal(update.boxes, np.flatnonzero(expected_reads | expected_writes))
+
+
+def test_frame_history_stays_in_the_window_the_worker_started_with():
+    full_window = BoxWindow(0, MEMORY_SIZE // 64, 64)
+    frame_store = FrameStore(64, num_rom_boxes=16)
+    worker = IngestWorker(None, full_window, ROM_WINDOW, frame_store)
+
+    recs = np.concatenate([make_records(frame, frame) for frame in range(1, 5)])
+    for frame_recs, window in zip(np.split(recs, 4), (full_window, BoxWindow(0x4000, 64, 64), BoxWindow(0, 16, 64),
+                                                      full_window)):
+        worker.set_window(window)
+        worker._ingest(frame_recs, np.zeros(len(frame_recs), dtype=np.int64))
+
+    # Frames 1 to 3 are over, each binned for the full range whatever window was shown
+    expected_reads, expected_writes = count_accesses(recs[recs["frame"] <= 3], *full_window)
+    read_counts, write_counts = frame_store.cumulative(3)
+    np.testing.assert_array_equal(read_counts, expected_reads)
+    np.testing.assert_array_equal(write_counts, expected_writes)
+    expected_reads, _ = count_accesses(recs[recs["frame"] == 2], *full_window)
+    np.testing.assert_array_equal(frame_store.per_frame(2)[0], expected_reads)
+
+
+def test_rebin_boxes():
+    window = BoxWindow(0x100, 16, 8)
+    counts = np.arange(1, 9, dtype=np.int64)
+    np.testing.assert_array_equal(rebin_boxes(counts, window, window), counts)
+    # Coarser boxes sum the boxes starting in them, those outside the window count nothing
+    coarser = rebin_boxes(counts, window, BoxWindow(0xE0, 32, 6))
+    np.testing.assert_array_equal(coarser, [0, 1 + 2, 3 + 4, 5 + 6, 7 + 8, 0])
+    # Finer boxes can't be told apart, they show the box they lie in
+    np.testing.assert_array_equal(rebin_boxes(counts, window, BoxWindow(0x118, 4, 4)), [2, 2, 3, 3])
@@ -0,0 +1,67 @@
+import pytest
+
+from hypertrace.instruction_trace import InstructionTrace, segment_path
+from hypertrace.instructions import InstructionCache
+from hypertrace.line_index import LineIndex
+
+
+def frame_lines(frame):
+    """The traced lines of a frame, a different number for every frame."""
+    return [f"frame={frame} D0={i:x} PC={0x1000 + 2 * i:x} -- {0x1000 + 2 * i:06X}: op{frame}_{i}\n"
+            for i in range(frame % 7 + 1)]
+
+
+def write_segment(directory, segment, lines):
+    with open(segment_path(directory, segment), "a") as trace_file:
+        trace_file.writelines(lines)
+
+
+def read_span(span):
+    data = b""
+    for path, start, end in span:
+        with open(path, "rb") as trace_file:
+            data += trace_file.read()[start:end]
+    return data.decode()
+
+
+def test_frames_found_across_two_segments(tmp_path):
+    directory = str(tmp_path)
+    # Frame 97 is half done when the trace rotates to the second segment, frame 50 was never traced
+    frame_97 = frame_lines(97)
+    write_segment(directory, 1, [line for frame in range(97) if frame != 50 for line in frame_lines(frame)]
+                  + frame_97[:3])
+    write_segment(directory, 2, frame_97[3:] + [line for frame in range(98, 200) for line in frame_lines(frame)])
+
+    trace = InstructionTrace(directory)
+    assert trace.exists()
+    for frame in (0, 1, 49, 51, 96, 98, 150, 199):
+        span = trace.span(frame)
+        assert len(span) == 1 and read_span(span) == "".join(frame_lines(frame))
+    span = trace.span(97)
+    assert [path for path, _, _ in span] == [segment_path(directory, 1), segment_path(directory, 2)]
+    assert span[1][1] == 0 and read_span(span) == "".join(frame_97)
+    for frame in (50, 200):
+        with pytest.raises(FileNotFoundError):
+            trace.span(frame)
+
+    # The frame's lines and instructions read as one, from both segments
+    cache = InstructionCache(directory, trace=trace)
+    parsed = cache.get(97)
+    assert parsed.parts == span and len(parsed.line_numbers) == len(frame_97)
+    assert cache.table.strings(parsed.instruction_ids)[-1] == f"{0x1000 + 2 * (len(frame_97) - 1):06X}: op97_6"
+    lines = LineIndex(parsed.parts, parsed.line_starts, parsed.file_size)
+    assert lines.lines(0, 100) == [line.rstrip("\n") for line in frame_97]
+    lines.close()
+
+
+def test_last_frame_grows_until_a_later_one_follows(tmp_path):
+    directory = str(tmp_path)
+    write_segment(directory, 1, frame_lines(1) + frame_lines(2)[:1])
+    trace = InstructionTrace(directory)
+    assert read_span(trace.span(2)) == frame_lines(2)[0]
+
+    # The trace rotates with frame 2 still going
+    write_segment(directory, 2, frame_lines(2)[1:])
+    assert read_span(trace.span(2)) == "".join(frame_lines(2))
+    write_segment(directory, 2, frame_lines(3))
+    assert read_span(trace.span(2)) == "".join(frame_lines(2))
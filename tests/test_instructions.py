@@ -0,0 +1,48 @@
+from hypertrace.instructions import InstructionTable, diff_frames, find_pc, parse_frame
+
+
+def instruction_log(frame, instructions):
+    """Bytes of an instruction log running (pc, disassembly) pairs in order."""
+    return "".join(f"frame={frame} D0=0 PC={pc:x} -- {pc:06X}: {text}\n" for pc, text in instructions).encode()
+
+
+# A loop around 0x1000 once, then fall through to the return
+PREVIOUS = [
+    (0x1000, "move.w D0,D1"), (0x1002, "subq.w #1,D0"), (0x1004, "bne $1000"),
+    (0x1000, "move.w D0,D1"), (0x1002, "subq.w #1,D0"), (0x1004, "bne $1000"),
+    (0x1006, "addq.w #2,D1"), (0x1008, "rts"),
+]
+# The branch now goes to 0x1040, which jumps back to 0x1006. The beq skips 4 bytes, which is no new block
+CURRENT = [
+    (0x1000, "move.w D0,D1"), (0x1002, "subq.w #1,D0"), (0x1004, "bne $1040"),
+    (0x1040, "tst.w D1"), (0x1042, "beq $1048"), (0x1048, "jmp $1006"),
+    (0x1006, "addq.w #2,D1"), (0x1008, "rts"),
+]
+
+
+def test_new_branch_target():
+    table = InstructionTable()
+    previous = parse_frame(instruction_log(10, PREVIOUS), table)
+    current = parse_frame(instruction_log(11, CURRENT), table)
+    assert previous.registers == {"D0": "0", "PC": "1008"}
+    assert find_pc(current, 0x1040) == 4
+    assert find_pc(previous, 0x1040) is None
+
+    diff = diff_frames(previous, current)
+    # The changed branch and the three instructions it leads to weren't executed before
+    assert diff.line_numbers.tolist() == [3, 4, 5, 6]
+    assert table.strings(diff.instruction_ids) == ["001004: bne $1040", "001040: tst.w D1", "001042: beq $1048",
+                                                   "001048: jmp $1006"]
+    assert diff.new_pcs.tolist() == [0x1040, 0x1042, 0x1048]
+    # 0x1006 was only ever reached by falling through before, now the jmp starts a block there
+    assert diff.new_blocks.tolist() == [0x1006, 0x1040]
+    assert (diff.total, diff.distinct) == (8, 8)
+
+    # Nothing is new running the same frame again, and everything is for the first frame
+    again = diff_frames(current, current)
+    assert (len(again.line_numbers), len(again.new_pcs), len(again.new_blocks)) == (0, 0, 0)
+    first = diff_frames(None, previous)
+    assert first.line_numbers.tolist() == list(range(1, 9))
+    assert first.new_pcs.tolist() == [0x1000, 0x1002, 0x1004, 0x1006, 0x1008]
+    assert first.new_blocks.tolist() == [0x1000]
+    assert (first.total, first.distinct) == (8, 5)
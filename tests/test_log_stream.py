@@ -0,0 +1,94 @@
+import os
+
+import numpy as np
+
+from hypertrace import records
+from hypertrace.log_stream import LogStream, read_session
+
+
+def make_records(frames, per_frame=40):
+    rng = np.random.default_rng(frames[0])
+    recs = np.zeros(len(frames) * per_frame, dtype=records.RECORD_DTYPE)
+    recs["frame"] = np.repeat(frames, per_frame)
+    recs["type"] = rng.integers(0, 2, len(recs))
+    recs["address"] = rng.integers(0, 1 << 24, len(recs))
+    recs["pc"] = rng.integers(0, 1 << 20, len(recs))
+    return recs
+
+
+def append(path, data):
+    with open(path, "ab") as log_file:
+        log_file.write(data)
+
+
+def read_all(reader):
+    """(records, offsets, generations) of every chunk read until the reader has caught up."""
+    chunks = []
+    while True:
+        chunk = reader.read()
+        if chunk is not None and len(chunk[0]):
+            chunks.append((*chunk, np.full(len(chunk[0]), reader.generation)))
+        elif not reader.backlog:
+            return [np.concatenate(parts) for parts in zip(*chunks)] if chunks else None
+
+
+def mapped_files():
+    with open("/proc/self/maps") as maps:
+        return maps.read()
+
+
+def test_rollover_in_the_middle_of_a_frame(tmp_path):
+    path = str(tmp_path / "memory_access.log")
+    recs = make_records([1, 2, 3, 4])
+    size = records.RECORD_DTYPE.itemsize
+    header = records.pack_header()
+
+    append(path, header + recs[:90].tobytes())
+    reader = LogStream(path, max_read_bytes=1000)
+    chunk, _ = reader.read()
+    # Copied out of the mapping, which is closed again
+    assert chunk.base is None
+    if os.path.exists("/proc/self/maps"):
+        assert path not in mapped_files()
+    first, offsets, generations = read_all(reader)
+    np.testing.assert_array_equal(np.concatenate([chunk, first]), recs[:90])
+    assert offsets.tolist() == [len(header) + i * size for i in range(len(chunk), 90)] and not generations.any()
+
+    # Frame 3 carries on past the end of the log: its next records go to the log the emulator renames to .backup,
+    # then into a new log with frame 4, half a record written so far
+    append(path, recs[90:100].tobytes())
+    os.rename(path, path + ".backup")
+    append(path, header + recs[100:].tobytes() + recs[:1].tobytes()[:size // 2])
+    rest, offsets, generations = read_all(reader)
+    np.testing.assert_array_equal(rest, recs[90:])
+    assert offsets[:10].tolist() == [len(header) + i * size for i in range(90, 100)]
+    assert offsets[10:].tolist() == [len(header) + i * size for i in range(60)]
+    assert generations.tolist() == [0] * 10 + [1] * 60
+    assert reader.generation == 1 and reader.position == len(header) + 60 * size
+
+    # The whole session, the backup first
+    np.testing.assert_array_equal(np.concatenate(list(read_session(path))), recs)
+
+
+def test_resume_finishes_the_backup_first(tmp_path):
+    path = str(tmp_path / "memory_access.log")
+    recs = make_records([1, 2, 3])
+    header = records.pack_header()
+    append(path, header + recs[:50].tobytes())
+    reader = LogStream(path)
+    read_all(reader)
+    saved = (reader.log_format, reader.generation, reader.position, reader.signature)
+
+    # Between sessions the log rolls over
+    append(path, recs[50:70].tobytes())
+    os.rename(path, path + ".backup")
+    append(path, header + recs[70:].tobytes())
+
+    resumed = LogStream(path)
+    assert resumed.resume(*saved)
+    rest, _, generations = read_all(resumed)
+    np.testing.assert_array_equal(rest, recs[50:])
+    assert generations.tolist() == [0] * 20 + [1] * 50
+
+    # A log that isn't the one the position belongs to
+    assert not LogStream(str(tmp_path / "other.log")).resume(*saved)
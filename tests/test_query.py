@@ -0,0 +1,70 @@
+import csv
+import os
+import subprocess
+import sys
+
+import numpy as np
+from PIL import Image
+
+from hypertrace import records
+from hypertrace.query import AccessFilter, filter_mask, query, write_reports
+
+ACCESSES = [
+    # frame, type, address, pc, times
+    (10, records.ACCESS_READ, 0xFF0000, 0x100, 1),
+    (11, records.ACCESS_READ, 0xFF0000, 0x100, 3),
+    (11, records.ACCESS_WRITE, 0xFF0011, 0x200, 1),
+    (11, records.ACCESS_READ, 0x000010, 0x300, 1),
+    (12, records.ACCESS_WRITE, 0xFF00F0, 0x200, 2),
+    (12, records.ACCESS_READ, 0xFF0005, 0x104, 1),
+    (13, records.ACCESS_READ, 0xFF0000, 0x100, 1),
+]
+
+
+def write_log(path):
+    recs = np.zeros(sum(times for *_, times in ACCESSES), dtype=records.RECORD_DTYPE)
+    fields = [(frame, access, address, pc) for frame, access, address, pc, times in ACCESSES for _ in range(times)]
+    for name, values in zip(("frame", "type", "address", "pc"), zip(*fields)):
+        recs[name] = values
+    with open(path, "wb") as log_file:
+        log_file.write(records.pack_header() + recs.tobytes())
+    return recs
+
+
+def read_csv(path):
+    with open(path, newline="") as csv_file:
+        return list(csv.reader(csv_file))
+
+
+def test_write_reports(tmp_path):
+    log_path = str(tmp_path / "memory_access.log")
+    recs = write_log(log_path)
+    access_filter = AccessFilter(first_frame=11, last_frame=12, address_start=0xFF0000, address_end=0xFF0100)
+    assert filter_mask(recs, access_filter).tolist() == [False, True, True, True, True, False, True, True, True, False]
+    reads = np.concatenate(list(query(log_path, access_filter._replace(access_type=records.ACCESS_READ))))
+    assert reads["address"].tolist() == [0xFF0000] * 3 + [0xFF0005]
+
+    paths = write_reports(log_path, str(tmp_path / "reports"), access_filter, num_boxes=16, grid_size=4, top=2)
+    memory_csv, memory_png, rom_csv, rom_png, hot_pcs_csv, frames_csv = paths
+
+    # Boxes of 16 addresses over the filtered range, PCs in boxes of 64 KB over the ROM
+    assert read_csv(memory_csv) == [["box", "address", "reads", "writes"], ["0", "0xff0000", "4", "0"],
+                                    ["1", "0xff0010", "0", "1"], ["15", "0xff00f0", "0", "2"]]
+    assert read_csv(rom_csv) == [["box", "address", "accesses"], ["0", "0x0", "7"]]
+    assert read_csv(hot_pcs_csv) == [["pc", "reads", "writes", "accesses"], ["0x100", "3", "0", "3"],
+                                     ["0x200", "0", "3", "3"]]
+    assert read_csv(frames_csv) == [["frame", "reads", "writes", "pcs", "addresses"], ["11", "3", "1", "2", "2"],
+                                    ["12", "1", "2", "2", "2"]]
+    for png in (memory_png, rom_png):
+        with Image.open(png) as image:
+            assert image.size == (4 * 5 + 1, 4 * 5 + 1)
+
+    # The same reports from the command line
+    output = subprocess.run(
+        [sys.executable, "-m", "hypertrace", log_path, str(tmp_path / "cli"), "--frames", "11:12",
+         "--addresses", "0xFF0000:0xFF0100", "--boxes", "16", "--grid-size", "4", "--top", "2"],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))), capture_output=True, text=True, check=True)
+    assert output.stdout.count("Wrote ") == 6
+    for path in paths:
+        if path.endswith(".csv"):
+            assert read_csv(path) == read_csv(os.path.join(tmp_path, "cli", os.path.basename(path)))
@@ -0,0 +1,107 @@
+import struct
+
+import numpy as np
+import pytest
+
+from hypertrace import records
+
+# The layouts mem-file-sync.lua writes with string.pack
+LUA_HEADER = "<4sHHII"  # "<c4I2I2I4I4"
+LUA_BINARY_RECORD = "<IBBHIIII"  # "<I4BBI2I4I4I4I4"
+LUA_SUMMARY_BLOCK = "<II"  # "<I4I4"
+LUA_SUMMARY_ENTRY = "<IIBBHI"  # "<I4I4BBI2I4"
+LUA_PACKED_BLOCK = "<III"  # "<I4I4I4"
+LUA_PACKED_RECORD = "<BBHIIII"  # "<BBI2I4I4I4I4"
+
+ACCESSES = [
+    # frame, type, address, value, size, pc, mask
+    (100, records.ACCESS_READ, 0xFF0010, 0x1234, 2, 0x2A0, 0xFFFF),
+    (100, records.ACCESS_WRITE, 0xFF0012, 0xAB, 1, 0x2A4, 0xFF00),
+    (101, records.ACCESS_READ, 0xA10003, 0xDEADBEEF, 4, 0xFFFFE, 0xFFFFFFFF),
+]
+
+
+def expected_records(accesses):
+    return np.array([(frame, access, size, 0, address, value, pc, mask)
+                     for frame, access, address, value, size, pc, mask in accesses], dtype=records.RECORD_DTYPE)
+
+
+def test_header_round_trip():
+    for log_format, magic, record_size in ((records.FORMAT_BINARY, b"HTRC", 24), (records.FORMAT_SUMMARY, b"HTSM", 16),
+                                           (records.FORMAT_PACKED, b"HTPK", 20)):
+        header = struct.pack(LUA_HEADER, magic, 1, record_size, 0, 0)
+        assert records.pack_header(log_format=log_format) == header
+        assert records.detect_format(header) == log_format
+        assert records.parse_header(header, log_format) == (1, record_size, 0)
+    assert records.detect_format(b"HT") is None  # Too short to tell yet
+    assert records.detect_format(b"100,R,FF0010") == records.FORMAT_CSV
+    with pytest.raises(ValueError):
+        records.parse_header(struct.pack(LUA_HEADER, b"HTRC", 1, 20, 0, 0))
+
+
+def test_decode_binary_leaves_a_partial_record():
+    data = b"".join(struct.pack(LUA_BINARY_RECORD, frame, access, size, 0, address, value, pc, mask)
+                    for frame, access, address, value, size, pc, mask in ACCESSES)
+    recs, offsets, consumed = records.decode(data + data[:10], records.FORMAT_BINARY)
+    np.testing.assert_array_equal(recs, expected_records(ACCESSES))
+    assert offsets.tolist() == [0, 24, 48] and consumed == 72
+
+
+def test_decode_csv_leaves_a_partial_line():
+    lines = [b"%d,%s,%X,%X,%d,%X,%X\n" % (frame, records.ACCESS_CHARS[access].encode(), address, value, size, pc, mask)
+             for frame, access, address, value, size, pc, mask in ACCESSES]
+    data = lines[0] + b"garbage line\n" + b"".join(lines[1:]) + lines[0][:7]
+    recs, offsets, consumed = records.decode(data, records.FORMAT_CSV)
+    np.testing.assert_array_equal(recs, expected_records(ACCESSES))
+    skip = len(lines[0]) + len(b"garbage line\n")
+    assert offsets.tolist() == [0, skip, skip + len(lines[1])]
+    assert consumed == len(data) - 7
+
+
+def test_decode_summary_blocks():
+    entries = [(0x2A0, 0xFF0010, records.ACCESS_READ, 7), (0x2A4, 0xFF0012, records.ACCESS_WRITE, 1)]
+    block = struct.pack(LUA_SUMMARY_BLOCK, 100, len(entries)) + b"".join(
+        struct.pack(LUA_SUMMARY_ENTRY, pc, address, access, 0, 0, count) for pc, address, access, count in entries)
+    empty_block = struct.pack(LUA_SUMMARY_BLOCK, 101, 0)
+    next_block = struct.pack(LUA_SUMMARY_BLOCK, 102, 1) + struct.pack(LUA_SUMMARY_ENTRY, 0x300, 0x10, 0, 0, 0, 3)
+
+    data = block + empty_block + next_block
+    for end in (len(data) - 1, len(block) + len(empty_block) + 4):  # Halfway through the last block or its header
+        recs, offsets, consumed = records.decode(data[:end], records.FORMAT_SUMMARY)
+        assert recs.dtype == records.COUNTED_RECORD_DTYPE
+        assert consumed == len(block) + len(empty_block)
+        assert recs["frame"].tolist() == [100, 100] and offsets.tolist() == [0, 0]
+        assert recs[["pc", "address", "type", "count"]].tolist() == entries
+        assert records.record_counts(recs).tolist() == [7, 1]
+
+    recs, offsets, consumed = records.decode(data, records.FORMAT_SUMMARY)
+    assert consumed == len(data) and recs["frame"].tolist() == [100, 100, 102]
+    assert offsets.tolist() == [0, 0, len(block) + len(empty_block)]
+
+
+def packed_block(frame, distinct, indices):
+    """A packed block as write_packed builds it: u2 indices, u4 ones past 0xFFFF distinct records."""
+    index_format = "I" if len(distinct) > 0xFFFF else "H"
+    return (struct.pack(LUA_PACKED_BLOCK, frame, len(indices), len(distinct))
+            + b"".join(struct.pack(LUA_PACKED_RECORD, access, size, 0, address, value, pc, mask)
+                       for access, address, value, size, pc, mask in distinct)
+            + struct.pack(f"<{len(indices)}{index_format}", *indices))
+
+
+def test_decode_packed_with_u2_and_u4_indices():
+    distinct = [access[1:] for access in ACCESSES]
+    small = packed_block(100, distinct, [0, 1, 0, 2, 2])
+    # More distinct records than a u2 index can tell apart
+    many = [(records.ACCESS_READ, address, 0, 1, 0x400, 0xFF) for address in range(0x10001)]
+    large = packed_block(101, many, [0x10000, 5, 0x10000])
+
+    data = small + large
+    recs, offsets, consumed = records.decode(data[:-1], records.FORMAT_PACKED)
+    assert consumed == len(small)
+    np.testing.assert_array_equal(recs, expected_records([(100,) + distinct[i] for i in (0, 1, 0, 2, 2)]))
+    assert offsets.tolist() == [0] * 5
+
+    recs, offsets, consumed = records.decode(data, records.FORMAT_PACKED)
+    assert consumed == len(data)
+    assert recs["frame"][5:].tolist() == [101] * 3 and recs["address"][5:].tolist() == [0x10000, 5, 0x10000]
+    assert offsets[5:].tolist() == [len(small)] * 3
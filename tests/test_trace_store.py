@@ -0,0 +1,40 @@
+import numpy as np
+
+from hypertrace import records
+from hypertrace.instruction_trace import segment_path
+from hypertrace.trace_store import TraceStore, _instruction_dictionary, compile_store
+
+
+def write_segments(directory, frames, frames_per_segment):
+    """A streamed instruction trace: frame=N lines split over trace-NNNNN.log segments."""
+    for first in range(0, len(frames), frames_per_segment):
+        with open(segment_path(directory, first // frames_per_segment + 1), "w") as segment:
+            for frame in frames[first:first + frames_per_segment]:
+                for pc in range(0x1000, 0x1010, 2):
+                    segment.write(f"frame={frame} D0={frame:x} PC={pc:x} -- {pc:06X}: op{frame}_{pc:x}\n")
+
+
+def test_compile_store_from_trace_segments(tmp_path):
+    instructions_dir = tmp_path / "instructions"
+    instructions_dir.mkdir()
+    write_segments(str(instructions_dir), list(range(100, 110)), 3)
+
+    recs = np.zeros(40, dtype=records.RECORD_DTYPE)
+    recs["frame"] = np.repeat(np.arange(100, 110), 4)
+    recs["address"] = np.arange(40) * 2
+    recs["pc"] = 0x1000
+    log_path = tmp_path / "memory_access.log"
+    log_path.write_bytes(records.pack_header() + recs.tobytes())
+
+    assert compile_store(str(log_path), str(instructions_dir), str(tmp_path / "store")) == 40
+    store = TraceStore(str(tmp_path / "store"))
+    np.testing.assert_array_equal(store.records(0, 40), recs)
+    # The first text seen for every PC, which is in the first segment
+    assert store.instruction(0x1004) == "001004: op100_1004"
+    assert [pc for pc, _ in store.instructions_in(0x1000, 0x2000)] == list(range(0x1000, 0x1010, 2))
+
+    # Reading a few lines at a time finds the same instructions as reading the segments in one go
+    batched = _instruction_dictionary(str(instructions_dir), batch_lines=5)
+    whole = _instruction_dictionary(str(instructions_dir))
+    for batched_array, whole_array in zip(batched, whole):
+        np.testing.assert_array_equal(batched_array, whole_array)
@@ -1,10 +1,31 @@
+import argparse
 import tkinter as tk
 import os
-import colorsys
 import time
-import math
 
-from PIL import Image, ImageTk
+import numpy as np
+from PIL import ImageTk
+
+from hypertrace import heatmap, ingest
+from hypertrace.connections import ConnectionLayer
+from hypertrace.frame_index import FrameIndex
+from hypertrace.frame_loader import FrameLoader, LoadedFrame
+from hypertrace.frame_store import FrameStore
+from hypertrace.geometry import GridGeometry
+from hypertrace.histogram import AccessHistogram
+from hypertrace.instruction_trace import InstructionTrace
+from hypertrace.instructions import InstructionCache, diff_frames, find_pc
+from hypertrace.line_index import LineIndex
+from hypertrace.paged_text import PagedText
+from hypertrace.log_stream import LogStream
+from hypertrace.screenshots import ScreenshotCache
+from hypertrace.trace_store import StoreReader, TraceStore
+
+parser = argparse.ArgumentParser(description="HyperTrace vizualiser")
+parser.add_argument("--store", help="open a trace store made by python3 -m hypertrace.trace_store, not the live log")
+args = parser.parse_args()
+# A compiled trace store, None when following memory_access.log
+trace_store = TraceStore(args.store) if args.store else None
 
 root = tk.Tk()
 # ----------------- MAIN FRAME --------------------------------------------------
@@ -20,6 +41,9 @@ canvas_height = 520  # Shared height for both grids
 main_canvas = tk.Canvas(main_frame, width=canvas_width, height=canvas_height, bg="gray", borderwidth=0, highlightthickness=0)
 main_canvas.pack(fill="both", expand=True)
 
+# How the grids are drawn: "image" paints each grid as a single PhotoImage, "rectangles" uses one canvas item per box
+render_backend = "image"
+
 # overlay_canvas.wm_attributes('-transparentcolor', 'white')
 # ----------------- CODE FRAME --------------------------------------------------
 # Parameters for ROM visualization
@@ -32,7 +56,7 @@ rom_section_padding = 5
 rom_section_box_square_size = (rom_section_width - (rom_section_padding * 2)) / rom_section_grid_size
 rom_section_addresses_per_box = rom_size // rom_section_num_boxes # how many addresses does each box represent?
 # Initialize ROM access counts
-rom_section_access_counts = [0] * rom_section_num_boxes
+rom_section_access_counts = np.zeros(rom_section_num_boxes, dtype=np.int64)
 rom_section_x_offset = 10
 rom_section_y_offset = 50
 
@@ -58,14 +82,11 @@ mem_section_box_square_size = (rom_section_width - (rom_section_padding * 2)) /
 mem_section_addresses_per_box = rom_size // rom_section_num_boxes # how many addresses does each box represent?
 mem_section_x_offset = x_offset=canvas_width // 2 + 10
 mem_section_y_offset = 50
-# Initialize global read and write counts for the entire memory size, not just num_boxes
-# This assumes each "box" at the top level corresponds to a smaller chunk of the total memory size.
-mem_total_boxes = mem_section_memory_size // mem_section_box_size  # Determine total boxes for the entire memory range
-global_read_counts = [0] * mem_total_boxes
-global_write_counts = [0] * mem_total_boxes
+# Read and write counts of every address in the entire memory size, re-binned into boxes for whatever range is shown
+access_histogram = AccessHistogram(mem_section_memory_size)
 # Initialize the main read_counts and write_counts for the initial viewable range
-mem_read_counts = global_read_counts[:mem_section_num_boxes]
-mem_write_counts = global_write_counts[:mem_section_num_boxes]
+mem_read_counts = np.zeros(mem_section_num_boxes, dtype=np.int64)
+mem_write_counts = np.zeros(mem_section_num_boxes, dtype=np.int64)
 
 # Create the memory code frame
 mem_frame = tk.Frame(main_frame)
@@ -80,21 +101,58 @@ memory_range_label.place(x=canvas_width // 2 + 10, y=10)  # Position above Memor
 instructions_scrollbar = tk.Scrollbar(root, orient="horizontal")
 instructions_scrollbar.pack(side="bottom", fill="x")
 
+# The instructions of the shown frame, with a box to jump to a line or PC in them
+instructions_frame = tk.Frame(root)
+instructions_frame.pack(side="right", padx=10)
+jump_label = tk.Label(instructions_frame, text="Jump to line or PC (e.g. 1200 or PC=1A2B):")
+jump_label.pack(side="top", anchor="w")
+jump_entry = tk.Entry(instructions_frame)
+jump_entry.pack(side="top", fill="x")
+jump_entry.bind("<Return>", lambda event: jump_to_instruction(jump_entry.get()))
+
 # Add the Text widget for instructions with a scrollbar
 frame_instructions_text = tk.Text(
-    root,
+    instructions_frame,
     width=40,  # Adjust width to fit your needs
     height=30,  # Adjust height to fit your needs
     wrap="none",  # Prevent text wrapping
     font=("Courier", 10),  # Use monospaced font for alignment
     xscrollcommand=instructions_scrollbar.set
 )
-frame_instructions_text.pack(side="right", padx=10)
+frame_instructions_text.pack(side="left")
+instructions_vertical_scrollbar = tk.Scrollbar(instructions_frame, orient="vertical")
+instructions_vertical_scrollbar.pack(side="right", fill="y")
 
 # Configure the scrollbar to work with the Text widget
 instructions_scrollbar.config(command=frame_instructions_text.xview)
 
-# Add a Text widget for displaying the diff results
+# Logs are read a page at a time straight from the file (see shown_log), never inserted whole
+frame_instructions_view = PagedText(frame_instructions_text, instructions_vertical_scrollbar)
+shown_log = None  # LineIndex of the shown frame's instruction log
+shown_instructions = None  # And its instructions.ParsedFrame
+
+# Scroll the instructions to a line number, or to the first time the frame ran a PC ("PC=1A2B", "$1A2B", "0x1A2B")
+def jump_to_instruction(target):
+    target = target.strip()
+    if shown_log is None or not target:
+        return
+    try:
+        if target.upper().startswith(("PC=", "$", "0X")):
+            pc = int(target.split("=")[-1].lstrip("$"), 16)
+            line_number = find_pc(shown_instructions, pc)
+            if line_number is None:
+                print(f"PC {pc:X} was not executed in this frame")
+                return
+        else:
+            line_number = int(target)
+    except ValueError:
+        print(f"Not a line number or PC: {target}")
+        return
+    frame_instructions_view.scroll_to(line_number - 1)
+
+# Add a Text widget for displaying the diff results, scrolled a page at a time however long the diff is
+frame_diff_scrollbar = tk.Scrollbar(root, orient="vertical")
+frame_diff_scrollbar.pack(side="right", fill="y")
 frame_diff_text = tk.Text(
     root,
     width=40,  # Adjust width to fit your needs
@@ -103,6 +161,7 @@ frame_diff_text = tk.Text(
     font=("Courier", 10)  # Use monospaced font for alignment
 )
 frame_diff_text.pack(side="right", padx=10)
+frame_diff_view = PagedText(frame_diff_text, frame_diff_scrollbar)
 
 # Placeholder for the image widget
 frame_image_label = tk.Label(root)
@@ -121,19 +180,6 @@ def update_frame_progress(the_frame):
 #registers_label.pack(side="top", padx=10, pady=5)
 
 
-def extract_registers(instruction_lines):
-    """Extract register values from the instruction lines."""
-    registers = {}
-    for line in instruction_lines:
-        if "--" in line:
-            parts = line.split("--")[0].split()  # Take the part before the "--"
-            for part in parts:
-                if "=" in part:
-                    reg, value = part.split("=")
-                    if reg.startswith("D") or reg.startswith("A") or reg == "PC":
-                        registers[reg] = value.strip()
-    return registers
-
 def diff_registers(prev_registers, curr_registers):
     """Compare registers between frames and return the changed ones."""
     changed_registers = {}
@@ -143,25 +189,23 @@ def diff_registers(prev_registers, curr_registers):
             changed_registers[reg] = (prev_value, curr_value)  # Store previous and current values
     return changed_registers
 
-def preprocess_instructions(instruction_lines):
-    """Preprocess instruction lines: remove 'frame=####' and extract instructions after '--'."""
-    processed_instructions = []
-    for line_number, line in enumerate(instruction_lines, start=1):
-        if "--" in line:
-            try:
-                # Split on '--' and take the part after it
-                _, instruction = line.split("--", 1)
-                processed_instructions.append((line_number, instruction.strip()))
-            except ValueError:
-                continue  # Skip lines that don't conform to the expected format
-    return processed_instructions
-
-def diff_instructions(prev_instructions, curr_instructions):
-    """Diff two sets of instructions and return new instructions."""
-    # Extract only the instruction strings for comparison
-    prev_set = {instr for _, instr in prev_instructions}
-    new_instructions = [(line_number, instr) for line_number, instr in curr_instructions if instr not in prev_set]
-    return new_instructions
+# The lines shown for an instructions.InstructionDiff: a summary, then every new instruction, built a page at a time
+def diff_view_lines(diff):
+    summary = [
+        f"New instructions: {len(diff.line_numbers)} of {diff.total} executed ({diff.distinct} distinct)",
+        f"New PCs: {len(diff.new_pcs)}, new basic blocks: {len(diff.new_blocks)}",
+    ]
+    if not len(diff.line_numbers):
+        summary.append("No new instructions in this frame.")
+
+    def get_lines(start, stop):
+        lines = summary[start:stop]
+        start = max(start - len(summary), 0)
+        stop = max(stop - len(summary), 0)
+        line_numbers = diff.line_numbers[start:stop].tolist()
+        instructions = instruction_cache.table.strings(diff.instruction_ids[start:stop])
+        return lines + [f"Line {line_number}: {instr}" for line_number, instr in zip(line_numbers, instructions)]
+    return len(summary) + len(diff.line_numbers), get_lines
 
 # Function to update the memory range label
 def update_memory_range_label(memory_start=None, memory_end=None):
@@ -170,12 +214,26 @@ def update_memory_range_label(memory_start=None, memory_end=None):
         memory_end = mem_section_num_boxes * mem_section_box_size - 1  # Default end
     memory_range_label.config(text=f"Memory Range: {hex(memory_start)} - {hex(memory_end)}")
 
+# The memory window the ingest thread should count accesses into
+def current_mem_window():
+    return ingest.BoxWindow(current_memory_start, mem_section_box_size, mem_section_num_boxes)
+
+# Zooming only changes data: recount the boxes of the current window from the address histogram and recolor the grid
+def rebin_memory_counts():
+    global mem_read_counts, mem_write_counts
+    window = current_mem_window()
+    mem_read_counts, mem_write_counts = access_histogram.rebin(window)
+    ingest_worker.set_window(window)
+    connection_layer.clear()  # Drawn for the previous range
+    update_memory_grid()
+
 # Create the Reset button
 def reset_map():
     global mem_read_counts, mem_write_counts, mem_section_box_size
     mem_section_box_size = mem_section_memory_size // mem_section_num_boxes  # Reset box size to the original full range
-    mem_read_counts = [0] * mem_section_num_boxes
-    mem_write_counts = [0] * mem_section_num_boxes
+    mem_read_counts = np.zeros(mem_section_num_boxes, dtype=np.int64)
+    mem_write_counts = np.zeros(mem_section_num_boxes, dtype=np.int64)
+    ingest_worker.set_window(current_mem_window())
     update_memory_grid()
     update_memory_range_label()  # Update label after reset
 
@@ -193,35 +251,29 @@ zoom_out_button = tk.Button(root, text="Zoom Out", command=lambda: zoom_out())
 
 # Function to zoom out and reset the view to the original memory range
 def zoom_out():
-    global current_memory_start, current_memory_end, mem_section_box_size, mem_read_counts, mem_write_counts
+    global current_memory_start, current_memory_end, mem_section_box_size
 
     # Reset to the original memory range
     current_memory_start = 0
     current_memory_end = mem_section_memory_size - 1
     mem_section_box_size = mem_section_memory_size // mem_section_num_boxes
 
-    # Update the main read_counts and write_counts to the full range
-    mem_read_counts = global_read_counts[:mem_section_num_boxes]
-    mem_write_counts = global_write_counts[:mem_section_num_boxes]
-
     # Hide the Zoom Out button
     zoom_out_button.place_forget()
 
     # Update the displayed memory range label
     update_memory_range_label(current_memory_start, current_memory_end)
 
-    # Redraw the initial grid
-    draw_memory_grid()
+    # Update the main read_counts and write_counts to the full range and recolor the grid
+    rebin_memory_counts()
 
 # Update the zoom function to show the Zoom Out button when zooming in
 def zoom_into_box(event):
     global mem_section_box_size, current_memory_start, current_memory_end
-    padding = 5
-    col = (event.x - padding) // ((mem_section_width - 2 * padding) // mem_section_grid_size)
-    row = (event.y - padding) // ((mem_section_height - 2 * padding) // mem_section_grid_size)
-    box_index = row * mem_section_grid_size + col
-    
-    if 0 <= box_index < mem_section_num_boxes:
+    box_index = mem_geometry.box_at(event.x, event.y)
+
+    # Only double-clicks on the memory grid zoom
+    if box_index is not None:
         # Calculate the memory range for the selected box within the current visible range
         memory_range = current_memory_end - current_memory_start + 1
         box_memory_size = memory_range // mem_section_num_boxes
@@ -238,155 +290,53 @@ def zoom_into_box(event):
         # Update the displayed memory range label to focus on this box's range
         update_memory_range_label(new_memory_start, new_memory_end)
 
-        # Update the read and write counts for the zoomed range
-        update_zoomed_counts()
-
-        # Redraw the grid based on the new memory range
-        draw_memory_grid()
+        # Update the read and write counts for the zoomed range and recolor the grid
+        rebin_memory_counts()
 
         # Show the Zoom Out button after zooming in
         zoom_out_button.place(x=10, y=mem_section_height + 50)
 
-# Update read_counts and write_counts when zooming to the zoomed memory range
-def update_zoomed_counts():
-    global mem_read_counts, mem_write_counts
-    # Calculate the range of indexes in the global counts array for the zoomed range
-    start_index = int(current_memory_start / mem_section_memory_size * len(global_read_counts))
-    end_index = start_index + mem_section_num_boxes
-
-    # Slice and pad to ensure we have exactly num_boxes elements
-    mem_read_counts = global_read_counts[start_index:end_index]
-    mem_write_counts = global_write_counts[start_index:end_index]
-
-    # If the sliced range is shorter than num_boxes, pad with zeros
-    mem_read_counts += [0] * (mem_section_num_boxes - len(mem_read_counts))
-    mem_write_counts += [0] * (mem_section_num_boxes - len(mem_write_counts))
-
 # Bind double-click event to zoom into the clicked box
 main_canvas.bind("<Double-Button-1>", zoom_into_box)
 
-# Draw initial boxes on the canvas and keep track of them by tags
-box_tags = []
-
-# Function to map PC and memory addresses to their grid positions
-def get_box_coordinates(x_offset, y_offset, grid_size, num_boxes, grid_width, grid_height, address, box_size):
-    """Calculate the grid coordinates for a given address."""
-    box_index = address // box_size
-    if 0 <= box_index < num_boxes:
-        padding = 5  # Grid padding
-        row = box_index // grid_size
-        col = box_index % grid_size
-        x0 = x_offset + padding + col * ((grid_width - 2 * padding) // grid_size)
-        x1 = x0 + ((grid_width - 2 * padding) // grid_size)
-        y0 = y_offset + padding + row * ((grid_height - 2 * padding) // grid_size)
-        y1 = y0 + ((grid_height - 2 * padding) // grid_size)
-        return (x0 + x1) // 2, (y0 + y1) // 2  # Return the center of the box
-    return None
+def draw_rom_to_mem_connections(access_data):
+    """Draw connections between ROM (PC) and memory boxes, replacing the previous ones."""
+    connection_layer.draw(access_data, rom_window, current_mem_window())
 
 
-def draw_rom_to_mem_connections(access_data):
-    """Draw connections between ROM (PC) and memory boxes."""
-    #if frame_by_frame_mode:
-    main_canvas.delete("connection")  # Clear previous connections
-
-    unique_connections = set()  # Track unique connections
-
-    for pc, access_type, mem_address in access_data:
-        # Get ROM and memory coordinates
-        rom_coords = get_box_coordinates(
-            rom_section_x_offset, rom_section_y_offset, rom_section_grid_size, rom_section_num_boxes, rom_section_width, rom_section_height, int(pc, 16), rom_section_addresses_per_box
-        )
-        mem_coords = get_box_coordinates(
-            mem_section_x_offset, mem_section_y_offset, mem_section_grid_size, mem_section_num_boxes, mem_section_width, mem_section_height, int(mem_address, 16), mem_section_box_size
-        )
-
-        if rom_coords and mem_coords:
-            connection = (rom_coords, mem_coords, access_type)
-            if connection not in unique_connections:
-                unique_connections.add(connection)
-                color = "blue" if access_type == "R" else "green"  # Blue for reads, green for writes
-                main_canvas.create_line(
-                    *rom_coords, *mem_coords, fill=color, width=1, tags="connection"
-                )
+# Where the boxes of each grid are, used for all drawing and hit-testing
+rom_geometry = GridGeometry(rom_section_x_offset, rom_section_y_offset, rom_section_width, rom_section_height,
+                            rom_section_grid_size, rom_section_num_boxes)
+mem_geometry = GridGeometry(mem_section_x_offset, mem_section_y_offset, mem_section_width, mem_section_height,
+                            mem_section_grid_size, mem_section_num_boxes)
 
+# Create the renderer for a grid of boxes, see render_backend
+def make_grid(geometry, box_square_size, tag_prefix):
+    if render_backend == "image":
+        return heatmap.GridImage(main_canvas, geometry)
+    return heatmap.GridRectangles(main_canvas, geometry, box_square_size, tag_prefix)
+
+rom_grid = make_grid(rom_geometry, rom_section_box_square_size, "rom_box_")
+mem_grid = make_grid(mem_geometry, mem_section_box_square_size, "box_")
 
 # Draw initial ROM grid
 def draw_rom_grid():
     print("Drawing grid")
-    #rom_canvas.delete("all")  # Clear the canvas
-    padding = 5  # Padding around the grid
-    for i in range(rom_section_num_boxes):
-        row = i // rom_section_grid_size
-        col = i % rom_section_grid_size
-        x0 = rom_section_x_offset + padding + col * ((rom_section_width - 2 * padding) // rom_section_grid_size)
-        x1 = x0 + rom_section_box_square_size
-        y0 = rom_section_y_offset + padding + row * ((rom_section_height - 2 * padding) // rom_section_grid_size)
-        y1 = y0 + rom_section_box_square_size
-
-        #if col == 99:
-        main_canvas.create_rectangle(x0, y0, x1, y1, outline="lightgray", fill="white", tags=f"rom_box_{i}")
+    rom_grid.draw()
 
 draw_rom_grid()
 
-def update_rom_grid(pc_values):
-    """Update the ROM grid based on PC values (single or list)."""
-    global rom_section_access_counts
-    #rom_access_counts = [0] * rom_num_boxes  # Reset access counts
-
-    print(f"Number of elements in pc_values: {len(pc_values)}")
-    #pc_values = set(pc_values)
-    # Normalize input to ensure it's a list
-    if not isinstance(pc_values, list):
-        pc_values = [pc_values]  # Convert single value to a list
-
-    # Convert all PC values to integers
-    pc_values = [int(pc, 16) if isinstance(pc, str) else pc for pc in pc_values]
-
-    # Map PC values to grid boxes
-    for pc in pc_values:
-        box_index = pc // rom_section_addresses_per_box
-        if 0 <= box_index < rom_section_num_boxes:
-            rom_section_access_counts[box_index] += 1
-
-    print(f"Number of ints in pc_values: {len(pc_values)}")
-
-    # Update colors on the grid with logarithmic scaling
-    max_access = max(rom_section_access_counts) if rom_section_access_counts else 1  # Avoid division by zero
-    for i in range(rom_section_num_boxes):
-        if rom_section_access_counts[i] > 0:
-            # Apply logarithmic scaling
-            intensity = int((math.log(rom_section_access_counts[i] + 1) / math.log(max_access + 1)) * 255)
-        else:
-            intensity = 0  # No access, set intensity to 0
-        color = f"#{255 - intensity:02x}{255 - intensity:02x}{255 - intensity:02x}"  # Grayscale
-        main_canvas.itemconfig(f"rom_box_{i}", fill=color)
-
-# Extract PC values from instruction logs
-def extract_pc_values(instruction_lines):
-    pc_values = []
-    for line in instruction_lines:
-        if "PC=" in line:
-            parts = line.split()
-            for part in parts:
-                if part.startswith("PC="):
-                    pc = int(part.split("=")[1], 16)  # Convert hexadecimal to integer
-                    pc_values.append(pc)
-    return pc_values
-       
+def draw_rom_counts():
+    """Recolor the ROM grid from rom_section_access_counts."""
+    # Update colors on the grid with logarithmic scaling, only boxes whose color changed are redrawn
+    rom_grid.update(heatmap.rom_colors(rom_section_access_counts))
+
+# PC values are counted into the ROM grid boxes from address 0
+rom_window = ingest.BoxWindow(0, rom_section_addresses_per_box, rom_section_num_boxes)
+
 def draw_memory_grid():
     print("drawing memory grid")
-    #mem_canvas.delete("all")  # Clear existing boxes
-    padding = 5  # 5 pixels of padding
-    for i in range(mem_section_num_boxes):
-        row = i // mem_section_grid_size
-        col = i % mem_section_grid_size
-        x0 = mem_section_x_offset + padding + col * ((mem_section_width - 2 * padding) // mem_section_grid_size)
-        x1 = x0 + mem_section_box_square_size
-        y0 = mem_section_y_offset + padding + row * ((mem_section_height - 2 * padding) // mem_section_grid_size)
-        y1 = y0 + mem_section_box_square_size
-        tag = f"box_{i}"
-        main_canvas.create_rectangle(x0, y0, x1, y1, outline="lightgray", fill="white", tags=tag)
-        box_tags.append(tag)
+    mem_grid.draw()
 
 draw_memory_grid()
 update_memory_range_label()  # Initialize label
@@ -421,111 +371,62 @@ def draw_legend():
     mem_canvas.create_text(legend_x + 20, legend_y + 6 * legend_spacing, anchor="nw", text="Reads and Writes (High)", font=("Arial", 10))
 
 # draw_legend()
-current_colors = ["white"] * mem_section_num_boxes
 
 # For flashing indicators
-prev_read_counts = [0] * mem_section_num_boxes
-prev_write_counts = [0] * mem_section_num_boxes
+prev_read_counts = np.zeros(mem_section_num_boxes, dtype=np.int64)
+prev_write_counts = np.zeros(mem_section_num_boxes, dtype=np.int64)
 threshold = 1  # Number of reads/writes to trigger flashing
-
-def precompute_gradients():
-    max_steps = 100  # Define a reasonable number of gradient levels
-    read_colors = []
-    write_colors = []
-    for i in range(max_steps):
-        ratio = i / (max_steps - 1)
-        # Precompute read-only colors (light blue to dark blue)
-        r = int((173 * (1 - ratio)) + (0 * ratio))
-        g = int((216 * (1 - ratio)) + (0 * ratio))
-        b = int((230 * (1 - ratio)) + (139 * ratio))
-        read_colors.append(f"#{r:02x}{g:02x}{b:02x}")
-
-        # Precompute write-only colors (light green to dark green)
-        r = int((144 * (1 - ratio)) + (0 * ratio))
-        g = int((238 * (1 - ratio)) + (100 * ratio))
-        b = int((144 * (1 - ratio)) + (0 * ratio))
-        write_colors.append(f"#{r:02x}{g:02x}{b:02x}")
-
-    return read_colors, write_colors
-
-read_gradient, write_gradient = precompute_gradients()
-
-def update_memory_grid():
-    max_accesses = max(mem_read_counts[i] + mem_write_counts[i] for i in range(mem_section_num_boxes))
-    if max_accesses == 0:
-        max_accesses = 1  # Avoid division by zero
-
-    update_operations = []
-    for i in range(mem_section_num_boxes):
-        read_count = mem_read_counts[i]
-        write_count = mem_write_counts[i]
-        total_accesses = read_count + write_count
-
-        max_steps = 100
-        if total_accesses == 0:
-            color = "white"
-        elif read_count > 0 and write_count == 0:
-            ratio_index = min(int((read_count / max_accesses) * (max_steps - 1)), max_steps - 1)
-            color = read_gradient[ratio_index]
-        elif write_count > 0 and read_count == 0:
-            ratio_index = min(int((write_count / max_accesses) * (max_steps - 1)), max_steps - 1)
-            color = write_gradient[ratio_index]
-        else:
-            ratio = min(total_accesses / max_accesses, 1)
-            hue = (1 - ratio) * 0.15
-            r, g, b = colorsys.hsv_to_rgb(hue, 1, 1)
-            color = f"#{int(r * 255):02x}{int(g * 255):02x}{int(b * 255):02x}"
-
-        # Batch updates to reduce individual itemconfig calls
-        if current_colors[i] != color:
-            update_operations.append((box_tags[i], color))
-            current_colors[i] = color
-
-        # Calculate read/write difference for flashing
-        read_diff = mem_read_counts[i] - prev_read_counts[i]
-        write_diff = mem_write_counts[i] - prev_write_counts[i]
-
-        # Update the previous counts for the next cycle
-        prev_read_counts[i] = read_count
-        prev_write_counts[i] = write_count
-
-        if read_diff > threshold or write_diff > threshold:
-            flash_after_memory_access(i)
-
-    for tag, color in update_operations:
-        main_canvas.itemconfig(tag, fill=color)
+flash_layer = heatmap.FlashLayer(main_canvas, mem_grid)  # Reuses a fixed number of crosses whatever is flashing
+# Lines from code to memory, bundled between regions of the grids when there are too many to draw
+connection_layer = ConnectionLayer(main_canvas, rom_geometry, mem_geometry)
+
+# Light to dark blue for reads only, light to dark green for writes only, as RGB arrays for coloring all boxes at once
+read_gradient_rgb, write_gradient_rgb = heatmap.memory_gradients()
+
+# Busiest box so far, and the count the colors are currently scaled to (see heatmap.color_scale)
+mem_max_accesses = 0
+mem_color_scale = 1
+
+def update_memory_grid(boxes=None):
+    """Recolor the memory grid.
+
+    boxes holds the indices of the only boxes whose counts went up since the previous call,
+    or None when any box may have changed (zooming, switching frames)."""
+    global mem_max_accesses, mem_color_scale
+    if boxes is None:
+        mem_max_accesses = int((mem_read_counts + mem_write_counts).max())
+    elif len(boxes):
+        mem_max_accesses = max(mem_max_accesses, int((mem_read_counts[boxes] + mem_write_counts[boxes]).max()))
+
+    # Everything is only recolored when the busiest box crosses into the next color bucket
+    scale = heatmap.color_scale(mem_max_accesses)
+    if boxes is None or scale != mem_color_scale:
+        mem_color_scale = scale
+        boxes = np.arange(mem_section_num_boxes)
+
+    # Color the boxes at once, the grid only redraws the ones whose color changed
+    read_counts = mem_read_counts[boxes]
+    write_counts = mem_write_counts[boxes]
+    colors = heatmap.memory_colors(read_counts, write_counts, mem_color_scale, read_gradient_rgb, write_gradient_rgb)
+    mem_grid.update(colors, boxes)
+
+    # Calculate read/write difference for flashing
+    read_diff = read_counts - prev_read_counts[boxes]
+    write_diff = write_counts - prev_write_counts[boxes]
+
+    # Update the previous counts for the next cycle
+    prev_read_counts[boxes] = read_counts
+    prev_write_counts[boxes] = write_counts
+
+    flash_layer.flash(boxes[(read_diff > threshold) | (write_diff > threshold)])
 
     main_canvas.update()  # Finally update the canvas
 
-def flash_after_memory_access(index):
-    # Determine the coordinates for the box
-    row = index // mem_section_grid_size
-    col = index % mem_section_grid_size
-    padding = 5
-    box_width = (mem_section_width - 2 * padding) // mem_section_grid_size
-    box_height = (mem_section_height - 2 * padding) // mem_section_grid_size
-    x0 = mem_section_x_offset + padding + col * box_width
-    y0 = mem_section_y_offset + padding + row * box_height
-    x1 = x0 + box_width
-    y1 = y0 + box_height
-
-    # Draw the yellow "X"
-    x_tag = f"flash_x_{index}"
-    line1 = main_canvas.create_line(x0, y0, x1, y1, fill="yellow", width=2, tags=x_tag)
-    line2 = main_canvas.create_line(x0, y1, x1, y0, fill="yellow", width=2, tags=x_tag)
-
-    # Remove the "X" after a short delay to create a flashing effect
-    main_canvas.after(300, lambda: main_canvas.delete(x_tag))
-
-
 # Display memory information when hovering over a box
 def on_mem_hover(event):
-    padding = 5
-    col = (event.x - padding) // ((mem_section_width - 2 * padding) // mem_section_grid_size)
-    row = (event.y - padding) // ((mem_section_height - 2 * padding) // mem_section_grid_size)
-    box_index = row * mem_section_grid_size + col
-    
-    if 0 <= box_index < mem_section_num_boxes:  # Ensure box_index is within bounds
+    box_index = mem_geometry.box_at(event.x, event.y)
+
+    if box_index is not None:  # Ensure the mouse is over a box
         # Calculate the memory range for the current box in the zoomed range
         memory_range_start = current_memory_start + box_index * mem_section_box_size
         memory_range_end = memory_range_start + mem_section_box_size - 1
@@ -545,77 +446,107 @@ def on_mem_leave(event):
 # OUT main_canvas.bind("<Leave>", on_mem_leave)
 
 
+# The box under the mouse, ("rom" or "mem", index), and the tooltip showing it
+hovered_box = None
+hover_text = main_canvas.create_text(0, 0, anchor="nw", tags="hover_rom_text", fill="black", state="hidden")
+hover_instructions = 8  # Instructions of the box listed in the tooltip when a trace store is open
+
 # Display memory information when hovering over a box
 def on_rom_hover(event):
-    # ROM Section Hover
-    if ((rom_section_x_offset + rom_section_width) < event.x < mem_section_x_offset
-            or event.x < rom_section_x_offset
-            or event.y < rom_section_y_offset):
-        main_canvas.delete("hover_rom_text")
-
-    if((
-            rom_section_x_offset <= event.x <= rom_section_x_offset + rom_section_width) and event.y >= rom_section_y_offset):
-        padding = 5
-        col = (event.x - rom_section_x_offset - padding) // ((rom_section_width - 2 * padding) // rom_section_grid_size)
-        row = (event.y - rom_section_y_offset - padding) // ((rom_section_height - 2 * padding) // rom_section_grid_size)
-        box_index = row * rom_section_grid_size + col
-
-        if 0 <= box_index < rom_section_num_boxes:  # Ensure box_index is within bounds
-            # Calculate the memory range for the current box in the zoomed range
-            memory_range_start = current_memory_start + box_index * rom_section_addresses_per_box
-            memory_range_end = memory_range_start + rom_section_addresses_per_box - 1
-
-
-
-            access_count = rom_section_access_counts[box_index]
-            info_text = (f"ROM Code Range: {hex(memory_range_start)} - {hex(memory_range_end)}\n"
-                         f"Access Count: {access_count}")
-            main_canvas.delete("hover_rom_text")
-            main_canvas.create_text(event.x, event.y, text=info_text, anchor="nw", tags="hover_rom_text", fill="black")
-    # Memory Section Hover
-    if ((
-            mem_section_x_offset <= event.x <= mem_section_x_offset + mem_section_width) and event.y >= mem_section_y_offset):
-        padding = 5
-        col = (event.x - mem_section_x_offset - padding) // ((mem_section_width - 2 * padding) // mem_section_grid_size)
-        row = (event.y - mem_section_y_offset - padding) // ((mem_section_height - 2 * padding) // mem_section_grid_size)
-        box_index = row * mem_section_grid_size + col
-
-        if 0 <= box_index < mem_section_num_boxes:  # Ensure box_index is within bounds
-            # Calculate the memory range for the current box in the zoomed range
-            memory_range_start = current_memory_start + box_index * mem_section_addresses_per_box
-            memory_range_end = memory_range_start + mem_section_addresses_per_box - 1
-
-            read_count = mem_read_counts[box_index]
-            write_count = mem_write_counts[box_index]
-            info_text = (f"Memory Range: {hex(memory_range_start)} - {hex(memory_range_end)}\n"
-            f"Reads: {read_count}, Writes: {write_count}")
-            main_canvas.delete("hover_rom_text")
-            main_canvas.create_text(event.x, event.y, text=info_text, anchor="nw", tags="hover_rom_text", fill="black")
+    global hovered_box
+    rom_box = rom_geometry.box_at(event.x, event.y)
+    mem_box = mem_geometry.box_at(event.x, event.y)
+    if rom_box is not None:
+        box = ("rom", rom_box)
+    elif mem_box is not None:
+        box = ("mem", mem_box)
+    else:
+        box = None
+
+    # Motion events within the same box leave the tooltip where it is
+    if box == hovered_box:
+        return
+    hovered_box = box
+    if box is None:
+        main_canvas.itemconfig(hover_text, state="hidden")
+        return
+
+    if rom_box is not None:
+        # ROM Section Hover
+        memory_range_start = rom_window.start + rom_box * rom_window.box_size
+        memory_range_end = memory_range_start + rom_window.box_size - 1
+        access_count = rom_section_access_counts[rom_box]
+        info_text = (f"ROM Code Range: {hex(memory_range_start)} - {hex(memory_range_end)}\n"
+                     f"Access Count: {access_count}")
+        if trace_store is not None:
+            # The store knows the instruction at every PC that was traced
+            instructions = trace_store.instructions_in(memory_range_start, memory_range_end + 1)
+            for pc, instruction in instructions[:hover_instructions]:
+                info_text += f"\n{pc:06X}: {instruction}"
+            if len(instructions) > hover_instructions:
+                info_text += f"\n... {len(instructions) - hover_instructions} more"
+    else:
+        # Memory Section Hover, the range of the box in the zoomed range
+        memory_range_start = current_memory_start + mem_box * mem_section_box_size
+        memory_range_end = memory_range_start + mem_section_box_size - 1
+        read_count = mem_read_counts[mem_box]
+        write_count = mem_write_counts[mem_box]
+        info_text = (f"Memory Range: {hex(memory_range_start)} - {hex(memory_range_end)}\n"
+                     f"Reads: {read_count}, Writes: {write_count}")
+    main_canvas.coords(hover_text, event.x, event.y)
+    main_canvas.itemconfig(hover_text, text=info_text, state="normal")
+    main_canvas.tag_raise(hover_text)  # Above the grids and connection lines
 
 
 # Clear hover information when the mouse leaves the canvas
 def on_rom_leave(event):
-    main_canvas.delete("hover_rom_text")
+    global hovered_box
+    hovered_box = None
+    main_canvas.itemconfig(hover_text, state="hidden")
 
 main_canvas.bind("<Motion>", on_rom_hover)
 main_canvas.bind("<Leave>", on_rom_leave)
 
 # Monitor the memory access log file for changes with roll-over detection
 log_file_path = "../../mame/memory_access.log"
-last_read_position = 0
 update_interval = 100  # Configurable update interval in milliseconds
 
+# Parsed instructions of recently shown frames, so scrubbing doesn't re-read and re-parse them. They come from the
+# streaming trace (instructions/trace-NNNNN.log) if there is one, from the instructions/{frame}.log files otherwise
+instructions_dir = "../../mame/instructions"
+instruction_cache = InstructionCache(instructions_dir, max_bytes=256 * 1024 * 1024,
+                                     trace=InstructionTrace(instructions_dir))
+
+# Frame screenshots are shown scaled to fit the memory grid's width, keeping the 384x224 aspect ratio
+def screenshot_size():
+    original_width, original_height = 384, 224
+    aspect_ratio = original_width / original_height
+
+    target_width = mem_section_width
+    target_height = int(target_width / aspect_ratio)
+
+    if target_height > mem_section_height:
+        target_height = mem_section_height
+        target_width = int(target_height * aspect_ratio)
+    return target_width, target_height
+
+# Resized screenshots of recently shown frames. Set screenshot_atlas to also keep the sharp ones on disk in
+# snap/frames/thumbnails.atlas (about 450 KB per frame), so reopening a trace doesn't resize them again
+screenshots_dir = "../../mame/snap/frames"
+screenshot_atlas = False
+screenshot_cache = ScreenshotCache(
+    screenshots_dir, screenshot_size(), max_bytes=128 * 1024 * 1024,
+    atlas_path=os.path.join(screenshots_dir, "thumbnails.atlas") if screenshot_atlas else None)
+screenshot_settle_delay = 150  # How long the slider has to rest on a frame before it gets the sharp screenshot, in ms
+
 # Cache colors for reuse
 gradient_cache = {}
 
 # Frame-by-frame mode implementation
 # Track frame-specific memory access data and add a toggle button and slider
 
-# Frame data to track specific frame memory accesses
-frame_data = {}  # Dictionary to store read/write counts per frame for frame-by-frame mode
-
-# Frame data to track specific memory accesses by specific pieces of the code
-rom_access_data = {}  # Dictionary to store memory accesses per Program Counter execeution for frame-by-frame mode
+# Frame data to track specific frame memory accesses, and the connections from code to memory first seen in each frame
+frame_store = FrameStore(mem_section_num_boxes, num_rom_boxes=rom_section_num_boxes)
 
 
 # Frame-by-frame mode state
@@ -627,6 +558,12 @@ max_frame = 0
 frame_slider = tk.Scale(root, from_=0, to=0, orient="horizontal", label="Frame", command=lambda val: show_frame(int(val)))
 frame_slider.pack_forget()  # Hide initially
 
+# Show only the accesses made during the selected frame instead of everything up to it
+show_per_frame_counts = tk.BooleanVar(root, value=False)
+per_frame_counts_checkbox = tk.Checkbutton(
+    root, text="Per-frame counts", variable=show_per_frame_counts, command=lambda: show_frame(frame_slider.get()))
+per_frame_counts_checkbox.pack_forget()  # Hide initially
+
 continue_monitoring = True
 
 # Button to toggle frame-by-frame mode
@@ -637,136 +574,180 @@ def toggle_frame_by_frame_mode():
     if frame_by_frame_mode:
         # Stop monitoring the file and show the slider
         frame_slider.pack()
+        per_frame_counts_checkbox.pack()
         frame_slider.config(to=max_frame)
         continue_monitoring = False  # Stop continuous monitoring
+        ingest_worker.pause()
         print("Stopping and moving to Frame-By-Frame mode")
     else:
         # Hide the slider and resume normal mode
         frame_slider.pack_forget()
+        per_frame_counts_checkbox.pack_forget()
         continue_monitoring = True  # Resume continuous monitoring
+        ingest_worker.resume()
         print("Resuming reading memory activity...")
 
 frame_by_frame_button = tk.Button(root, text="Frame by Frame Mode", command=toggle_frame_by_frame_mode)
 frame_by_frame_button.pack()
 
 def remove_connections():
-    main_canvas.delete("connection")
+    connection_layer.clear()
 
 remove_connections_button = tk.Button(root, text="Kill connections", command=remove_connections)
 remove_connections_button.pack()
 
-# Global flag to indicate if show_frame is already running
+# Global flag to indicate if render_frame is already running
 frame_rendering_in_progress = False
+frame_poll_timer = None
+frame_poll_interval = 15  # How often to check for the wanted frame while it loads, in milliseconds
+
+# Load everything shown for a frame, runs on a frame_loader thread
+def load_frame(frame):
+    errors = []
 
-def dump_debug_instructions(frame, prev_instructions, curr_instructions):
-    """Dump current and previous instructions to debug files."""
+    # The screenshot of the frame, quickly resized unless a sharp one is cached already
+    image = None
+    sharp_image = False
     try:
-        # Write current instructions to a debug file
-        current_debug_path = f"slide-debug-{frame:05d}-current.txt"
-        with open(current_debug_path, "w") as curr_debug_file:
-            curr_debug_file.write("\n".join(f"{instr}" for line_number, instr in curr_instructions))
-        print(f"Current instructions dumped to {current_debug_path}")
-
-        # Write previous instructions to a debug file
-        previous_debug_path = f"slide-debug-{frame:05d}-previous.txt"
-        with open(previous_debug_path, "w") as prev_debug_file:
-            prev_debug_file.write("\n".join(f"{instr}" for line_number, instr in prev_instructions))
-        print(f"Previous instructions dumped to {previous_debug_path}")
+        image, sharp_image = screenshot_cache.get(frame)
+    except FileNotFoundError:
+        errors.append(f"Frame image not found: {screenshot_cache.path(frame)}")
     except Exception as e:
-        print(f"Error dumping debug instructions for frame {frame}: {e}")
-
-# Function to show a specific frame with a debounce mechanism
-def show_frame(frame):
-    global mem_read_counts, mem_write_counts, frame_rendering_in_progress
-
-    if frame_rendering_in_progress:
-        print(f"Skipping frame {frame}, rendering is already in progress.")
-        return  # Skip if already rendering
-
-    # Set flag to indicate rendering is in progress
-    frame_rendering_in_progress = True
-
-    start_time = time.time()  # Start timing the function
-    if frame in frame_data:
-        mem_read_counts, mem_write_counts = frame_data[frame]
-        update_memory_grid()
-        draw_rom_to_mem_connections(rom_access_data[frame])
+        errors.append(f"Error displaying frame image: {e}")
 
-    # Load and display the PNG for the current frame
+    # The current and previous frame's instructions, parsed (only the first time they are loaded) by the cache
+    instructions = previous_instructions = instruction_diff = None
     try:
-        frame_image_path = f"../../mame/snap/frames/{frame:05d}.png"
-        img = Image.open(frame_image_path)
-
-        # Calculate the new size while maintaining the aspect ratio
-        original_width, original_height = 384, 224
-        aspect_ratio = original_width / original_height
-
-        target_width = mem_section_width
-        target_height = int(target_width / aspect_ratio)
-
-        if target_height > mem_section_height:
-            target_height = mem_section_height
-            target_width = int(target_height * aspect_ratio)
-
-        img = img.resize((target_width, target_height), Image.Resampling.LANCZOS)
-
+        instructions = instruction_cache.get(frame)
+        try:
+            previous_instructions = instruction_cache.get(frame - 1)
+        except FileNotFoundError:
+            pass  # If no previous frame exists, assume it's the first frame
+        instruction_diff = diff_frames(previous_instructions, instructions)
+    except FileNotFoundError as e:
+        errors.append(f"Error loading instructions for frame {frame}: {e}")
+    except Exception as e:
+        errors.append(f"Error processing diff: {e}")
+
+    cumulative = per_frame = rom_cumulative = rom_per_frame = connections = None
+    if frame in frame_store:
+        cumulative = frame_store.cumulative(frame)
+        per_frame = frame_store.per_frame(frame)
+        rom_cumulative = frame_store.rom_cumulative(frame)
+        rom_per_frame = frame_store.rom_per_frame(frame)
+        connections = frame_store.connections(frame)
+    return LoadedFrame(frame, image, sharp_image, instructions, previous_instructions, instruction_diff, cumulative,
+                       per_frame, rom_cumulative, rom_per_frame, connections, errors)
+
+# Frames are loaded on a thread pool, prefetching ahead of the slider in the direction it moves
+frame_loader = FrameLoader(load_frame, max_workers=4, prefetch=8)
+
+# Show a specific frame as soon as it is loaded. Asking for another frame before that replaces it, so while the
+# slider is dragged the frames in between are skipped but the one it stops on is always shown
+def show_frame(frame):
+    frame_loader.request(frame, first_frame, max_frame)
+    poll_frame_loader()
+
+def poll_frame_loader():
+    global frame_poll_timer
+    frame_poll_timer = None
+    # render_frame updates the canvas, which can get here again from a slider event, let it finish first
+    if not frame_rendering_in_progress:
+        loaded = frame_loader.ready()
+        if loaded is not None:
+            render_frame(loaded)
+    if frame_loader.pending() and frame_poll_timer is None:
+        frame_poll_timer = root.after(frame_poll_interval, poll_frame_loader)
+
+# The frame screenshot's Tk image, reused so showing another screenshot is a single blit
+frame_photo = None
+
+def show_screenshot(image):
+    global frame_photo
+    if frame_photo is None or (frame_photo.width(), frame_photo.height()) != image.size:
         # Convert to a Tkinter-compatible image
-        img_tk = ImageTk.PhotoImage(img)
+        frame_photo = ImageTk.PhotoImage(image)
 
         # Update the image label
-        frame_image_label.config(image=img_tk)
-        frame_image_label.image = img_tk  # Keep a reference to avoid garbage collection
-    except FileNotFoundError:
-        print(f"Frame image not found: {frame_image_path}")
+        frame_image_label.config(image=frame_photo)
+        frame_image_label.image = frame_photo  # Keep a reference to avoid garbage collection
+    else:
+        frame_photo.paste(image)
+
+# Replace the quick screenshot of a frame with the LANCZOS one if the slider hasn't moved on
+def sharpen_screenshot(frame, future=None):
+    if frame_loader.wanted != frame or frame_loader.pending():
+        return
+    if future is None:
+        future = frame_loader.submit(screenshot_cache.get, frame, True)
+    if not future.done():
+        root.after(frame_poll_interval, sharpen_screenshot, frame, future)
+        return
+    try:
+        image, _ = future.result()
     except Exception as e:
         print(f"Error displaying frame image: {e}")
+        return
+    show_screenshot(image)
 
+# Put a loaded frame on screen
+def render_frame(loaded):
+    global mem_read_counts, mem_write_counts, rom_section_access_counts, frame_rendering_in_progress, shown_log
+    global shown_instructions
 
-    # Load and display the instructions for the current frame
-    try:
-        instructions_file_path = f"../../mame/instructions/{frame}.log"
-        with open(instructions_file_path, "r") as instructions_file:
-            instructions = instructions_file.read()
-
-        # Update the text widget with the instructions
-        frame_instructions_text.delete("1.0", tk.END)  # Clear previous contents
-        frame_instructions_text.insert(tk.END, instructions)  # Insert new instructions
-    except FileNotFoundError:
-        print(f"Instructions file not found: {instructions_file_path}")
-        frame_instructions_text.delete("1.0", tk.END)
-        frame_instructions_text.insert(tk.END, "No instructions available for this frame.")
-    except Exception as e:
-        print(f"Error loading instructions: {e}")
+    # Set flag to indicate rendering is in progress
+    frame_rendering_in_progress = True
 
-        # Load and preprocess the current and previous frame's instructions
-    try:
-        # Load and preprocess the current and previous frame's instructions
-        current_frame_path = f"../../mame/instructions/{frame}.log"
-        with open(current_frame_path, "r") as curr_file:
-            current_instructions = curr_file.readlines()
-            current_registers = extract_registers(current_instructions)
-
-        previous_frame_path = f"../../mame/instructions/{frame - 1}.log"
-        previous_instructions = []
-        previous_registers = {}
+    start_time = time.time()  # Start timing the function
+    frame = loaded.frame
+    for error in loaded.errors:
+        print(error)
+
+    if loaded.cumulative is not None:
+        # The store's counts are binned for the full memory range, re-binned into new arrays for the range shown.
+        # Copies of the ROM counts, live mode adds to these and the loaded frame may be shown again
+        mem_counts = loaded.per_frame if show_per_frame_counts.get() else loaded.cumulative
+        mem_read_counts, mem_write_counts = (
+            ingest.rebin_boxes(counts, ingest_worker.store_window, current_mem_window()) for counts in mem_counts)
+        if show_per_frame_counts.get():
+            rom_section_access_counts = loaded.rom_per_frame.copy()
+        else:
+            rom_section_access_counts = loaded.rom_cumulative.copy()
+        update_memory_grid()
+        draw_rom_counts()
+        draw_rom_to_mem_connections(loaded.connections)
+
+    # Display the PNG for the current frame, sharpened once the slider stays on it
+    if loaded.image is not None:
+        show_screenshot(loaded.image)
+        if not loaded.sharp_image:
+            root.after(screenshot_settle_delay, sharpen_screenshot, frame)
+
+    # Display the instructions for the current frame, only the lines in view are read from the log
+    if shown_log is not None:
+        shown_log.close()
+    shown_log = None
+    shown_instructions = loaded.instructions
+    if loaded.instructions is not None:
         try:
-            with open(previous_frame_path, "r") as prev_file:
-                previous_instructions = prev_file.readlines()
-                previous_registers = extract_registers(previous_instructions)
-        except FileNotFoundError:
-            pass  # If no previous frame exists, assume it's the first frame
-
-        # Dump debug files for the current and previous instructions
-        # dump_debug_instructions(frame, previous_instructions, current_instructions)
+            shown_log = LineIndex(loaded.instructions.parts, loaded.instructions.line_starts,
+                                  loaded.instructions.file_size)
+        except OSError as e:
+            print(f"Error loading instructions: {e}")
+    if shown_log is not None:
+        frame_instructions_view.show(len(shown_log), shown_log.lines)
+    else:
+        frame_instructions_view.show_lines(["No instructions available for this frame."])
 
-        # Perform the diff to get new instructions
-        new_instructions = diff_instructions(
-            preprocess_instructions(previous_instructions),
-            preprocess_instructions(current_instructions),
-        )
+    if loaded.instruction_diff is None:
+        frame_diff_view.show_lines(["Instructions not found for the current frame."])
+    else:
+        current = loaded.instructions
+        # If no previous frame exists, assume it's the first frame
+        previous_registers = loaded.previous_instructions.registers if loaded.previous_instructions else {}
 
         # Perform the diff to get changed registers
-        changed_registers = diff_registers(previous_registers, current_registers)
+        changed_registers = diff_registers(previous_registers, current.registers)
 
         # Update the registers Label widget
         if changed_registers:
@@ -779,123 +760,94 @@ def show_frame(frame):
 
         #registers_label.config(text=f"Changed Registers:\n{registers_output}")
 
-        # Update the diff Text widget
-        frame_diff_text.delete("1.0", tk.END)  # Clear previous contents
-        if new_instructions:
-            diff_output = "\n".join(f"Line {line_number}: {instr}" for line_number, instr in new_instructions)
-            frame_diff_text.insert(tk.END, diff_output)
-        else:
-            frame_diff_text.insert(tk.END, "No new instructions in this frame.")
-        
-        # Extract PC values and update the ROM grid
-        pc_values = extract_pc_values(current_instructions)
-        update_rom_grid(pc_values)
+        # Update the diff Text widget, it only ever holds the page in view
+        frame_diff_view.show(*diff_view_lines(loaded.instruction_diff))
+
+    # Frames still being traced or ingested are loaded again the next time they are shown
+    if loaded.image is None or loaded.instructions is None or loaded.cumulative is None:
+        frame_loader.discard(frame)
 
-    except FileNotFoundError as e:
-        print(f"Error loading instructions for frame {frame}: {e}")
-        frame_diff_text.delete("1.0", tk.END)
-        frame_diff_text.insert(tk.END, "Instructions not found for the current frame.")
-    except Exception as e:
-        print(f"Error processing diff: {e}")
-        frame_diff_text.delete("1.0", tk.END)
-        frame_diff_text.insert(tk.END, "Error processing instructions diff.")
     # Clear the flag after rendering is done
     frame_rendering_in_progress = False
 
     end_time = time.time()  # End timing the function
-    print(f"Execution time for show_frame({frame}): {end_time - start_time:.4f} seconds")
+    print(f"Execution time for render_frame({frame}): {end_time - start_time:.4f} seconds")
+
+
+# Parsing and counting happens on a background thread, the Tk thread only applies finished updates
+if trace_store is not None:
+    log_reader = StoreReader(trace_store)
+    frame_index = None  # The store has every frame indexed already
+else:
+    log_reader = LogStream(log_file_path)  # memory_access.log.backup followed by memory_access.log
+    frame_index = FrameIndex(log_file_path, frame_store)  # Saved next to the log as memory_access.log.idx
+ingest_worker = ingest.IngestWorker(
+    log_reader, current_mem_window(), rom_window, frame_store, frame_index, histogram=access_histogram)
+first_frame = None
+
+# Pick up where the previous session left off if the log has a frame index
+def load_frame_index():
+    global mem_read_counts, mem_write_counts, rom_section_access_counts, first_frame, max_frame
+    if frame_index is None:
+        return
+    saved_rom_counts = ingest_worker.restore_index()
+    if saved_rom_counts is None or not len(frame_store):
+        return
+    frames = frame_store.frames()
+    first_frame, max_frame = int(frames[0]), int(frames[-1])
+    frame_slider.config(from_=first_frame, to=max_frame)
+    # Everything read so far, with the frame that was still being read, which isn't in frame_store yet
+    mem_read_counts, mem_write_counts = access_histogram.rebin(current_mem_window())
+    rom_section_access_counts = saved_rom_counts
+    update_memory_grid()
+    draw_rom_counts()
+    update_frame_progress(max_frame)
 
+# Let the ingest thread save the frame index before the window goes away
+def on_close():
+    frame_loader.shutdown()
+    ingest_worker.stop()
+    ingest_worker.join(timeout=10)
+    root.destroy()
 
-# Function to monitor the log file for memory accesses and update frame information
-# noinspection PyTypeChecker
-def monitor_log(pc_values=None):
-    global mem_read_counts, mem_write_counts, last_read_position, current_frame, current_frame_operations, max_frame, continue_monitoring
+root.protocol("WM_DELETE_WINDOW", on_close)
 
-    pc_values = []
-    global_access_data = []  # (PC, Access Type, Memory Address)
-    this_frame_data_set = set()  # (PC, Access Type, Memory Address)
-    prev_frame_data_set = set()
-    new_frame = None
-    if continue_monitoring:
-        if os.path.exists(log_file_path):
-            file_size = os.path.getsize(log_file_path)
-
-            # Handle file rollover by checking if the current read position exceeds the file size
-            if last_read_position > file_size:
-                print("Log rollover detected, resetting read position.")
-                last_read_position = 0
-
-            with open(log_file_path, "r") as log_file:
-                log_file.seek(last_read_position)  # Start from where we left off
-                for line in log_file:
-                    line = line.strip()
-                    if line:
-                        parts = line.split(',')
-
-                        # Only parse lines with exactly 6 parts
-                        if len(parts) == 7:
-                            try:
-                                # Extract frame, access type, address, and value
-                                new_frame = int(parts[0])  # Frame number is always present
-                                access_type = parts[1]
-                                address_hex = parts[2]
-                                value_hex = parts[3]
-                                size = parts[4]
-
-                                # Add the PC counter addresses to the list that were accessed during this read cycle
-                                pc_values.append(parts[5])
-                                this_frames_access_data = (parts[5], access_type, address_hex)
-                                global_access_data.append(this_frames_access_data)
-                                this_frame_data_set.add(this_frames_access_data)
-
-                                if current_frame == 0:
-                                    frame_slider.config(from_=new_frame)
-                                # Track frame-specific data for frame-by-frame mode
-                                if new_frame != current_frame:
-                                    # Store the current frame data before switching to the new frame
-                                    frame_data[current_frame] = (mem_read_counts[:], mem_write_counts[:])
-                                    rom_access_data[current_frame] = list(this_frame_data_set-prev_frame_data_set)
-                                    current_frame = new_frame
-                                    max_frame = max(max_frame, new_frame)
-                                    frame_slider.config(to=max_frame)
-                                    prev_frame_data_set = this_frame_data_set
-                                    this_frame_data_set = set() # Reset the frame data so it only has this frames access data for frame by frame mode
-
-                                if not continue_monitoring:
-                                    # Reset read and write counts for the new frame
-                                    mem_read_counts = [0] * mem_section_num_boxes
-                                    mem_write_counts = [0] * mem_section_num_boxes
-
-
-                                # Process the memory access event
-                                address = int(address_hex, 16)
-                                value = int(value_hex, 16)
-                                box_index = (address - current_memory_start) // mem_section_box_size
-
-                                if 0 <= box_index < mem_section_num_boxes:
-                                    if access_type == 'R':
-                                        mem_read_counts[box_index] += 1
-                                    elif access_type == 'W':
-                                        mem_write_counts[box_index] += 1
-
-                            except ValueError as e:
-                                print(f"Error processing line '{line}': {e}")
-
-                last_read_position = log_file.tell()  # Update the position for the next read
-                print("Visualization is up to date with the end of the file.")
-
-        # Update colors for the continuous mode
-        update_memory_grid()
-        if new_frame:
-            update_frame_progress(new_frame)
+# Function to apply the memory accesses read by the ingest thread and update frame information
+def monitor_log():
+    global mem_read_counts, mem_write_counts, max_frame, first_frame, rom_section_access_counts
 
-        # Call update_rom_grid only if pcounter is not empty
-        if pc_values:
-            update_rom_grid(pc_values) # Update the rom grid with the latest Program Counter values
-            draw_rom_to_mem_connections(global_access_data) # Draw the latest connections from ROM to RAM
-        # Schedule the next log check
-    root.after(update_interval, lambda: monitor_log())
+    if continue_monitoring:
+        update, rebinned_counts = ingest_worker.poll_rebinned(current_mem_window())
+        if update is not None:
+            if first_frame is None:
+                first_frame = update.first_frame
+                frame_slider.config(from_=first_frame)
+            max_frame = max(max_frame, update.last_frame)
+            frame_slider.config(to=max_frame)
+
+            if rebinned_counts is None:
+                mem_read_counts += update.read_counts
+                mem_write_counts += update.write_counts
+                changed_boxes = update.boxes
+            else:
+                # Binned for a window we have since zoomed away from, recounted from the address histogram instead
+                mem_read_counts, mem_write_counts = rebinned_counts
+                changed_boxes = None
+
+            # Update colors for the continuous mode, only the boxes that were accessed
+            update_memory_grid(changed_boxes)
+            update_frame_progress(update.last_frame)
+
+            # Update the rom grid with the latest Program Counter values, and draw the latest connections from ROM to RAM
+            if len(update.connections):
+                rom_section_access_counts += update.pc_counts
+                draw_rom_counts()
+                draw_rom_to_mem_connections(update.connections)
+    # Schedule the next check for finished updates
+    root.after(update_interval, monitor_log)
 
 # Run the Tkinter main loop
+load_frame_index()
+ingest_worker.start()
 monitor_log()
 root.mainloop()
\ No newline at end of file